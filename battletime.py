@@ -0,0 +1,87 @@
+"""
+Parsing rapide des BattleTime de l'API Brawl Stars et filtres de fenetre temporelle.
+
+Le format de l'API est fixe ('20240101T120000.000Z') : on le decoupe directement
+au lieu de passer par dateutil (qui etait le 1er poste de cout de !main).
+Les autres formats (anciennes lignes, saisies a la main) passent par strptime
+puis dateutil en dernier recours.
+Filtres vectorises via NumPy si disponible (optionnel, comme pour le module ML),
+importe au 1er usage seulement (numpy_module) : l'import du bot reste leger.
+"""
+import calendar
+import datetime
+import importlib.util
+from functools import lru_cache
+
+NUMPY_AVAILABLE = importlib.util.find_spec('numpy') is not None
+
+BATTLE_TIME_FORMAT = '%Y%m%dT%H%M%S.%fZ'
+
+
+@lru_cache(maxsize=65536)   # les coequipiers partagent le meme BattleTime
+def parse_battle_time(s):
+    """BattleTime -> epoch UTC en secondes (float), ou None si illisible."""
+    s = str(s).strip()
+    if len(s) == 20 and s[8] == 'T' and s[15] == '.' and s[19] == 'Z':
+        try:
+            secs = calendar.timegm((int(s[0:4]), int(s[4:6]), int(s[6:8]),
+                                    int(s[9:11]), int(s[11:13]), int(s[13:15])))
+            return secs + int(s[16:19]) / 1000
+        except ValueError:
+            pass
+    if not s:
+        return None
+    for fmt in (BATTLE_TIME_FORMAT, '%Y%m%dT%H%M%SZ'):
+        try:
+            dt = datetime.datetime.strptime(s, fmt)
+            break
+        except ValueError:
+            continue
+    else:
+        try:
+            from dateutil.parser import parse
+            dt = parse(s)
+        except Exception:
+            return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=datetime.timezone.utc)
+    return dt.timestamp()
+
+
+def cutoff_epoch(days, now=None):
+    """Epoch de la limite 'il y a `days` jours' (None = pas de limite)."""
+    if days is None:
+        return None
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    return (now - datetime.timedelta(days=days)).timestamp()
+
+
+@lru_cache(maxsize=None)
+def numpy_module():
+    """Module numpy, importe au 1er appel (None s'il est absent ou inutilisable)."""
+    if not NUMPY_AVAILABLE:
+        return None
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+def rows_after(epochs, cutoff, rows=None):
+    """
+    Indices (parmi `rows`, ou toutes les lignes) dont l'epoch est > cutoff.
+    `epochs` = array('d') ; une seule comparaison vectorisee si NumPy est la.
+    """
+    if not len(epochs) or (rows is not None and not len(rows)):
+        return []
+    np = numpy_module()
+    if np is not None:
+        col = np.frombuffer(epochs, dtype=np.float64)
+        if rows is None:
+            return np.flatnonzero(col > cutoff).tolist()
+        idx = np.frombuffer(rows, dtype=np.intc) if not isinstance(rows, (list, tuple)) else np.asarray(rows, dtype=np.intp)
+        return idx[col[idx] > cutoff].tolist()
+    if rows is None:
+        rows = range(len(epochs))
+    return [i for i in rows if epochs[i] > cutoff]
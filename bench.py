@@ -0,0 +1,458 @@
+"""
+Banc d'essai hors ligne : mesure comment passent a l'echelle le scraping
+(run_ingest + SheetsMatchRepository.append), get_team_matches, train_model et
+la retention (prune), sur des feuilles Matches synthetiques de 1k a 1M lignes.
+
+Aucun appel reseau :
+  - FakeWorksheet remplace gspread (feuille en memoire, appels comptes par methode),
+  - FakeBrawlStarsApi remplace fetch_battlelogs (battlelogs generes, appels comptes).
+    La couche HTTP (aiohttp, token bucket) n'est pas mesuree : a 10 req/s le
+    bucket dominerait tout le reste.
+Chaque (operation, taille) tourne dans un process a part : le pic RSS mesure est
+le sien (la generation de la feuille est incluse dans rss_setup_kb, pas dans wall_s).
+
+Usage :
+    python bench.py                                   # 1k, 10k, 100k, 1M lignes
+    python bench.py --sizes 1000 10000 --ops scrape prune
+    python bench.py --baseline ancien.json            # signale les regressions
+Resultats en JSON (BENCH_OUTPUT, defaut bench_results.json) : a comparer entre versions.
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import platform
+import tempfile
+import subprocess
+from collections import Counter, deque
+
+try:
+    import resource
+except ImportError:   # Windows : pas de pic RSS
+    resource = None
+
+# Ni reseau ni fichiers du bot : a regler AVANT d'importer les modules du bot
+os.environ.update(SNAPSHOT_PATH='', BS_CACHE_DIR='', DEDUPE_INDEX_PATH='', MATCH_BACKEND='sheets',
+                  SHEETS_READ_PER_MIN='1000000000', SHEETS_WRITE_PER_MIN='1000000000')
+
+SIZES = (1000, 10000, 100000, 1000000)
+OPERATIONS = ('scrape', 'team_matches', 'train_model', 'prune')
+BENCH_OUTPUT = os.getenv('BENCH_OUTPUT', 'bench_results.json')
+TOLERANCE = 0.25        # +25% de temps ou de memoire = regression
+MIN_WALL = 0.05         # s ; en dessous, l'ecart de temps est du bruit
+N_TRIOS = 24            # joueurs suivis = 3 * N_TRIOS
+HISTORY_DAYS = 60       # etendue de la feuille (retention par defaut : 40 jours)
+NEW_BATTLES = 10        # parties jouees par trio depuis le dernier scrape
+BATTLELOG_SIZE = 25
+
+BRAWLERS = ['SHELLY', 'COLT', 'BULL', 'BROCK', 'RICO', 'SPIKE', 'BARLEY', 'JESSIE', 'NITA', 'DYNAMIKE',
+            'EL PRIMO', 'MORTIS', 'CROW', 'POCO', 'BO', 'PIPER', 'PAM', 'TARA', 'DARRYL', 'PENNY',
+            'FRANK', 'GENE', 'TICK', 'LEON', 'ROSA', 'CARL', 'BIBI', '8-BIT', 'SANDY', 'BEA',
+            'EMZ', 'MR. P', 'MAX', 'JACKY', 'GALE', 'NANI', 'SPROUT', 'SURGE', 'COLETTE', 'AMBER',
+            'LOU', 'BYRON', 'EDGAR', 'RUFFS', 'STU', 'BELLE', 'SQUEAK', 'GROM', 'BUZZ', 'GRIFF',
+            'ASH', 'MEG', 'LOLA', 'FANG', 'EVE', 'JANET', 'BONNIE', 'OTIS', 'SAM', 'GUS',
+            'BUSTER', 'CHESTER', 'GRAY', 'MANDY', 'R-T', 'WILLOW', 'MAISIE', 'HANK', 'CORDELIUS', 'DOUG',
+            'PEARL', 'CHUCK', 'CHARLIE', 'MICO', 'KIT', 'LARRY & LAWRIE', 'MELODIE', 'ANGELO', 'DRACO', 'LILY']
+MAPS = [('gemGrab', 'Hard Rock Mine'), ('gemGrab', 'Crystal Arcade'), ('gemGrab', 'Double Swoosh'),
+        ('brawlBall', 'Backyard Bowl'), ('brawlBall', 'Triple Dribble'), ('brawlBall', 'Pinball Dreams'),
+        ('heist', 'Safe Zone'), ('heist', 'Hot Potato'), ('bounty', 'Shooting Star'), ('bounty', 'Layer Cake'),
+        ('hotZone', 'Open Business'), ('hotZone', 'Ring of Fire'), ('knockout', "Belle's Rock"),
+        ('knockout', 'Flaring Phoenix'), ('knockout', 'Out in the Open')]
+# (type API, poids) ; 'ranked' = LADDER, ecarte par l'ingestion
+BATTLE_TYPES = [('soloRanked', 45), ('teamRanked', 15), ('ranked', 30), ('friendly', 10)]
+TAG_CHARS = '0289PYLQGRJCUV'
+
+
+class BenchSkipped(Exception):
+    """Operation impossible dans cet environnement (dependance optionnelle absente...)."""
+
+
+# ===========================================================================
+#  DONNEES SYNTHETIQUES
+# ===========================================================================
+def format_battle_time(epoch):
+    return time.strftime('%Y%m%dT%H%M%S.000Z', time.gmtime(epoch))
+
+
+class MatchGenerator:
+    """
+    Parties de trios fixes (joueurs suivis) contre des adversaires aleatoires.
+    Garde les BATTLELOG_SIZE dernieres parties de chaque trio pour servir les battlelogs.
+    """
+
+    def __init__(self, seed=0, trios=N_TRIOS):
+        self.rng = random.Random(seed)
+        tags = set()
+        while len(tags) < trios * 3:
+            tags.add(self._tag())
+        tags = sorted(tags)
+        self.trios = [tags[i:i + 3] for i in range(0, len(tags), 3)]
+        self.players = tags
+        # chaque joueur a sa petite piscine de brawlers (comme en vrai)
+        self.pools = {t: self.rng.sample(BRAWLERS, 12) for t in tags}
+        self.recent = [deque(maxlen=BATTLELOG_SIZE) for _ in self.trios]
+        self.clock = time.time() - HISTORY_DAYS * 86400
+
+    def _tag(self):
+        return '#' + ''.join(self.rng.choices(TAG_CHARS, k=8))
+
+    def _member(self, tag, brawler):
+        return {'tag': tag, 'name': tag[1:].lower(),
+                'brawler': {'id': 16000000 + BRAWLERS.index(brawler), 'name': brawler, 'power': 11, 'trophies': 750}}
+
+    def battle(self, trio_id, epoch):
+        """Une partie au format de l'API (items du battlelog), memorisee pour le trio."""
+        rng = self.rng
+        mode, emap = rng.choice(MAPS)
+        btype = rng.choices([t for t, _ in BATTLE_TYPES], [w for _, w in BATTLE_TYPES])[0]
+        ours, picked = [], set()
+        for tag in self.trios[trio_id]:
+            b = rng.choice([b for b in self.pools[tag] if b not in picked])
+            picked.add(b)
+            ours.append(self._member(tag, b))
+        theirs = [self._member(self._tag(), b) for b in rng.sample(BRAWLERS, 3)]
+        result = 'victory' if rng.random() < 0.52 else 'defeat'
+        bd = {'mode': mode, 'type': btype, 'result': result, 'duration': rng.randint(60, 180),
+              'teams': [ours, theirs] if rng.random() < 0.5 else [theirs, ours]}
+        if btype == 'ranked':
+            bd['trophyChange'] = 8 if result == 'victory' else -6
+        battle = {'battleTime': format_battle_time(epoch), 'event': {'id': 15000000, 'mode': mode, 'map': emap},
+                  'battle': bd}
+        self.recent[trio_id].append(battle)
+        return battle
+
+    def rows(self, n):
+        """n lignes Matches (non-ladder, ordre chronologique) sur HISTORY_DAYS jusqu'a il y a 1h."""
+        from ingest import row_stage, is_ladder_match
+        end = time.time() - 3600
+        expected = n / 3 / 0.6 + 1   # 3 lignes par partie, ~30% de ladder ecarte (marge : ne pas depasser `end`)
+        step = max((end - self.clock) / expected, 1.0)
+        out = []
+        while len(out) < n:
+            self.clock += step * self.rng.uniform(0.5, 1.5)
+            trio_id = self.rng.randrange(len(self.trios))
+            battle = self.battle(trio_id, int(self.clock))
+            for row in row_stage((tag, battle) for tag in self.trios[trio_id]):
+                if not is_ladder_match(dict(BattleType=row[7])):
+                    out.append(row)
+        return out[:n]
+
+    def play(self, per_trio=NEW_BATTLES):
+        """Parties jouees depuis la fin de la feuille (a recuperer par le scrape)."""
+        now = time.time()
+        step = (now - self.clock) / (per_trio * len(self.trios) + 1)
+        for _ in range(per_trio):
+            for trio_id in range(len(self.trios)):
+                self.clock += step
+                self.battle(trio_id, int(self.clock))
+
+    def battlelog(self, tag):
+        """Battlelog d'un joueur, plus recent en tete (comme l'API)."""
+        for trio_id, trio in enumerate(self.trios):
+            if tag in trio:
+                return list(reversed(self.recent[trio_id]))
+        return []
+
+
+# ===========================================================================
+#  FAUX BACKENDS
+# ===========================================================================
+_A1 = re.compile(r'([A-Z]+)(\d*)')
+
+
+def _a1(ref):
+    """'B12' -> (colonne 0-based, ligne 1-based ou None)."""
+    m = _A1.fullmatch(ref.strip().upper())
+    col = 0
+    for ch in m.group(1):
+        col = col * 26 + ord(ch) - 64
+    return col - 1, int(m.group(2)) if m.group(2) else None
+
+
+class FakeWorksheet:
+    """Onglet gspread en memoire : memes methodes que celles utilisees par le bot, appels comptes."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.calls = Counter()
+
+    @property
+    def row_count(self):
+        return len(self.rows)
+
+    def _read(self, range_name):
+        start, _, end = range_name.partition(':')
+        c1, r1 = _a1(start)
+        c2, r2 = _a1(end) if end else (c1, r1)
+        return [list(row[c1:c2 + 1]) for row in self.rows[(r1 or 1) - 1:r2 or len(self.rows)]]
+
+    def get_all_values(self):
+        self.calls['get_all_values'] += 1
+        return [list(row) for row in self.rows]
+
+    def get(self, range_name):
+        self.calls['get'] += 1
+        return self._read(range_name)
+
+    def batch_get(self, ranges):
+        self.calls['batch_get'] += 1
+        return [self._read(r) for r in ranges]
+
+    def row_values(self, index):
+        self.calls['row_values'] += 1
+        return list(self.rows[index - 1]) if index <= len(self.rows) else []
+
+    def append_rows(self, values, **kwargs):
+        self.calls['append_rows'] += 1
+        self.rows.extend(list(map(str, v)) for v in values)
+
+    def append_row(self, values, **kwargs):
+        self.calls['append_row'] += 1
+        self.rows.append(list(map(str, values)))
+
+    def insert_row(self, values, index=1):
+        self.calls['insert_row'] += 1
+        self.rows.insert(index - 1, list(map(str, values)))
+
+    def update(self, range_name=None, values=None, **kwargs):
+        self.calls['update'] += 1
+        col, row = _a1(range_name.partition(':')[0])
+        for i, vals in enumerate(values or []):
+            target = self.rows[row - 1 + i]
+            target.extend([''] * (col + len(vals) - len(target)))
+            target[col:col + len(vals)] = [str(v) for v in vals]
+
+    def delete_rows(self, start, end=None):
+        self.calls['delete_rows'] += 1
+        del self.rows[start - 1:end or start]
+
+    def clear(self):
+        self.calls['clear'] += 1
+        self.rows = []
+
+
+class FakeBrawlStarsApi:
+    """Remplace bs_api.fetch_battlelogs (meme signature, meme format de resultat)."""
+
+    def __init__(self, generator):
+        self.generator = generator
+        self.calls = Counter()
+
+    def fetch_battlelogs(self, players, token, **kwargs):
+        self.calls['fetch_battlelogs'] += 1
+        self.calls['battlelog'] += len(players)
+        return [(p, self.generator.battlelog(p), None) for p in players]
+
+
+# ===========================================================================
+#  OPERATIONS MESUREES
+# ===========================================================================
+# Chaque setup_* prepare l'etat (non mesure) et renvoie la fonction a chronometrer,
+# qui retourne un dict d'infos complementaires.
+class Bench:
+    def __init__(self, generator, worksheet, api, tmpdir):
+        self.gen = generator
+        self.ws = worksheet
+        self.api = api
+        self.tmpdir = tmpdir
+
+    def repository(self, loaded=False):
+        from ingest import is_ladder_match
+        from repository import SheetsMatchRepository
+        repo = SheetsMatchRepository(self.ws, is_ladder=is_ladder_match)
+        if loaded:
+            repo.stats()   # chargement de la copie memoire hors mesure
+        return repo
+
+    def bot(self, repo):
+        """bot1 branche sur `repo` (discord & co requis, comme pour lancer le bot)."""
+        try:
+            import bot1
+        except ImportError as e:
+            raise BenchSkipped(f"bot1 non importable: {e}")
+        bot1.match_repo = repo
+        return bot1
+
+
+def setup_scrape(b):
+    """Premier scrape : index de dedoublonnage construit depuis la feuille, marks amorces + ingestion."""
+    import ingest
+    from watermarks import Watermarks
+    from dedupe_index import dedupe_index
+    repo = b.repository()
+    marks = Watermarks(os.path.join(b.tmpdir, 'watermarks.json'))
+    b.gen.play()
+    ingest.fetch_battlelogs = b.api.fetch_battlelogs
+
+    def run():
+        dedupe_index.ensure_loaded(repo.keys)
+        if marks.missing(b.gen.players):
+            marks.seed(dedupe_index.latest_battle_times())
+        added, skipped, types = ingest.run_ingest(b.gen.players, 'bench', repo.append, marks=marks)
+        return {'added': added, 'skipped': skipped}
+    return run
+
+
+def setup_team_matches(b):
+    """get_team_matches + build_battles pour chaque (trio, map), comme !draft / !picks."""
+    bot1 = b.bot(b.repository(loaded=True))
+    queries = [(set(trio), emap) for trio in b.gen.trios[:8] for _, emap in MAPS]
+
+    def run():
+        battles = 0
+        for ids, emap in queries:
+            battles += len(bot1.build_battles(bot1.get_team_matches(ids, map_name=emap, days=bot1.DRAFT_DAYS)))
+        return {'queries': len(queries), 'battles': battles}
+    return run
+
+
+def setup_train_model(b):
+    """Fit du modele de draft sur toutes les parties d'un trio (toutes maps)."""
+    bot1 = b.bot(b.repository(loaded=True))
+    if not bot1.load_ml():
+        raise BenchSkipped("scikit-learn / scipy / numpy absents")
+    ids = set(b.gen.trios[0])
+    samples = bot1.battles_to_samples(bot1.build_battles(bot1.get_team_matches(ids, days=bot1.DRAFT_DAYS)))
+
+    def run():
+        model_info = bot1.train_model(samples)
+        return {'samples': len(samples), 'features': len(model_info[1]) if model_info else 0}
+    return run
+
+
+def setup_prune(b):
+    """Retention (comme prune_old_matches) : sondages BattleTime + 1 suppression + purge memoire."""
+    from retention import RETENTION_DAYS
+    repo = b.repository(loaded=True)
+
+    def run():
+        return {'deleted': repo.prune(RETENTION_DAYS)}
+    return run
+
+
+SETUPS = {'scrape': setup_scrape, 'team_matches': setup_team_matches,
+          'train_model': setup_train_model, 'prune': setup_prune}
+
+
+def _peak_rss_kb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == 'darwin' else peak   # octets sous macOS, Ko ailleurs
+
+
+def run_case(op, rows, seed=0):
+    """Mesure une operation sur une feuille de `rows` lignes (dans le process courant)."""
+    from match_store import MATCHES_HEADER
+    result = {'op': op, 'rows': rows}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        gen = MatchGenerator(seed)
+        ws = FakeWorksheet([list(MATCHES_HEADER)] + gen.rows(rows))
+        api = FakeBrawlStarsApi(gen)
+        try:
+            run = SETUPS[op](Bench(gen, ws, api, tmpdir))
+        except BenchSkipped as e:
+            result['skipped'] = str(e)
+            return result
+        ws.calls.clear()
+        api.calls.clear()
+        result['rss_setup_kb'] = _peak_rss_kb()
+        start = time.perf_counter()
+        info = run()
+        result['wall_s'] = round(time.perf_counter() - start, 6)
+        result['rss_peak_kb'] = _peak_rss_kb()
+        result['calls'] = dict({f'sheets.{k}': v for k, v in ws.calls.items()},
+                               **{f'bs.{k}': v for k, v in api.calls.items()})
+        result['info'] = info
+    return result
+
+
+# ===========================================================================
+#  ORCHESTRATION / RAPPORT
+# ===========================================================================
+def _spawn(op, rows, seed):
+    """run_case dans un process neuf (pic RSS propre a l'operation)."""
+    proc = subprocess.run([sys.executable, os.path.abspath(__file__), '--case', op, str(rows), '--seed', str(seed)],
+                          capture_output=True, text=True)
+    lines = proc.stdout.strip().splitlines()
+    if proc.returncode or not lines:
+        return {'op': op, 'rows': rows, 'error': (proc.stderr.strip().splitlines() or ['?'])[-1]}
+    return json.loads(lines[-1])
+
+
+def _meta():
+    try:
+        rev = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        rev = ''
+    return {'revision': rev or None, 'python': platform.python_version(), 'platform': platform.platform(),
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())}
+
+
+def _format(r):
+    head = f"{r['op']:<13} {r['rows']:>8} lignes"
+    if 'skipped' in r or 'error' in r:
+        return f"{head}  -- {'ignore' if 'skipped' in r else 'ERREUR'}: {r.get('skipped') or r.get('error')}"
+    rss = f"{r['rss_peak_kb'] / 1024:8.1f} Mo" if r.get('rss_peak_kb') else '       ?'
+    calls = ' '.join(f"{k}={v}" for k, v in sorted(r['calls'].items()))
+    return f"{head}  {r['wall_s']:9.3f}s  pic {rss}  {calls}"
+
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """Lignes de comparaison avec un rapport precedent ; True si une regression depasse la tolerance."""
+    before = {(r['op'], r['rows']): r for r in baseline.get('results', []) if 'wall_s' in r}
+    regressed = False
+    for r in results:
+        old = before.get((r['op'], r['rows']))
+        if old is None or 'wall_s' not in r:
+            continue
+        ratios = {'temps': r['wall_s'] / max(old['wall_s'], 1e-9)}
+        if r.get('rss_peak_kb') and old.get('rss_peak_kb'):
+            ratios['memoire'] = r['rss_peak_kb'] / old['rss_peak_kb']
+        if r['wall_s'] < MIN_WALL:
+            ratios.pop('temps')
+        flags = [k for k, v in ratios.items() if v > 1 + tolerance]
+        regressed = regressed or bool(flags)
+        detail = '  '.join(f"{k} x{v:.2f}" for k, v in ratios.items())
+        print(f"{r['op']:<13} {r['rows']:>8} lignes  {detail}{'  <-- REGRESSION' if flags else ''}")
+    return regressed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Banc d'essai hors ligne (feuilles synthetiques, faux backends).")
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(SIZES))
+    parser.add_argument('--ops', nargs='+', choices=OPERATIONS, default=list(OPERATIONS))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=BENCH_OUTPUT)
+    parser.add_argument('--baseline', help="rapport JSON precedent a comparer")
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE)
+    parser.add_argument('--case', nargs=2, metavar=('OP', 'ROWS'), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING, format='%(levelname)s - %(message)s')
+    if args.case:
+        print(json.dumps(run_case(args.case[0], int(args.case[1]), args.seed)))
+        return 0
+
+    results = []
+    for rows in args.sizes:
+        for op in args.ops:
+            results.append(_spawn(op, rows, args.seed))
+            print(_format(results[-1]), flush=True)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump({'meta': _meta(), 'results': results}, f, indent=1)
+    print(f"Resultats ecrits dans {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            return 1 if compare(results, json.load(f), args.tolerance) else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
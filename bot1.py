@@ -1,639 +1,1131 @@
-import os
-import math
-import time
-import requests
-from dotenv import load_dotenv
-import discord
-from discord.ext import commands, tasks
-import gspread
-from google.oauth2 import service_account
-import datetime
-from datetime import timedelta
-from dateutil.parser import parse
-from collections import Counter, defaultdict
-import logging
-from keep_alive import keep_alive
-
-# --- ML (optionnel) : si scikit-learn manque, on retombe sur le winrate -----
-try:
-    from sklearn.linear_model import LogisticRegression
-    import numpy as np
-    SKLEARN_AVAILABLE = True
-except ImportError:
-    SKLEARN_AVAILABLE = False
-
-load_dotenv()
-
-# Set up logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
-
-DISCORD_TOKEN = os.getenv('D')
-SHEET_ID = os.getenv('G')
-BS_TOKEN = os.getenv('B')  # token Brawl Stars (pour la commande !inspect)
-CREDENTIALS_FILE = 'credentials.json'
-YOUR_CHANNEL_ID = 1403782456108388404
-
-BOT_PREFIX = '!'
-
-# Set up Google Sheets client
-scopes = ['https://www.googleapis.com/auth/spreadsheets', 'https://www.googleapis.com/auth/drive']
-creds = service_account.Credentials.from_service_account_file(CREDENTIALS_FILE, scopes=scopes)
-gs_client = gspread.authorize(creds)
-sheet = gs_client.open_by_key(SHEET_ID)
-players_worksheet = sheet.worksheet('Players')
-matches_worksheet = sheet.worksheet('Matches')  # PlayerTag, BattleTime, EventMode, EventMap, BrawlerName, Result, TrophyChange, BattleType
-
-intents = discord.Intents.default()
-intents.message_content = True
-bot = commands.Bot(command_prefix=BOT_PREFIX, intents=intents)
-
-
-# ===========================================================================
-#  HELPERS GENERAUX
-# ===========================================================================
-def normalize_tag(t):
-    """Uniformise un tag joueur en '#XXXX' majuscule (tolere espaces / # manquant)."""
-    return '#' + str(t).strip().lstrip('#').upper()
-
-
-# /!\ Dans l'API Brawl Stars, "ranked" = LADDER. Le mode "Ranked" = soloRanked/teamRanked.
-LADDER_BATTLE_TYPES = {'ranked'}
-
-def is_ladder_match(m):
-    """True si la partie est du LADDER (a exclure)."""
-    btype = str(m.get('BattleType', '')).strip().lower()
-    if btype:
-        return btype in LADDER_BATTLE_TYPES
-    raw = str(m.get('TrophyChange', '')).strip()
-    if not raw:
-        return False
-    try:
-        return int(float(raw)) != 0
-    except ValueError:
-        return False
-
-
-def wilson_lower_bound(wins, total, z=1.96):
-    """Borne basse de Wilson (95%) : winrate prudent qui penalise les petits echantillons."""
-    if total <= 0:
-        return 0.0
-    phat = wins / total
-    denom = 1 + z * z / total
-    centre = phat + z * z / (2 * total)
-    marge = z * math.sqrt((phat * (1 - phat) + z * z / (4 * total)) / total)
-    return max(0.0, (centre - marge) / denom)
-
-
-def get_team_matches(ids, map_name=None, days=30):
-    """Matchs (non-ladder) d'un trio, eventuellement sur une map. `ids` = set de tags normalises."""
-    matches = matches_worksheet.get_all_records()
-    cutoff = datetime.datetime.now(datetime.timezone.utc) - timedelta(days=days)
-    out = []
-    for m in matches:
-        if normalize_tag(m.get('PlayerTag', '')) not in ids:
-            continue
-        if is_ladder_match(m):
-            continue
-        if m.get('EventMode', '').lower() in ('solo showdown', 'duo showdown'):
-            continue
-        try:
-            if parse(m['BattleTime']) <= cutoff:
-                continue
-        except Exception:
-            continue
-        if map_name and m.get('EventMap', '').lower() != map_name.lower():
-            continue
-        out.append(m)
-    return out
-
-
-# ===========================================================================
-#  MODULE D'APPRENTISSAGE AUTOMATIQUE
-# ===========================================================================
-# Modele : regression logistique sur les comps reconstituees (multi-hot brawlers)
-#          -> P(victoire). Sert a noter la FORCE d'un brawler (bans) et a evaluer
-#          un PICK. Avec peu de donnees elle apprend surtout des forces regularisees,
-#          donc les picks sont blendes avec la synergie observee.
-MODEL_MIN_SAMPLES = 40   # nb de parties mini pour entrainer (sinon fallback winrate)
-MODEL_C = 0.3            # regularisation L2 (petit = plus fort, anti-overfit)
-W_MODEL = 0.6            # poids du modele dans le score de pick
-W_SYNERGY = 0.4          # poids de la synergie observee dans le score de pick
-
-def build_battles(team_matches):
-    """Regroupe les lignes par BattleTime -> {tag: (brawler, result)} (coequipiers = meme heure)."""
-    battles = defaultdict(dict)
-    for m in team_matches:
-        tag = normalize_tag(m.get('PlayerTag', ''))
-        b = m.get('BrawlerName', '').upper()
-        r = m.get('Result', '').lower()
-        if b and r in ('victory', 'defeat'):
-            battles[m['BattleTime']][tag] = (b, r)
-    return battles
-
-def battles_to_samples(battles):
-    """Chaque partie -> (set de brawlers de notre cote, 1=win/0=loss)."""
-    samples = []
-    for players in battles.values():
-        brawlers = {br for br, _ in players.values()}
-        res = next(iter(players.values()))[1]
-        if brawlers:
-            samples.append((brawlers, 1 if res == 'victory' else 0))
-    return samples
-
-def comp_winrate(battles, required):
-    """Winrate des parties ou tous les brawlers `required` etaient presents."""
-    req = {x.upper() for x in required}
-    g = w = 0
-    for players in battles.values():
-        comp = {br for br, _ in players.values()}
-        if req.issubset(comp):
-            g += 1
-            if next(iter(players.values()))[1] == 'victory':
-                w += 1
-    return w, g
-
-def train_model(samples, all_brawlers):
-    """Entraine la regression logistique. Retourne (model, idx) ou None si impossible."""
-    if not SKLEARN_AVAILABLE or len(samples) < MODEL_MIN_SAMPLES or not all_brawlers:
-        return None
-    y = [w for _, w in samples]
-    if len(set(y)) < 2:   # besoin de victoires ET defaites
-        return None
-    idx = {b: i for i, b in enumerate(all_brawlers)}
-    X = np.zeros((len(samples), len(idx)))
-    for r, (brawlers, _) in enumerate(samples):
-        for b in brawlers:
-            if b in idx:
-                X[r, idx[b]] = 1.0
-    try:
-        model = LogisticRegression(C=MODEL_C, max_iter=2000)
-        model.fit(X, np.array(y, dtype=float))
-    except Exception as e:
-        logging.error(f"train_model failed: {e}")
-        return None
-    return (model, idx)
-
-def model_winprob(model_info, comp):
-    """P(victoire) predite par le modele pour une comp (set de brawlers)."""
-    model, idx = model_info
-    x = np.zeros((1, len(idx)))
-    for b in comp:
-        if b in idx:
-            x[0, idx[b]] = 1.0
-    return float(model.predict_proba(x)[0][1])
-
-def suggest_bans(model_info, all_brawlers, taken, games, wins, n=5, min_games=3):
-    """Bans = brawlers les plus FORTS sur la map (a refuser a l'adversaire)."""
-    cands = [b for b in all_brawlers if b not in taken and games[b] >= min_games]
-    scored = []
-    for b in cands:
-        force = model_winprob(model_info, {b}) if model_info else wilson_lower_bound(wins[b], games[b])
-        scored.append((force, b, games[b]))
-    scored.sort(key=lambda t: t[0], reverse=True)
-    return scored[:n]
-
-def suggest_picks(model_info, battles, all_brawlers, allies, taken, games, wins, n=5, min_games=2):
-    """Picks = meilleurs completements de VOTRE comp (modele + synergie observee)."""
-    ally_set = {a.upper() for a in allies}
-    cands = [b for b in all_brawlers if b not in taken and games[b] >= min_games]
-    if len(cands) < n:
-        cands = [b for b in all_brawlers if b not in taken]
-    scored = []
-    for b in cands:
-        if ally_set:
-            syn_w, syn_g = comp_winrate(battles, ally_set | {b})
-        else:
-            syn_w, syn_g = wins[b], games[b]
-        syn_score = wilson_lower_bound(syn_w, syn_g)
-        if model_info:
-            score = W_MODEL * model_winprob(model_info, ally_set | {b}) + W_SYNERGY * syn_score
-        else:
-            score = syn_score
-        scored.append((score, b, syn_g))
-    scored.sort(key=lambda t: t[0], reverse=True)
-    return scored[:n]
-
-
-# ===========================================================================
-#  PARSING DRAFT
-# ===========================================================================
-def parse_draft_args(raw):
-    """Parse '<map> | ban: ... | enemy: ... | ally: ...' (FR/EN toleres)."""
-    map_name, bans, enemies, allies = None, [], [], []
-    for part in (p.strip() for p in raw.split('|')):
-        if not part:
-            continue
-        if ':' in part:
-            key, _, val = part.partition(':')
-            key = key.strip().lower()
-            vals = [v.strip().upper() for v in val.replace(',', ' ').split() if v.strip()]
-            if key in ('ban', 'bans', 'interdit', 'interdits'):
-                bans = vals
-            elif key in ('enemy', 'enemies', 'ennemi', 'ennemis', 'adv', 'adverse'):
-                enemies = vals
-            elif key in ('ally', 'allies', 'allie', 'team', 'equipe'):
-                allies = vals
-            elif key in ('map', 'carte') and not map_name:
-                map_name = val.strip()
-        elif map_name is None:
-            map_name = part
-    return map_name, bans, enemies, allies
-
-
-# ===========================================================================
-#  SCRAPING INTEGRE (remplace data.py) - utilise par la commande !update
-# ===========================================================================
-MATCHES_HEADER = ['PlayerTag', 'BattleTime', 'EventMode', 'EventMap',
-                  'BrawlerName', 'Result', 'TrophyChange', 'BattleType']
-
-def ensure_header():
-    """Garantit que la ligne 1 de Matches est bien l'en-tete (repare si manquant)."""
-    first = matches_worksheet.row_values(1)
-    if first[:1] != ['PlayerTag']:
-        # feuille vide OU ligne 1 = donnees -> on insere l'en-tete tout en haut
-        matches_worksheet.insert_row(MATCHES_HEADER, index=1)
-        logging.info("En-tete Matches (re)cree.")
-
-def _extract_brawler(p):
-    """
-    Nom du brawler d'un joueur, en gerant les structures variables de l'API.
-    Retourne None pour les modes type Duels (champ 'brawlers' au pluriel) ou
-    toute structure inattendue -> la partie sera ignoree (hors 3v3).
-    """
-    br = p.get('brawler')
-    if isinstance(br, dict) and br.get('name'):
-        return br['name'].upper()
-    return None
-
-def scrape_once():
-    """
-    Recupere les battlelogs via l'API BS et ecrit les nouvelles parties non-ladder.
-    Synchrone (a lancer dans un executor). Retourne (added, skipped_ladder, types).
-    """
-    ensure_header()
-    players = [r[0] for r in players_worksheet.get_all_values()[1:] if r and r[0].strip()]
-    existing = matches_worksheet.get_all_records()
-    existing_keys = {(m.get('PlayerTag'), m.get('BattleTime')) for m in existing}
-    headers = {'Authorization': f'Bearer {BS_TOKEN}'}
-
-    new_rows = []
-    skipped = 0
-    types = Counter()
-
-    for player in players:
-        tag = player.strip().lstrip('#').upper()
-        url = f'https://api.brawlstars.com/v1/players/%23{tag}/battlelog'
-        try:
-            resp = requests.get(url, headers=headers, timeout=20)
-            resp.raise_for_status()
-            battles = resp.json().get('items', [])
-        except Exception as e:
-            logging.error(f"scrape: erreur HTTP pour {player}: {e}")
-            continue
-
-        for battle in battles:
-            try:
-                bt = battle.get('battleTime')
-                if (player, bt) in existing_keys:
-                    continue
-                event = battle.get('event', {})
-                emap = event.get('map')
-                if not emap:
-                    continue
-                bd = battle.get('battle', {})
-                btype = bd.get('type', '')
-                tch = bd.get('trophyChange', 0)
-                # filtre ladder (type "ranked" ou partie a trophees)
-                if btype.lower() in LADDER_BATTLE_TYPES or tch != 0:
-                    skipped += 1
-                    continue
-
-                brawler = None
-                if 'teams' in bd:
-                    for team in bd['teams']:
-                        for p in team:
-                            if p.get('tag') == player:
-                                brawler = _extract_brawler(p)
-                                break
-                        if brawler:
-                            break
-                elif 'players' in bd:
-                    for p in bd['players']:
-                        if p.get('tag') == player:
-                            brawler = _extract_brawler(p)
-                            break
-                if not brawler:
-                    continue  # mode hors 3v3 (Duels...) ou structure inattendue -> ignore
-
-                row = [player, bt, event.get('mode', ''), emap,
-                       brawler, bd.get('result', ''), str(tch), btype]
-                new_rows.append(row)
-                existing_keys.add((player, bt))
-                types[btype] += 1
-            except Exception as e:
-                logging.error(f"scrape: bataille ignoree pour {player}: {e}")
-                continue
-
-    # ecriture par lots (rapide, pas d'appel API ligne par ligne)
-    for i in range(0, len(new_rows), 500):
-        matches_worksheet.append_rows(new_rows[i:i + 500])
-        time.sleep(1)
-
-    return len(new_rows), skipped, dict(types)
-
-
-# --- Rafraichissement automatique -------------------------------------------
-AUTO_UPDATE_MINUTES = 15   # intervalle du scraping auto (baisse a 10 si grosses sessions)
-_scrape_in_progress = False
-
-async def do_scrape():
-    """Lance scrape_once en evitant les executions simultanees.
-       Retourne (added, skipped, types) ou None si un scrape est deja en cours."""
-    global _scrape_in_progress
-    if _scrape_in_progress:
-        return None
-    _scrape_in_progress = True
-    try:
-        return await bot.loop.run_in_executor(None, scrape_once)
-    finally:
-        _scrape_in_progress = False
-
-@tasks.loop(minutes=AUTO_UPDATE_MINUTES)
-async def auto_update():
-    result = await do_scrape()
-    if result is None:
-        return
-    added, skipped, types = result
-    logging.info(f"Auto-update: {added} ajoutees, {skipped} ladder ignorees, types={types}")
-
-@auto_update.before_loop
-async def before_auto_update():
-    await bot.wait_until_ready()
-
-
-# ===========================================================================
-#  EVENTS
-# ===========================================================================
-@bot.event
-async def on_ready():
-    logging.info(f'Logged in as {bot.user} (ID: {bot.user.id})')
-    logging.info(f'ML disponible: {SKLEARN_AVAILABLE}')
-    if not auto_update.is_running():
-        auto_update.start()
-        logging.info(f"Rafraichissement automatique active (toutes les {AUTO_UPDATE_MINUTES} min).")
-    channel = bot.get_channel(YOUR_CHANNEL_ID)
-    if channel:
-        await channel.send(
-            f"Bot online ! Maj auto toutes les {AUTO_UPDATE_MINUTES} min. "
-            f"Commandes : {BOT_PREFIX}compare, {BOT_PREFIX}main, {BOT_PREFIX}draft, "
-            f"{BOT_PREFIX}debug, {BOT_PREFIX}inspect, {BOT_PREFIX}update, {BOT_PREFIX}reset"
-        )
-
-@bot.event
-async def on_message(message):
-    if message.author == bot.user:
-        return
-    logging.info(f"Message: {message.content} from {message.author.name} in {message.channel.id}")
-    await bot.process_commands(message)
-
-@bot.event
-async def on_command_error(ctx, error):
-    logging.error(f"Command error: {error}")
-    await ctx.send(f"Error: {str(error)}")
-
-
-# ===========================================================================
-#  COMMANDE DEBUG
-# ===========================================================================
-@bot.command(name='debug')
-async def command_debug(ctx):
-    try:
-        matches = matches_worksheet.get_all_records()
-        total = len(matches)
-        if total == 0:
-            await ctx.send("La feuille Matches est vide.")
-            return
-        keys = list(matches[0].keys())
-        bt = Counter()
-        if 'BattleType' in keys:
-            for m in matches:
-                bt[str(m.get('BattleType', '')).strip().lower() or '(vide)'] += 1
-        nb_ladder = sum(1 for m in matches if is_ladder_match(m))
-        embed = discord.Embed(title="Debug - donnees Matches", color=discord.Color.orange())
-        embed.add_field(name="Lignes totales", value=str(total), inline=False)
-        embed.add_field(name="Colonnes", value=", ".join(keys), inline=False)
-        if bt:
-            embed.add_field(name="BattleType", value=" | ".join(f"{k}: {v}" for k, v in bt.most_common(8)), inline=False)
-        else:
-            embed.add_field(name="BattleType", value="ABSENTE (ajoute l'en-tete colonne H)", inline=False)
-        embed.add_field(name="Classees 'ladder' (exclues)", value=f"{nb_ladder} / {total}", inline=False)
-        embed.add_field(name="Module ML", value="actif" if SKLEARN_AVAILABLE else "inactif (scikit-learn absent)", inline=False)
-        await ctx.send(embed=embed)
-    except Exception as e:
-        logging.error(f"Error in debug: {e}")
-        await ctx.send("Une erreur s'est produite dans !debug.")
-
-
-# ===========================================================================
-#  COMMANDE INSPECT  ->  interroge l'API BS DEPUIS le serveur (bon token/IP)
-# ===========================================================================
-# Usage : !inspect            (teste le 1er joueur de la feuille Players)
-#         !inspect #ABC123     (teste un joueur precis)
-@bot.command(name='inspect')
-async def command_inspect(ctx, tag: str = None):
-    logging.info(f"Command {BOT_PREFIX}inspect from {ctx.author.name}: {tag}")
-    try:
-        if tag is None:
-            players = [r[0] for r in players_worksheet.get_all_values()[1:] if r and r[0].strip()]
-            if not players:
-                await ctx.send("Aucun joueur dans la feuille Players.")
-                return
-            tag = players[0]
-        clean = tag.strip().lstrip('#').upper()
-
-        url = f'https://api.brawlstars.com/v1/players/%23{clean}/battlelog'
-        r = requests.get(url, headers={'Authorization': f'Bearer {BS_TOKEN}'}, timeout=15)
-
-        embed = discord.Embed(title=f"Inspect API - #{clean}", color=discord.Color.blue())
-        embed.add_field(name="HTTP status", value=str(r.status_code), inline=False)
-
-        if r.status_code != 200:
-            embed.add_field(name="Reponse API", value=f"```{r.text[:600]}```", inline=False)
-            embed.set_footer(text="Status 403 = token verrouille sur une autre IP -> regenere le token pour l'IP du serveur.")
-            await ctx.send(embed=embed)
-            return
-
-        items = r.json().get('items', [])
-        embed.add_field(name="Batailles renvoyees", value=str(len(items)), inline=False)
-
-        types = Counter()
-        trophy = Counter()
-        for it in items:
-            b = it.get('battle', {})
-            types[str(b.get('type', '(AUCUN)'))] += 1
-            trophy['avec' if 'trophyChange' in b else 'sans'] += 1
-        embed.add_field(name="Types de battle", value=", ".join(f"{k}: {v}" for k, v in types.items()) or "—", inline=False)
-        embed.add_field(name="trophyChange present", value=", ".join(f"{k}: {v}" for k, v in trophy.items()) or "—", inline=False)
-
-        if items:
-            b0 = items[0].get('battle', {})
-            embed.add_field(name="Cles de battle['battle']", value=(", ".join(b0.keys()))[:1000] or "—", inline=False)
-            embed.add_field(name="1ere bataille",
-                            value=f"type = {b0.get('type')!r}\ntrophyChange = {b0.get('trophyChange')!r}", inline=False)
-        await ctx.send(embed=embed)
-    except Exception as e:
-        logging.error(f"Error in inspect: {e}")
-        await ctx.send(f"Erreur dans !inspect : {e}")
-
-
-# ===========================================================================
-#  COMMANDE UPDATE  ->  scrape l'API et remplit la feuille (remplace data.py)
-# ===========================================================================
-@bot.command(name='update')
-async def command_update(ctx):
-    logging.info(f"Command {BOT_PREFIX}update from {ctx.author.name}")
-    await ctx.send("Mise a jour des donnees en cours... (ca peut prendre une minute)")
-    try:
-        result = await do_scrape()
-        if result is None:
-            await ctx.send("Une mise a jour est deja en cours, reessaie dans un instant.")
-            return
-        added, skipped, types = result
-        msg = f"Termine : **{added}** nouvelles parties ajoutees, **{skipped}** parties ladder ignorees."
-        if types:
-            msg += "\nTypes ajoutes : " + ", ".join(f"{k}: {v}" for k, v in types.items())
-        await ctx.send(msg)
-    except Exception as e:
-        logging.error(f"Error in update: {e}")
-        await ctx.send(f"Erreur dans !update : {e}")
-
-
-# ===========================================================================
-#  COMMANDE RESET  ->  vide la feuille Matches et recree l'en-tete (depuis Discord)
-# ===========================================================================
-@bot.command(name='reset')
-async def command_reset(ctx, confirm: str = None):
-    logging.info(f"Command {BOT_PREFIX}reset from {ctx.author.name} (confirm={confirm})")
-    if confirm != 'CONFIRM':
-        await ctx.send("ATTENTION : cette commande vide TOUTE la feuille Matches. "
-                       "Pour confirmer, tape `!reset CONFIRM`. Ensuite lance `!update` pour la repeupler.")
-        return
-    try:
-        def do_reset():
-            matches_worksheet.clear()
-            matches_worksheet.append_row(MATCHES_HEADER)
-        await bot.loop.run_in_executor(None, do_reset)
-        await ctx.send("Feuille Matches videe et en-tete recree. Lance maintenant `!update`.")
-    except Exception as e:
-        logging.error(f"Error in reset: {e}")
-        await ctx.send(f"Erreur dans !reset : {e}")
-
-
-# ===========================================================================
-#  COMMANDE DRAFT  ->  top 15 des brawlers les plus joues par le trio sur une map
-# ===========================================================================
-DRAFT_DAYS = 60
-
-@bot.command(name='draft')
-async def command_draft(ctx, id1: str, id2: str, id3: str, *, map_name: str):
-    logging.info(f"Command {BOT_PREFIX}draft from {ctx.author.name}: {id1} {id2} {id3} | {map_name}")
-    try:
-        ids = {normalize_tag(id1), normalize_tag(id2), normalize_tag(id3)}
-
-        team_matches = get_team_matches(ids, map_name=map_name, days=DRAFT_DAYS)
-        if not team_matches:
-            await ctx.send(f"Aucune donnee (Ranked/tournoi) pour ce trio sur **{map_name}** sur {DRAFT_DAYS} jours. "
-                           f"Verifie avec `!debug` (nb de lignes) ou `!main {map_name}`.")
-            return
-
-        games, wins = Counter(), Counter()
-        for m in team_matches:
-            b = m.get('BrawlerName', '').upper()
-            r = m.get('Result', '').lower()
-            if not b or r not in ('victory', 'defeat'):
-                continue
-            games[b] += 1
-            if r == 'victory':
-                wins[b] += 1
-        top15 = games.most_common(15)
-
-        embed = discord.Embed(title=f"Top 15 brawlers - {map_name}",
-                              color=discord.Color.from_rgb(255, 69, 0))
-        top_lines = [f"{i}. {b} — {tot}g ({(wins[b]/tot*100):.0f}%)" for i, (b, tot) in enumerate(top15, 1)]
-        embed.add_field(name=f"Trio sur {DRAFT_DAYS} jours", value="\n".join(top_lines) or "—", inline=False)
-        embed.set_footer(text=f"Base sur {len(team_matches)} parties (Ranked/tournoi). Demande par {ctx.author.name}")
-        await ctx.send(embed=embed)
-    except Exception as e:
-        logging.error(f"Error in draft: {e}")
-        await ctx.send("Une erreur s'est produite dans !draft.")
-
-
-# ===========================================================================
-#  COMMANDE COMPARE (corrigee)
-# ===========================================================================
-@bot.command(name='compare')
-async def command_compare(ctx, id1: str, id2: str, id3: str, *, map_name: str):
-    logging.info(f"Command {BOT_PREFIX}compare from {ctx.author.name}: {id1}, {id2}, {id3}, {map_name}")
-    try:
-        sheet_players = {normalize_tag(row[0]) for row in players_worksheet.get_all_values()[1:]
-                         if row and row[0].strip()}
-        ids = {normalize_tag(id1), normalize_tag(id2), normalize_tag(id3)}
-        missing = [i for i in ids if i not in sheet_players]
-        if missing:
-            await ctx.send(f"ID introuvable(s) dans la feuille Players : {', '.join(missing)}")
-            return
-
-        team_matches = get_team_matches(ids, map_name=map_name, days=30)
-        if not team_matches:
-            await ctx.send(f"Aucune partie (Ranked/tournoi) pour ce trio sur **{map_name}** sur 30 jours. "
-                           f"Verifie avec `!debug` ou `!main {map_name}`.")
-            return
-
-        games = Counter(m['BrawlerName'].upper() for m in team_matches
-                        if m.get('BrawlerName', '').strip() and m.get('Result', '').strip().lower() in ('victory', 'defeat'))
-        wins = Counter(m['BrawlerName'].upper() for m in team_matches if m.get('Result', '').strip().lower() == 'victory')
-        if not games:
-            await ctx.send("Aucune partie valide (BrawlerName / Result manquants).")
-            return
-
-        embed = discord.Embed(title=f"Top 15 Brawlers on {map_name}", color=discord.Color.from_rgb(255, 69, 0))
-        embed.set_footer(text=f"Requested by {ctx.author.name} at {datetime.datetime.now().strftime('%H:%M:%S %d/%m/%Y')}")
-        for i, (brawler, total) in enumerate(games.most_common(15), 1):
-            w = wins.get(brawler, 0)
-            wr = (w / total * 100) if total else 0
-            embed.add_field(name=f"{i}. {brawler}", value=f"Used {total} times | Winrate: {wr:.1f}% ({w} wins)", inline=False)
-        await ctx.send(embed=embed)
-    except Exception as e:
-        logging.error(f"Error in compare: {e}")
-        await ctx.send("Une erreur s'est produite dans la commande.")
-
-
-# ===========================================================================
-#  COMMANDE MAIN
-# ===========================================================================
-@bot.command(name='main')
-async def command_main(ctx, *, map_name: str):
-    logging.info(f"Command {BOT_PREFIX}main from {ctx.author.name}: {map_name}")
-    try:
-        matches = matches_worksheet.get_all_records()
-        fifteen_days_ago = datetime.datetime.now(datetime.timezone.utc) - timedelta(days=15)
-        filtered = [m for m in matches if m.get('EventMap', '').lower() == map_name.lower()
-                    and parse(m['BattleTime']) > fifteen_days_ago
-                    and m.get('EventMode', '').lower() not in ['solo showdown', 'duo showdown']
-                    and not is_ladder_match(m)]
-        if not filtered:
-            await ctx.send('No matches found for this map in the last 15 days (Ranked/tournois uniquement).')
-            return
-        brawler_count = Counter(m['BrawlerName'].upper() for m in filtered if m.get('BrawlerName'))
-        embed = discord.Embed(title=f"Top 15 Brawlers on {map_name} (last 15 days)", color=discord.Color.from_rgb(255, 69, 0))
-        embed.set_footer(text=f"Requested by {ctx.author.name} at {datetime.datetime.now().strftime('%H:%M:%S %d/%m/%Y')}")
-        for i, (brawler, count) in enumerate(brawler_count.most_common(15), 1):
-            embed.add_field(name=f"{i}. {brawler}", value=f"Used {count} times", inline=False)
-        await ctx.send(embed=embed)
-    except Exception as e:
-        logging.error(f"Error in main: {e}")
-        await ctx.send("Une erreur s'est produite dans la commande.")
-
-
-keep_alive()
-bot.run(DISCORD_TOKEN)
+import time
+_BOOT_T0 = time.perf_counter()
+import os
+import math
+import asyncio
+import importlib.util
+from dotenv import load_dotenv
+import discord
+from discord.ext import commands, tasks
+import datetime
+from collections import Counter, defaultdict, OrderedDict
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from keep_alive import keep_alive
+from gsheets import LazyWorksheet
+from repository import make_repository
+from ingest import run_ingest, is_ladder_match, merge_results
+from jobs import job_queue, MANUAL, AUTO
+from bs_api import get_battlelog
+from sheets_writer import sheets_call, quotas
+from watermarks import watermarks
+from dedupe_index import dedupe_index
+from scheduler import scheduler, TICK_SECONDS, MIN_INTERVAL, MAX_INTERVAL
+from metrics import registry, command_seconds, event_loop_lag, export_cache
+from profiling import profiled, traced, run_in_context, perf_log, PERF_WINDOW, SLOW_COMMAND_MS
+
+load_dotenv()
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+# --- Chronometrage du demarrage ------------------------------------------------
+_boot_phases = []
+_boot_last = _BOOT_T0
+
+def boot_phase(name):
+    """Note la duree de la phase de demarrage qui vient de se terminer."""
+    global _boot_last
+    now = time.perf_counter()
+    _boot_phases.append((name, now - _boot_last))
+    _boot_last = now
+
+def boot_report():
+    phases = " | ".join(f"{name} {secs * 1000:.0f}ms" for name, secs in _boot_phases)
+    return f"Demarrage en {_boot_last - _BOOT_T0:.2f}s : {phases}"
+
+boot_phase('imports')
+
+
+# --- ML (optionnel) : si scikit-learn manque, on retombe sur le winrate -----
+# scikit-learn / scipy / numpy coutent plusieurs secondes a importer : on verifie
+# seulement leur presence ici, l'import reel se fait au 1er entrainement (ou en
+# tache de fond apres on_ready).
+SKLEARN_AVAILABLE = all(importlib.util.find_spec(m) is not None for m in ('sklearn', 'scipy', 'numpy'))
+LogisticRegression = sparse = np = None
+_ml_lock = threading.Lock()
+
+def load_ml():
+    """Importe les modules ML au 1er appel. Retourne False s'ils sont inutilisables."""
+    global LogisticRegression, sparse, np, SKLEARN_AVAILABLE
+    if not SKLEARN_AVAILABLE or np is not None:
+        return SKLEARN_AVAILABLE
+    with _ml_lock:
+        if np is None:
+            t0 = time.perf_counter()
+            try:
+                from sklearn.linear_model import LogisticRegression as _lr
+                from scipy import sparse as _sparse
+                import numpy as _np
+            except ImportError as e:
+                logging.error(f"Module ML inutilisable: {e}")
+                SKLEARN_AVAILABLE = False
+                return False
+            LogisticRegression, sparse, np = _lr, _sparse, _np
+            logging.info(f"Modules ML importes en {time.perf_counter() - t0:.2f}s.")
+    return True
+
+DISCORD_TOKEN = os.getenv('D')
+SHEET_ID = os.getenv('G')
+BS_TOKEN = os.getenv('B')  # token Brawl Stars (pour la commande !inspect)
+CREDENTIALS_FILE = 'credentials.json'
+YOUR_CHANNEL_ID = 1403782456108388404
+
+BOT_PREFIX = '!'
+
+# Google Sheets : ouvert au 1er appel (depuis un thread de donnees), pas a l'import
+players_worksheet = LazyWorksheet(SHEET_ID, CREDENTIALS_FILE, 'Players')
+matches_worksheet = LazyWorksheet(SHEET_ID, CREDENTIALS_FILE, 'Matches')  # PlayerTag, BattleTime, EventMode, EventMap, BrawlerName, Result, TrophyChange, BattleType
+
+intents = discord.Intents.default()
+intents.message_content = True
+bot = commands.Bot(command_prefix=BOT_PREFIX, intents=intents)
+boot_phase('config')
+
+
+# ===========================================================================
+#  HELPERS GENERAUX
+# ===========================================================================
+def normalize_tag(t):
+    """Uniformise un tag joueur en '#XXXX' majuscule (tolere espaces / # manquant)."""
+    return '#' + str(t).strip().lstrip('#').upper()
+
+
+def wilson_lower_bound(wins, total, z=1.96):
+    """Borne basse de Wilson (95%) : winrate prudent qui penalise les petits echantillons."""
+    if total <= 0:
+        return 0.0
+    phat = wins / total
+    denom = 1 + z * z / total
+    centre = phat + z * z / (2 * total)
+    marge = z * math.sqrt((phat * (1 - phat) + z * z / (4 * total)) / total)
+    return max(0.0, (centre - marge) / denom)
+
+
+# Stockage des parties (Sheets + copie memoire, ou SQLite indexe) : voir repository.py
+match_repo = make_repository(matches_worksheet, is_ladder=is_ladder_match)
+boot_phase('stockage')
+
+
+@traced('filter')
+def get_team_matches(ids, map_name=None, days=30):
+    """Matchs (non-ladder) d'un trio, eventuellement sur une map. `ids` = set de tags normalises."""
+    return match_repo.query(tags=ids, map_name=map_name or None, days=days)
+
+
+PLAYERS_TTL = 300   # s, liste Players relue au plus toutes les 5 min par la maj auto
+_players_cache = (0.0, [])
+
+def get_players(max_age=0):
+    """Tags de la feuille Players (colonne A, sans l'en-tete) ; `max_age` > 0 autorise le cache."""
+    global _players_cache
+    loaded_at, players = _players_cache
+    if max_age and players and time.monotonic() - loaded_at < max_age:
+        return players
+    players = [r[0] for r in sheets_call('read', players_worksheet.get_all_values)[1:] if r and r[0].strip()]
+    _players_cache = (time.monotonic(), players)
+    return players
+
+
+# ===========================================================================
+#  ACCES AUX DONNEES HORS EVENT LOOP
+# ===========================================================================
+# gspread / requests / le fit ML sont bloquants : les commandes passent TOUTES par
+# run_blocking, qui les execute dans un pool de threads dedie et borne, avec un
+# timeout par commande. Un Sheets lent ne gele plus le bot (heartbeats compris)
+# et plusieurs !compare simultanes sont servis en parallele.
+DATA_POOL_WORKERS = int(os.getenv('DATA_POOL_WORKERS', '8'))
+COMMAND_TIMEOUT = float(os.getenv('COMMAND_TIMEOUT', '30'))   # s, defaut par commande
+COMMAND_TIMEOUTS = {'inspect': 20, 'debug': 60, 'reset': 60}
+TIMEOUT_MSG = "La requete a pris trop de temps (Sheets / API lents ?), reessaie dans un instant."
+
+data_pool = ThreadPoolExecutor(max_workers=DATA_POOL_WORKERS, thread_name_prefix='data')
+
+async def run_blocking(func, *args, timeout=None, command=None, phase=None):
+    """
+    Execute func(*args) dans le pool de donnees et attend au plus `timeout`
+    (sinon celui de `command`, sinon COMMAND_TIMEOUT). Leve asyncio.TimeoutError ;
+    l'attente est annulee, le thread termine son appel et son resultat est ignore.
+    `phase` : phase de profilage de tout l'appel (voir profiling.py).
+    """
+    if timeout is None:
+        timeout = COMMAND_TIMEOUTS.get(command, COMMAND_TIMEOUT)
+    if phase is not None:
+        func = traced(phase)(func)
+    fut = asyncio.get_running_loop().run_in_executor(data_pool, run_in_context(func, *args))
+    return await asyncio.wait_for(fut, timeout)
+
+def _ignore_result(fut):
+    """Tache laissee en fond apres un timeout : son erreur eventuelle est lue (pas de log asyncio)."""
+    if not fut.cancelled():
+        fut.exception()
+
+
+# --- Cache des requetes (single-flight + LRU/TTL) ----------------------------
+# Pendant un scrim, plusieurs !compare / !main identiques arrivent en meme temps :
+# une seule execution par cle, les autres attendent son resultat, puis il est
+# garde QUERY_CACHE_TTL secondes (invalide des qu'un scrape ecrit des parties
+# des tags / maps concernes).
+QUERY_CACHE_SIZE = 256
+QUERY_CACHE_TTL = 300   # s
+
+class QueryCache:
+    """Resultats de requetes par cle, avec regroupement des requetes identiques en vol."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()   # invalidate() est appele depuis le thread du scrape
+        self._entries = OrderedDict()   # cle -> (expiration, tags, map, valeur)
+        self._inflight = {}             # cle -> asyncio.Future (event loop uniquement)
+        self._generation = 0
+        self.hits = self.misses = 0     # requete identique en vol = hit
+
+    async def get(self, key, compute, tags=None, map_name=None):
+        """
+        Valeur en cache pour `key`, sinon await compute(). `tags` (None = toutes)
+        et `map_name` (None = toutes) disent quelles ecritures l'invalident.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[3]
+            generation = self._generation
+        if key in self._inflight:
+            self.hits += 1
+            return await asyncio.shield(self._inflight[key])
+        self.misses += 1
+
+        fut = asyncio.get_running_loop().create_future()
+        self._inflight[key] = fut
+        try:
+            value = await compute()
+        except asyncio.CancelledError:
+            fut.cancel()
+            raise
+        except BaseException as e:
+            fut.set_exception(e)
+            fut.exception()   # marque comme lue (pas de log si personne n'attendait)
+            raise
+        finally:
+            del self._inflight[key]
+        fut.set_result(value)
+        with self._lock:
+            if generation == self._generation:   # pas d'ecriture entre-temps
+                self._entries[key] = (time.monotonic() + self.ttl, tags, map_name, value)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self, tags, maps):
+        """Oublie les resultats touches par de nouvelles parties (`tags` / `maps` en minuscules)."""
+        with self._lock:
+            self._generation += 1
+            for key, (_, etags, emap, _) in list(self._entries.items()):
+                if etags is not None and not (etags & tags):
+                    continue
+                if emap is not None and emap not in maps:
+                    continue
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+
+query_cache = QueryCache(QUERY_CACHE_SIZE, QUERY_CACHE_TTL)
+
+@registry.collector
+def _export_query_cache():
+    export_cache('query', query_cache.hits, query_cache.misses)
+
+async def cached_query(command, func, *args, tags=None, map_name=None, days=None, phase='aggregate'):
+    """run_blocking(func, *args) via le cache ; cle = (commande, tags, map, jours)."""
+    tags = frozenset(tags) if tags is not None else None
+    map_key = map_name.lower() if map_name else None
+    key = (command, tags, map_key, days)
+    return await query_cache.get(key, lambda: run_blocking(func, *args, command=command, phase=phase),
+                                 tags=tags, map_name=map_key)
+
+
+# ===========================================================================
+#  MODULE D'APPRENTISSAGE AUTOMATIQUE
+# ===========================================================================
+# Modele : regression logistique sur les comps reconstituees (multi-hot brawlers)
+#          -> P(victoire). Sert a noter la FORCE d'un brawler (bans) et a evaluer
+#          un PICK. Avec peu de donnees elle apprend surtout des forces regularisees,
+#          donc les picks sont blendes avec la synergie observee.
+MODEL_MIN_SAMPLES = 40   # nb de parties mini pour entrainer (sinon fallback winrate)
+MODEL_C = 0.3            # regularisation L2 (petit = plus fort, anti-overfit)
+W_MODEL = 0.6            # poids du modele dans le score de pick
+W_SYNERGY = 0.4          # poids de la synergie observee dans le score de pick
+MODEL_CACHE_TTL = 3600   # s ; au-dela on reentraine (les vieilles parties sortent de la fenetre)
+
+class BattleIndex:
+    """
+    Index des parties pour les requetes "winrate des parties contenant ces brawlers" :
+    un bitset (entier Python) par brawler -> bit i = la partie i le contient.
+    Une requete = intersection des bitsets + popcount, sans reparcourir les parties.
+    """
+
+    def __init__(self, battles):
+        comps = []
+        win_ids = []
+        ids_by_brawler = defaultdict(list)
+        for i, (bt, players) in enumerate(battles.items()):
+            comp = battles.team(bt)[0]
+            comps.append(comp)
+            for br in comp:
+                ids_by_brawler[br].append(i)
+            if next(iter(players.values()))[1] == 'victory':
+                win_ids.append(i)
+        self.comps = comps
+        self.n = len(comps)
+        self.all = (1 << self.n) - 1
+        self.wins = self._bitset(win_ids)
+        self.by_brawler = {br: self._bitset(ids) for br, ids in ids_by_brawler.items()}
+
+    def _bitset(self, ids):
+        buf = bytearray((self.n + 7) // 8)
+        for i in ids:
+            buf[i >> 3] |= 1 << (i & 7)
+        return int.from_bytes(buf, 'little')
+
+    def winrate(self, required):
+        """(victoires, parties) ou tous les brawlers `required` etaient presents."""
+        mask = self.all
+        for b in required:
+            mask &= self.by_brawler.get(b, 0)
+            if not mask:
+                return 0, 0
+        return (mask & self.wins).bit_count(), mask.bit_count()
+
+
+class Battles(dict):
+    """
+    BattleTime -> {tag: (brawler, result)}, avec son BattleIndex construit a la demande.
+    `teams` : BattleTime -> (coequipiers, adversaires) lus dans les colonnes Allies / Enemies.
+    """
+    _index = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.teams = {}
+
+    def team(self, bt):
+        """(notre comp complete, comp adverse) ; adversaires vides pour les anciennes lignes."""
+        own = frozenset(br for br, _ in self[bt].values())
+        allies, enemies = self.teams.get(bt, (frozenset(), frozenset()))
+        return own | allies, enemies
+
+    def index(self):
+        if self._index is None:
+            self._index = BattleIndex(self)
+        return self._index
+
+
+def _split_comp(raw):
+    """'BRAWLER1,BRAWLER2' -> frozenset (None / vide -> ensemble vide)."""
+    return frozenset(b for b in (x.strip().upper() for x in (raw or '').split(',')) if b)
+
+@traced('parse')
+def build_battles(team_matches):
+    """Regroupe les lignes par BattleTime -> {tag: (brawler, result)} (coequipiers = meme heure)."""
+    battles = defaultdict(dict)
+    teams = {}
+    for m in team_matches:
+        tag = normalize_tag(m.get('PlayerTag', ''))
+        b = m.get('BrawlerName', '').upper()
+        r = m.get('Result', '').lower()
+        if b and r in ('victory', 'defeat'):
+            bt = m['BattleTime']
+            battles[bt][tag] = (b, r)
+            allies, enemies = _split_comp(m.get('Allies')), _split_comp(m.get('Enemies'))
+            if allies or enemies:
+                known = teams.get(bt, (frozenset(), frozenset()))
+                teams[bt] = (known[0] | allies, known[1] | enemies)
+    out = Battles(battles)
+    out.teams = teams
+    return out
+
+@traced('parse')
+def battles_to_samples(battles):
+    """Chaque partie -> (notre comp, comp adverse, 1=win/0=loss)."""
+    samples = []
+    for bt, players in battles.items():
+        allies, enemies = battles.team(bt)
+        res = next(iter(players.values()))[1]
+        if allies:
+            samples.append((allies, enemies, 1 if res == 'victory' else 0))
+    return samples
+
+def comp_winrate(battles, required):
+    """Winrate des parties ou tous les brawlers `required` etaient presents."""
+    if not isinstance(battles, Battles):
+        battles = Battles(battles)
+    return battles.index().winrate({x.upper() for x in required})
+
+class DraftFeatures:
+    """
+    Features creuses du modele de draft, pour une partie (notre comp, comp adverse) :
+      ('a', b)       b dans notre equipe          ('e', b)       b en face
+      ('s', b1, b2)  paire de coequipiers         ('c', a, e)    notre a contre leur e
+    Le vocabulaire est fige au fit (seules les paires vues a l'entrainement ont
+    une colonne) : ~18 valeurs non nulles par partie, quel que soit le nombre de
+    brawlers -> matrice CSR construite directement, jamais de matrice dense.
+    """
+
+    def __init__(self):
+        self.index = {}
+
+    @staticmethod
+    def keys(allies, enemies):
+        allies, enemies = sorted(allies), sorted(enemies)
+        for b in allies:
+            yield ('a', b)
+        for b in enemies:
+            yield ('e', b)
+        for i, b1 in enumerate(allies):
+            for b2 in allies[i + 1:]:
+                yield ('s', b1, b2)
+        for a in allies:
+            for e in enemies:
+                yield ('c', a, e)
+
+    def fit(self, teams):
+        for allies, enemies in teams:
+            for k in self.keys(allies, enemies):
+                self.index.setdefault(k, len(self.index))
+        return self
+
+    def transform(self, teams):
+        """Liste de (allies, enemies) -> matrice CSR ; features inconnues ignorees."""
+        indices, indptr = [], [0]
+        for allies, enemies in teams:
+            indices.extend(sorted({self.index[k] for k in self.keys(allies, enemies) if k in self.index}))
+            indptr.append(len(indices))
+        data = np.ones(len(indices))
+        return sparse.csr_matrix((data, indices, indptr), shape=(len(teams), len(self.index)))
+
+    def __len__(self):
+        return len(self.index)
+
+
+@traced('model')
+def train_model(samples, warm_from=None):
+    """
+    Entraine la regression logistique sur (allies, enemies, win).
+    Retourne (model, features) ou None si impossible.
+    `warm_from` = (model, features) precedent : ses coefficients servent de point de depart.
+    """
+    if len(samples) < MODEL_MIN_SAMPLES or not load_ml():
+        return None
+    y = [w for _, _, w in samples]
+    if len(set(y)) < 2:   # besoin de victoires ET defaites
+        return None
+    teams = [(allies, enemies) for allies, enemies, _ in samples]
+    features = DraftFeatures().fit(teams)
+    X = features.transform(teams)
+    try:
+        model = LogisticRegression(C=MODEL_C, max_iter=2000, warm_start=warm_from is not None)
+        if warm_from is not None:
+            old_model, old_features = warm_from
+            coef = np.zeros((1, len(features)))
+            for k, i in old_features.index.items():
+                j = features.index.get(k)
+                if j is not None:
+                    coef[0, j] = old_model.coef_[0, i]
+            model.coef_ = coef
+            model.intercept_ = old_model.intercept_.copy()
+        model.fit(X, np.array(y, dtype=float))
+    except Exception as e:
+        logging.error(f"train_model failed: {e}")
+        return None
+    return (model, features)
+
+def teams_winprobs(model_info, teams):
+    """P(victoire) pour plusieurs (allies, enemies) en UN seul predict_proba (matrice creuse)."""
+    if not teams:
+        return []
+    model, features = model_info
+    return model.predict_proba(features.transform(teams))[:, 1].tolist()
+
+def model_winprobs(model_info, comps, enemies=frozenset()):
+    """P(victoire) de plusieurs comps face a `enemies` (vide = adversaires inconnus)."""
+    return teams_winprobs(model_info, [(comp, enemies) for comp in comps])
+
+def model_winprob(model_info, comp, enemies=frozenset()):
+    """P(victoire) predite par le modele pour une comp (set de brawlers)."""
+    return model_winprobs(model_info, [comp], enemies)[0]
+
+
+class DraftModelCache:
+    """
+    Modeles deja entraines, par (trio, map, fenetre) : un draft ne refait pas le fit.
+    Une entree est perimee quand de nouvelles parties arrivent pour un des tags
+    (invalidate) ou apres MODEL_CACHE_TTL ; elle sert alors de warm start.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = {}          # cle -> (versions des tags, date, model_info)
+        self._versions = Counter()  # tag -> nb d'invalidations
+
+    def invalidate(self, tags):
+        with self._lock:
+            for t in tags:
+                self._versions[normalize_tag(t)] += 1
+
+    def get(self, ids, map_name, days, build):
+        """model_info en cache, sinon build(precedent) -> model_info (peut etre None)."""
+        key = (frozenset(ids), (map_name or '').lower(), days)
+        with self._lock:
+            versions = tuple(self._versions[t] for t in sorted(key[0]))
+            entry = self._entries.get(key)
+        if entry and entry[0] == versions and time.monotonic() - entry[1] < self.ttl:
+            return entry[2]
+        model_info = build(entry[2] if entry else None)
+        with self._lock:
+            self._entries[key] = (versions, time.monotonic(), model_info)
+        return model_info
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+draft_models = DraftModelCache(ttl=MODEL_CACHE_TTL)
+
+@traced('model')
+def suggest_bans(model_info, taken, games, wins, enemy_games, enemy_wins, allies=(), enemies=(), n=5, min_games=3):
+    """
+    Bans = brawlers adverses les plus DANGEREUX pour nous sur la map :
+    1 - P(victoire) si on l'affronte (modele), sinon son winrate prudent contre nous.
+    Sans compositions adverses (anciennes lignes) : nos brawlers les plus forts.
+    """
+    if not enemy_games:
+        cands = [b for b in sorted(games) if b not in taken and games[b] >= min_games]
+        if model_info:
+            forces = model_winprobs(model_info, [{b} for b in cands])
+        else:
+            forces = [wilson_lower_bound(wins[b], games[b]) for b in cands]
+        scored = [(force, b, games[b]) for force, b in zip(forces, cands)]
+    else:
+        ally_set = frozenset(a.upper() for a in allies)
+        enemy_set = frozenset(e.upper() for e in enemies)
+        cands = [b for b in sorted(enemy_games) if b not in taken and enemy_games[b] >= min_games]
+        if model_info:
+            probs = teams_winprobs(model_info, [(ally_set, enemy_set | {b}) for b in cands])
+            forces = [1 - p for p in probs]
+        else:
+            forces = [wilson_lower_bound(enemy_wins[b], enemy_games[b]) for b in cands]
+        scored = [(force, b, enemy_games[b]) for force, b in zip(forces, cands)]
+    scored.sort(key=lambda t: t[0], reverse=True)
+    return scored[:n]
+
+@traced('model')
+def suggest_picks(model_info, battles, all_brawlers, allies, taken, games, wins, enemies=(), n=5, min_games=2):
+    """Picks = meilleurs completements de VOTRE comp face aux adversaires connus (modele + synergie observee)."""
+    ally_set = {a.upper() for a in allies}
+    enemy_set = frozenset(e.upper() for e in enemies)
+    cands = [b for b in all_brawlers if b not in taken and games[b] >= min_games]
+    if len(cands) < n:
+        cands = [b for b in all_brawlers if b not in taken]
+    probs = model_winprobs(model_info, [ally_set | {b} for b in cands], enemies=enemy_set) if model_info else None
+    scored = []
+    for k, b in enumerate(cands):
+        if ally_set:
+            syn_w, syn_g = comp_winrate(battles, ally_set | {b})
+        else:
+            syn_w, syn_g = wins[b], games[b]
+        syn_score = wilson_lower_bound(syn_w, syn_g)
+        if probs is not None:
+            score = W_MODEL * probs[k] + W_SYNERGY * syn_score
+        else:
+            score = syn_score
+        scored.append((score, b, syn_g))
+    scored.sort(key=lambda t: t[0], reverse=True)
+    return scored[:n]
+
+
+# ===========================================================================
+#  PARSING DRAFT
+# ===========================================================================
+@traced('parse')
+def parse_draft_args(raw):
+    """Parse '<map> | ban: ... | enemy: ... | ally: ...' (FR/EN toleres)."""
+    map_name, bans, enemies, allies = None, [], [], []
+    for part in (p.strip() for p in raw.split('|')):
+        if not part:
+            continue
+        if ':' in part:
+            key, _, val = part.partition(':')
+            key = key.strip().lower()
+            vals = [v.strip().upper() for v in val.replace(',', ' ').split() if v.strip()]
+            if key in ('ban', 'bans', 'interdit', 'interdits'):
+                bans = vals
+            elif key in ('enemy', 'enemies', 'ennemi', 'ennemis', 'adv', 'adverse'):
+                enemies = vals
+            elif key in ('ally', 'allies', 'allie', 'team', 'equipe'):
+                allies = vals
+            elif key in ('map', 'carte') and not map_name:
+                map_name = val.strip()
+        elif map_name is None:
+            map_name = part
+    return map_name, bans, enemies, allies
+
+
+# ===========================================================================
+#  SCRAPING INTEGRE (remplace data.py) - utilise par la commande !update
+# ===========================================================================
+def _write_batch(rows):
+    """Sink du pipeline d'ingestion : ecriture + invalidation des caches touches."""
+    match_repo.append(rows)
+    draft_models.invalidate({r[0] for r in rows})
+    query_cache.invalidate({normalize_tag(r[0]) for r in rows}, {r[3].lower() for r in rows})
+
+def _invalidate_caches():
+    """Donnees rechargees en fond (rattrapage du snapshot, import SQLite) : tout est perime."""
+    draft_models.clear()
+    query_cache.clear()
+
+match_repo.on_reload = _invalidate_caches
+
+def select_players(auto=False):
+    """auto=True : seulement les joueurs dus selon le scheduler adaptatif (sinon tous)."""
+    if auto:
+        return scheduler.due(get_players(max_age=PLAYERS_TTL))
+    return get_players()
+
+def scrape_players(players):
+    """
+    Recupere les battlelogs via l'API BS et ecrit les nouvelles parties non-ladder.
+    Execute par un worker de job_queue. Retourne (added, skipped_ladder, types).
+    """
+    match_repo.prepare()
+    dedupe_index.ensure_loaded(match_repo.keys)   # lecture complete au tout 1er passage seulement
+    if watermarks.missing(players):
+        # 1er passage (ou fichier perdu) : on amorce depuis l'index, pas depuis la feuille
+        watermarks.seed(dedupe_index.latest_battle_times())
+    return run_ingest(players, BS_TOKEN, _write_batch, observer=scheduler.observe,
+                      tracked=get_players(max_age=PLAYERS_TTL), on_covered=scheduler.observe_covered)
+
+
+# --- Rafraichissement automatique -------------------------------------------
+# Passage toutes les TICK_SECONDS, mais chaque joueur n'est interroge que quand il
+# est du (scheduler.py) : actifs toutes les 3 min, inactifs jusqu'a toutes les 4 h.
+# Les scrapes passent par job_queue (jobs.py), partagee avec start.py : un joueur
+# deja en file / en cours n'est pas relance, !update rejoint le scrape en cours.
+async def do_scrape(auto=False):
+    """Programme le scrape des joueurs (tous, ou les joueurs dus si auto) et attend
+       son resultat (added, skipped, types), jobs rejoints compris."""
+    players = await run_blocking(select_players, auto, timeout=COMMAND_TIMEOUT)
+    if not players:
+        return 0, 0, {}
+    fut = job_queue.submit([normalize_tag(p) for p in players], scrape_players,
+                           priority=AUTO if auto else MANUAL, combine=merge_results)
+    return await asyncio.wrap_future(fut)
+
+@tasks.loop(seconds=TICK_SECONDS)
+async def auto_update():
+    try:
+        added, skipped, types = await do_scrape(auto=True)
+    except Exception as e:
+        logging.error(f"Auto-update: {e}")
+        return
+    if added or skipped:
+        logging.info(f"Auto-update: {added} ajoutees, {skipped} ladder ignorees, types={types}")
+
+@auto_update.before_loop
+async def before_auto_update():
+    await bot.wait_until_ready()
+
+
+# ===========================================================================
+#  EVENTS
+# ===========================================================================
+@bot.event
+async def on_ready():
+    logging.info(f'Logged in as {bot.user} (ID: {bot.user.id})')
+    logging.info(f'ML disponible: {SKLEARN_AVAILABLE}')
+    if not _boot_phases or _boot_phases[-1][0] != 'connexion discord':
+        boot_phase('connexion discord')
+        logging.info(boot_report())
+    if SKLEARN_AVAILABLE:
+        data_pool.submit(load_ml)   # import ML en fond : le 1er !picks n'attend pas
+    global _lag_task
+    if _lag_task is None:
+        _lag_task = asyncio.create_task(watch_event_loop_lag())
+    if not auto_update.is_running():
+        auto_update.start()
+        logging.info(f"Rafraichissement automatique active (adaptatif, {MIN_INTERVAL / 60:g} min a {MAX_INTERVAL / 60:g} min).")
+    channel = bot.get_channel(YOUR_CHANNEL_ID)
+    if channel:
+        await channel.send(
+            f"Bot online ! Maj auto adaptative ({MIN_INTERVAL / 60:g} min pour les joueurs actifs). "
+            f"Commandes : {BOT_PREFIX}compare, {BOT_PREFIX}main, {BOT_PREFIX}draft, {BOT_PREFIX}picks, "
+            f"{BOT_PREFIX}debug, {BOT_PREFIX}perf, {BOT_PREFIX}inspect, {BOT_PREFIX}update, {BOT_PREFIX}reset"
+        )
+
+@bot.event
+async def on_message(message):
+    if message.author == bot.user:
+        return
+    logging.info(f"Message: {message.content} from {message.author.name} in {message.channel.id}")
+    await bot.process_commands(message)
+
+# --- Telemetrie (/metrics sur keep_alive) --------------------------------------
+EVENT_LOOP_PROBE = 1.0   # s entre deux mesures du retard de l'event loop
+_lag_task = None
+
+async def watch_event_loop_lag(interval=EVENT_LOOP_PROBE):
+    """Mesure le retard pris par un sleep(interval) : > 0 = event loop bloquee par du code synchrone."""
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        event_loop_lag.observe(max(0.0, loop.time() - start - interval))
+
+@bot.before_invoke
+async def start_command_timer(ctx):
+    ctx.started_at = time.perf_counter()
+
+@bot.after_invoke
+async def record_command_time(ctx):
+    started = getattr(ctx, 'started_at', None)
+    if started is not None and ctx.command is not None:
+        command_seconds.observe(time.perf_counter() - started, command=ctx.command.qualified_name,
+                                outcome='error' if ctx.command_failed else 'ok')
+
+@bot.event
+async def on_command_error(ctx, error):
+    logging.error(f"Command error: {error}")
+    await ctx.send(f"Error: {str(error)}")
+
+
+# ===========================================================================
+#  COMMANDE DEBUG
+# ===========================================================================
+@bot.command(name='debug')
+@profiled('debug')
+async def command_debug(ctx):
+    try:
+        total, keys, bt, nb_ladder = await run_blocking(match_repo.stats, command='debug', phase='aggregate')
+        if total == 0:
+            await ctx.send("La feuille Matches est vide.")
+            return
+        if 'BattleType' not in keys:
+            bt = Counter()
+        embed = discord.Embed(title="Debug - donnees Matches", color=discord.Color.orange())
+        embed.add_field(name="Lignes totales", value=str(total), inline=False)
+        embed.add_field(name="Colonnes", value=", ".join(keys), inline=False)
+        if bt:
+            embed.add_field(name="BattleType", value=" | ".join(f"{k}: {v}" for k, v in bt.most_common(8)), inline=False)
+        else:
+            embed.add_field(name="BattleType", value="ABSENTE (ajoute l'en-tete colonne H)", inline=False)
+        embed.add_field(name="Classees 'ladder' (exclues)", value=f"{nb_ladder} / {total}", inline=False)
+        embed.add_field(name="Module ML", value="actif" if SKLEARN_AVAILABLE else "inactif (scikit-learn absent)", inline=False)
+        embed.add_field(name="Ecriture Sheets",
+                        value=f"{match_repo.pending_writes()} lignes en attente | quota/min : "
+                              f"{quotas['read'].used()}/{quotas['read'].per_minute} lectures, "
+                              f"{quotas['write'].used()}/{quotas['write'].per_minute} ecritures",
+                        inline=False)
+        nb, nb_due, lo, hi = scheduler.summary()
+        queued, running = job_queue.depth()
+        embed.add_field(name="Jobs de scrape", value=f"{queued} en file, {running} en cours", inline=False)
+        if nb:
+            embed.add_field(name="Scheduler", value=f"{nb} joueurs suivis, {nb_due} dus | intervalles {lo:.0f} a {hi:.0f} min",
+                            inline=False)
+        await ctx.send(embed=embed)
+    except asyncio.TimeoutError:
+        await ctx.send(TIMEOUT_MSG)
+    except Exception as e:
+        logging.error(f"Error in debug: {e}")
+        await ctx.send("Une erreur s'est produite dans !debug.")
+
+
+# ===========================================================================
+#  COMMANDE PERF  ->  latences par commande et appels les plus lents
+# ===========================================================================
+# Usage : !perf                 (toutes les commandes)
+#         !perf picks           (une commande + dernier profil cProfile)
+#         !perf profile picks   (le prochain !picks tourne sous cProfile)
+def _ago(ts):
+    minutes = (time.time() - ts) / 60
+    return f"{minutes:.0f} min" if minutes < 90 else f"{minutes / 60:.1f} h"
+
+@bot.command(name='perf')
+async def command_perf(ctx, *args):
+    logging.info(f"Command {BOT_PREFIX}perf from {ctx.author.name}: {' '.join(args)}")
+    try:
+        if len(args) == 2 and args[0].lower() == 'profile':
+            name = args[1].lstrip(BOT_PREFIX).lower()
+            if bot.get_command(name) is None:
+                await ctx.send(f"Commande inconnue : {BOT_PREFIX}{name}")
+                return
+            perf_log.arm(name)
+            await ctx.send(f"Le prochain {BOT_PREFIX}{name} sera profile (cProfile). Resultat : `{BOT_PREFIX}perf {name}`.")
+            return
+
+        command = args[0].lstrip(BOT_PREFIX).lower() if args else None
+        summary = perf_log.summary()
+        if command:
+            summary = {k: v for k, v in summary.items() if k == command}
+        if not summary:
+            await ctx.send("Aucun appel mesure pour l'instant.")
+            return
+
+        embed = discord.Embed(title="Perf des commandes" + (f" - {BOT_PREFIX}{command}" if command else ""),
+                              color=discord.Color.dark_teal())
+        embed.add_field(name=f"Latences ({PERF_WINDOW} derniers appels)",
+                        value="\n".join(f"{BOT_PREFIX}{name} — {n} appels | p50 {p50 * 1000:.0f} ms | p95 {p95 * 1000:.0f} ms"
+                                        for name, (n, p50, p95) in summary.items())[:1024],
+                        inline=False)
+        slow = [f"{BOT_PREFIX}{inv.command} {inv.total * 1000:.0f} ms (il y a {_ago(inv.started_at)}) — {inv.breakdown()}"
+                for inv in perf_log.slowest(5, command)]
+        embed.add_field(name="Plus lents", value="\n".join(slow)[:1024] or "—", inline=False)
+        profile = perf_log.profile(command) if command else None
+        if profile:
+            embed.add_field(name=f"cProfile (il y a {_ago(profile[0])}, temps cumule)",
+                            value=f"```{profile[1][:1000]}```", inline=False)
+        embed.set_footer(text=f"Journal des commandes lentes au-dela de {SLOW_COMMAND_MS:.0f} ms")
+        await ctx.send(embed=embed)
+    except Exception as e:
+        logging.error(f"Error in perf: {e}")
+        await ctx.send("Une erreur s'est produite dans !perf.")
+
+
+# ===========================================================================
+#  COMMANDE INSPECT  ->  interroge l'API BS DEPUIS le serveur (bon token/IP)
+# ===========================================================================
+# Usage : !inspect            (teste le 1er joueur de la feuille Players)
+#         !inspect #ABC123     (teste un joueur precis)
+@bot.command(name='inspect')
+@profiled('inspect')
+async def command_inspect(ctx, tag: str = None):
+    logging.info(f"Command {BOT_PREFIX}inspect from {ctx.author.name}: {tag}")
+    try:
+        if tag is None:
+            players = await run_blocking(get_players, command='inspect')
+            if not players:
+                await ctx.send("Aucun joueur dans la feuille Players.")
+                return
+            tag = players[0]
+        clean = tag.strip().lstrip('#').upper()
+
+        # client API partage : une reponse encore fraiche (ou revalidee par ETag) ne coute pas de quota
+        r = await run_blocking(get_battlelog, clean, BS_TOKEN, command='inspect', phase='fetch')
+
+        embed = discord.Embed(title=f"Inspect API - #{clean}", color=discord.Color.blue())
+        embed.add_field(name="HTTP status", value=f"{r.status}{' (cache)' if r.cached else ''}", inline=False)
+
+        if r.status != 200:
+            embed.add_field(name="Reponse API", value=f"```{r.text[:600]}```", inline=False)
+            embed.set_footer(text="Status 403 = token verrouille sur une autre IP -> regenere le token pour l'IP du serveur.")
+            await ctx.send(embed=embed)
+            return
+
+        items = r.data.get('items', [])
+        embed.add_field(name="Batailles renvoyees", value=str(len(items)), inline=False)
+
+        types = Counter()
+        trophy = Counter()
+        for it in items:
+            b = it.get('battle', {})
+            types[str(b.get('type', '(AUCUN)'))] += 1
+            trophy['avec' if 'trophyChange' in b else 'sans'] += 1
+        embed.add_field(name="Types de battle", value=", ".join(f"{k}: {v}" for k, v in types.items()) or "—", inline=False)
+        embed.add_field(name="trophyChange present", value=", ".join(f"{k}: {v}" for k, v in trophy.items()) or "—", inline=False)
+
+        if items:
+            b0 = items[0].get('battle', {})
+            embed.add_field(name="Cles de battle['battle']", value=(", ".join(b0.keys()))[:1000] or "—", inline=False)
+            embed.add_field(name="1ere bataille",
+                            value=f"type = {b0.get('type')!r}\ntrophyChange = {b0.get('trophyChange')!r}", inline=False)
+        await ctx.send(embed=embed)
+    except asyncio.TimeoutError:
+        await ctx.send(TIMEOUT_MSG)
+    except Exception as e:
+        logging.error(f"Error in inspect: {e}")
+        await ctx.send(f"Erreur dans !inspect : {e}")
+
+
+# ===========================================================================
+#  COMMANDE UPDATE  ->  scrape l'API et remplit la feuille (remplace data.py)
+# ===========================================================================
+@bot.command(name='update')
+@profiled('update')
+async def command_update(ctx):
+    logging.info(f"Command {BOT_PREFIX}update from {ctx.author.name}")
+    await ctx.send("Mise a jour des donnees en cours... (ca peut prendre une minute)")
+    try:
+        # un scrape auto deja en cours n'est pas refuse : on le rejoint (et les joueurs en file sont promus)
+        added, skipped, types = await do_scrape()
+        msg = f"Termine : **{added}** nouvelles parties ajoutees, **{skipped}** parties ladder ignorees."
+        if types:
+            msg += "\nTypes ajoutes : " + ", ".join(f"{k}: {v}" for k, v in types.items())
+        await ctx.send(msg)
+    except Exception as e:
+        logging.error(f"Error in update: {e}")
+        await ctx.send(f"Erreur dans !update : {e}")
+
+
+# ===========================================================================
+#  COMMANDE RESET  ->  vide la feuille Matches et recree l'en-tete (depuis Discord)
+# ===========================================================================
+@bot.command(name='reset')
+@profiled('reset')
+async def command_reset(ctx, confirm: str = None):
+    logging.info(f"Command {BOT_PREFIX}reset from {ctx.author.name} (confirm={confirm})")
+    if confirm != 'CONFIRM':
+        await ctx.send("ATTENTION : cette commande vide TOUTE la feuille Matches. "
+                       "Pour confirmer, tape `!reset CONFIRM`. Ensuite lance `!update` pour la repeupler.")
+        return
+    try:
+        def do_reset():
+            match_repo.clear()
+            watermarks.clear()
+            watermarks.save()
+            scheduler.reset()
+            query_cache.clear()
+        await run_blocking(do_reset, command='reset')
+        await ctx.send("Feuille Matches videe et en-tete recree. Lance maintenant `!update`.")
+    except Exception as e:
+        logging.error(f"Error in reset: {e}")
+        await ctx.send(f"Erreur dans !reset : {e}")
+
+
+# ===========================================================================
+#  COMMANDE DRAFT  ->  top 15 des brawlers les plus joues par le trio sur une map
+# ===========================================================================
+DRAFT_DAYS = 60
+
+@bot.command(name='draft')
+@profiled('draft')
+async def command_draft(ctx, id1: str, id2: str, id3: str, *, map_name: str):
+    logging.info(f"Command {BOT_PREFIX}draft from {ctx.author.name}: {id1} {id2} {id3} | {map_name}")
+    try:
+        ids = {normalize_tag(id1), normalize_tag(id2), normalize_tag(id3)}
+
+        games, wins, nb_rows = await cached_query('draft', match_repo.brawler_stats, map_name, DRAFT_DAYS, ids,
+                                                  tags=ids, map_name=map_name, days=DRAFT_DAYS)
+        if not nb_rows:
+            await ctx.send(f"Aucune donnee (Ranked/tournoi) pour ce trio sur **{map_name}** sur {DRAFT_DAYS} jours. "
+                           f"Verifie avec `!debug` (nb de lignes) ou `!main {map_name}`.")
+            return
+
+        top15 = games.most_common(15)
+
+        embed = discord.Embed(title=f"Top 15 brawlers - {map_name}",
+                              color=discord.Color.from_rgb(255, 69, 0))
+        top_lines = [f"{i}. {b} — {tot}g ({(wins[b]/tot*100):.0f}%)" for i, (b, tot) in enumerate(top15, 1)]
+        embed.add_field(name=f"Trio sur {DRAFT_DAYS} jours", value="\n".join(top_lines) or "—", inline=False)
+        embed.set_footer(text=f"Base sur {nb_rows} parties (Ranked/tournoi). Demande par {ctx.author.name}")
+        await ctx.send(embed=embed)
+    except asyncio.TimeoutError:
+        await ctx.send(TIMEOUT_MSG)
+    except Exception as e:
+        logging.error(f"Error in draft: {e}")
+        await ctx.send("Une erreur s'est produite dans !draft.")
+
+
+# ===========================================================================
+#  COMMANDE PICKS  ->  bans + picks recommandes (modele ML, budget de latence)
+# ===========================================================================
+# Usage : !picks #ID1 #ID2 #ID3 <map> | ban: X Y | enemy: Z | ally: W
+PICKS_BUDGET_MS = int(os.getenv('PICKS_BUDGET_MS', '500'))   # budget de toute la commande
+
+@traced('aggregate')
+def prepare_draft(ids, map_name, days=DRAFT_DAYS):
+    """
+    Donnees d'un draft : (battles, games, wins, enemy_games, enemy_wins, brawlers tries).
+    enemy_* : parties contre chaque brawler adverse, et celles qu'il a gagnees contre nous.
+    """
+    battles = build_battles(get_team_matches(ids, map_name=map_name, days=days))
+    games, wins = Counter(), Counter()
+    enemy_games, enemy_wins = Counter(), Counter()
+    for bt, players in battles.items():
+        result = None
+        for b, r in players.values():
+            games[b] += 1
+            result = r
+            if r == 'victory':
+                wins[b] += 1
+        for e in battles.team(bt)[1]:
+            enemy_games[e] += 1
+            if result == 'defeat':
+                enemy_wins[e] += 1
+    return battles, games, wins, enemy_games, enemy_wins, sorted(games)
+
+@bot.command(name='picks')
+@profiled('picks')
+async def command_picks(ctx, id1: str, id2: str, id3: str, *, draft: str):
+    logging.info(f"Command {BOT_PREFIX}picks from {ctx.author.name}: {id1} {id2} {id3} | {draft}")
+    try:
+        start = time.monotonic()
+        ids = {normalize_tag(id1), normalize_tag(id2), normalize_tag(id3)}
+        map_name, bans, enemies, allies = parse_draft_args(draft)
+        if not map_name:
+            await ctx.send(f"Usage : `{BOT_PREFIX}picks #ID1 #ID2 #ID3 <map> | ban: X Y | enemy: Z | ally: W`")
+            return
+
+        # PICKS_BUDGET_MS borne toute la commande (store froid, agregation, fit, scoring).
+        # Une etape en retard continue en fond (resultat en cache / memoire chargee pour
+        # le prochain appel) et on repond avec le winrate prudent (Wilson).
+        loop = asyncio.get_running_loop()
+        deadline = start + PICKS_BUDGET_MS / 1000
+        left = lambda: max(0.0, deadline - time.monotonic())
+        taken = set(bans) | set(enemies) | set(allies)
+        model_info = None
+
+        prep = loop.run_in_executor(data_pool, run_in_context(prepare_draft, ids, map_name))
+        prep.add_done_callback(_ignore_result)
+        try:
+            draft_data = await asyncio.wait_for(asyncio.shield(prep), timeout=left())
+        except asyncio.TimeoutError:
+            draft_data = None
+
+        if draft_data is not None:
+            battles, games, wins, enemy_games, enemy_wins, all_brawlers = draft_data
+            volume = f"{len(battles)} parties"
+        else:
+            # memoire froide / agregation lente : compteurs pre-agreges, sans compositions
+            if not match_repo.stats_ready():
+                await ctx.send("Donnees en cours de chargement, reessaie dans quelques secondes.")
+                return
+            games, wins, nb_rows = await run_blocking(match_repo.brawler_stats, map_name, DRAFT_DAYS, ids,
+                                                      command='picks')
+            battles, enemy_games, enemy_wins, all_brawlers = None, Counter(), Counter(), sorted(games)
+            allies, enemies = [], []   # synergies / contres inconnus sans les parties
+            volume = f"{nb_rows} lignes"
+        if not games:
+            await ctx.send(f"Aucune donnee (Ranked/tournoi) pour ce trio sur **{map_name}** sur {DRAFT_DAYS} jours.")
+            return
+
+        score = lambda model_info: (
+            suggest_bans(model_info, taken, games, wins, enemy_games, enemy_wins, allies, enemies),
+            suggest_picks(model_info, battles, all_brawlers, allies, taken, games, wins, enemies))
+        if battles:
+            build = lambda prev: train_model(battles_to_samples(battles), warm_from=prev)
+            fit = loop.run_in_executor(
+                data_pool, run_in_context(draft_models.get, ids, map_name, DRAFT_DAYS, build))
+            fit.add_done_callback(_ignore_result)
+            try:
+                model_info = await asyncio.wait_for(asyncio.shield(fit), timeout=left())
+                if model_info:
+                    ban_list, pick_list = await run_blocking(score, model_info, timeout=left())
+            except asyncio.TimeoutError:
+                model_info = None
+        if not model_info:
+            ban_list, pick_list = await run_blocking(score, None, command='picks')
+
+        embed = discord.Embed(title=f"Draft - {map_name}", color=discord.Color.from_rgb(255, 69, 0))
+        embed.add_field(name="Bans conseilles",
+                        value="\n".join(f"{i}. {b} — {sc*100:.0f}% ({g}g)" for i, (sc, b, g) in enumerate(ban_list, 1)) or "—",
+                        inline=False)
+        context = [f"avec {', '.join(allies)}"] * bool(allies) + [f"contre {', '.join(enemies)}"] * bool(enemies)
+        embed.add_field(name="Picks conseilles" + (f" ({' ; '.join(context)})" if context else ""),
+                        value="\n".join(f"{i}. {b} — score {sc:.2f} ({g}g)" for i, (sc, b, g) in enumerate(pick_list, 1)) or "—",
+                        inline=False)
+        source = "modele ML" if model_info else "winrate prudent (Wilson)"
+        embed.set_footer(text=f"{source} | {volume} sur {DRAFT_DAYS} jours | "
+                              f"{(time.monotonic() - start) * 1000:.0f} ms | Demande par {ctx.author.name}")
+        await ctx.send(embed=embed)
+    except asyncio.TimeoutError:
+        await ctx.send(TIMEOUT_MSG)
+    except Exception as e:
+        logging.error(f"Error in picks: {e}")
+        await ctx.send("Une erreur s'est produite dans !picks.")
+
+
+# ===========================================================================
+#  COMMANDE COMPARE (corrigee)
+# ===========================================================================
+@bot.command(name='compare')
+@profiled('compare')
+async def command_compare(ctx, id1: str, id2: str, id3: str, *, map_name: str):
+    logging.info(f"Command {BOT_PREFIX}compare from {ctx.author.name}: {id1}, {id2}, {id3}, {map_name}")
+    try:
+        # liste des joueurs : jamais invalidee par un scrape, seulement par le TTL
+        players = await cached_query('players', get_players, tags=frozenset(), phase='fetch')
+        sheet_players = {normalize_tag(t) for t in players}
+        ids = {normalize_tag(id1), normalize_tag(id2), normalize_tag(id3)}
+        missing = [i for i in ids if i not in sheet_players]
+        if missing:
+            await ctx.send(f"ID introuvable(s) dans la feuille Players : {', '.join(missing)}")
+            return
+
+        # compteurs pre-agreges (buckets journaliers) : pas de relecture des lignes
+        games, wins, nb_rows = await cached_query('compare', match_repo.brawler_stats, map_name, 30, ids,
+                                                  tags=ids, map_name=map_name, days=30)
+        if not nb_rows:
+            await ctx.send(f"Aucune partie (Ranked/tournoi) pour ce trio sur **{map_name}** sur 30 jours. "
+                           f"Verifie avec `!debug` ou `!main {map_name}`.")
+            return
+
+        if not games:
+            await ctx.send("Aucune partie valide (BrawlerName / Result manquants).")
+            return
+
+        embed = discord.Embed(title=f"Top 15 Brawlers on {map_name}", color=discord.Color.from_rgb(255, 69, 0))
+        embed.set_footer(text=f"Requested by {ctx.author.name} at {datetime.datetime.now().strftime('%H:%M:%S %d/%m/%Y')}")
+        for i, (brawler, total) in enumerate(games.most_common(15), 1):
+            w = wins.get(brawler, 0)
+            wr = (w / total * 100) if total else 0
+            embed.add_field(name=f"{i}. {brawler}", value=f"Used {total} times | Winrate: {wr:.1f}% ({w} wins)", inline=False)
+        await ctx.send(embed=embed)
+    except asyncio.TimeoutError:
+        await ctx.send(TIMEOUT_MSG)
+    except Exception as e:
+        logging.error(f"Error in compare: {e}")
+        await ctx.send("Une erreur s'est produite dans la commande.")
+
+
+# ===========================================================================
+#  COMMANDE MAIN
+# ===========================================================================
+@bot.command(name='main')
+@profiled('main')
+async def command_main(ctx, *, map_name: str):
+    logging.info(f"Command {BOT_PREFIX}main from {ctx.author.name}: {map_name}")
+    try:
+        brawler_count = await cached_query('main', match_repo.brawler_usage, map_name, 15,
+                                           map_name=map_name, days=15)
+        if not brawler_count:
+            await ctx.send('No matches found for this map in the last 15 days (Ranked/tournois uniquement).')
+            return
+        embed = discord.Embed(title=f"Top 15 Brawlers on {map_name} (last 15 days)", color=discord.Color.from_rgb(255, 69, 0))
+        embed.set_footer(text=f"Requested by {ctx.author.name} at {datetime.datetime.now().strftime('%H:%M:%S %d/%m/%Y')}")
+        for i, (brawler, count) in enumerate(brawler_count.most_common(15), 1):
+            embed.add_field(name=f"{i}. {brawler}", value=f"Used {count} times", inline=False)
+        await ctx.send(embed=embed)
+    except asyncio.TimeoutError:
+        await ctx.send(TIMEOUT_MSG)
+    except Exception as e:
+        logging.error(f"Error in main: {e}")
+        await ctx.send("Une erreur s'est produite dans la commande.")
+
+
+boot_phase('commandes')
+
+
+if __name__ == '__main__':
+    keep_alive()
+    bot.run(DISCORD_TOKEN)
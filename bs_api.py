@@ -0,0 +1,287 @@
+"""
+Client async de l'API Brawl Stars : recupere les battlelogs de tous les joueurs
+en parallele, avec
+  - une seule session aiohttp (connexions keep-alive reutilisees),
+  - un nombre de requetes simultanees borne,
+  - un token bucket cale sur le quota de l'API, unique pour tout le process
+    (workers de job_queue, threads de start.py, !inspect : un seul budget).
+fetch_battlelogs() est la version synchrone, a appeler depuis un thread/executor.
+
+Les reponses sont gardees dans un cache partage, indexe par URL (ResponseCache) :
+  - une reponse encore fraiche (Cache-Control max-age) est servie sans appel API,
+  - une reponse expiree est revalidee par If-None-Match (ETag) : un 304 ne coute
+    pas de nouveau telechargement,
+  - LRU borne en memoire + tier disque optionnel (BS_CACHE_DIR), partage avec
+    les scripts lances dans d'autres process (data.py).
+!inspect (get_battlelog) et les scrapers passent tous par ce cache.
+"""
+import os
+import re
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import threading
+from collections import OrderedDict, namedtuple
+import aiohttp
+import requests
+from sheets_writer import parse_retry_after
+from metrics import registry, bs_api_requests, bs_api_throttle_wait, rate_limited, export_cache
+
+API_URL = 'https://api.brawlstars.com/v1'
+
+MAX_CONCURRENCY = int(os.getenv('BS_CONCURRENCY', '10'))   # requetes en vol au maximum
+RATE_PER_SECOND = float(os.getenv('BS_RATE', '10'))        # debit moyen autorise (req/s)
+RATE_BURST = int(os.getenv('BS_BURST', '10'))              # rafale autorisee
+REQUEST_TIMEOUT = 20
+MAX_RETRIES = 2   # nouvelles tentatives sur 429 / 5xx
+CACHE_SIZE = int(os.getenv('BS_CACHE_SIZE', '512'))   # reponses gardees en memoire
+CACHE_DIR = os.getenv('BS_CACHE_DIR', '')              # '' = pas de tier disque
+
+
+# ===========================================================================
+#  CACHE DES REPONSES (Cache-Control + ETag)
+# ===========================================================================
+_MAX_AGE = re.compile(r'max-age=(\d+)')
+
+
+def _cache_lifetime(headers):
+    """Secondes de fraicheur annoncees par Cache-Control (0 si absent / no-cache)."""
+    cc = (headers.get('Cache-Control') or '').lower()
+    if 'no-store' in cc or 'no-cache' in cc:
+        return 0
+    m = _MAX_AGE.search(cc)
+    return int(m.group(1)) if m else 0
+
+
+class ResponseCache:
+    """URL -> {body, etag, expires} ; LRU borne en memoire, recopie optionnelle sur disque."""
+
+    def __init__(self, maxsize=CACHE_SIZE, directory=CACHE_DIR):
+        self.maxsize = maxsize
+        self.directory = directory
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.revalidated = self.misses = 0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, url):
+        return os.path.join(self.directory, hashlib.sha1(url.encode()).hexdigest() + '.json')
+
+    def _get(self, url):
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is not None:
+                self._entries.move_to_end(url)
+                return entry
+        if not self.directory:
+            return None
+        try:
+            with open(self._path(url), encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        self._put(url, entry, persist=False)
+        return entry
+
+    def _put(self, url, entry, persist=True):
+        with self._lock:
+            self._entries[url] = entry
+            self._entries.move_to_end(url)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        if persist and self.directory:
+            path = self._path(url)
+            try:
+                with open(path + '.tmp', 'w', encoding='utf-8') as f:
+                    json.dump(entry, f)
+                os.replace(path + '.tmp', path)
+            except OSError as e:
+                logging.warning(f"Cache API: ecriture disque impossible: {e}")
+
+    def fresh(self, url):
+        """Corps en cache s'il est encore frais, sinon None."""
+        entry = self._get(url)
+        if entry is not None and entry['expires'] > time.time():
+            self.hits += 1
+            return entry['body']
+        return None
+
+    def validator(self, url):
+        """En-tetes conditionnels pour revalider l'entree expiree (If-None-Match)."""
+        entry = self._get(url)
+        if entry is not None and entry.get('etag'):
+            return {'If-None-Match': entry['etag']}
+        return {}
+
+    def store(self, url, body, headers):
+        self.misses += 1
+        self._put(url, {'body': body, 'etag': headers.get('ETag'),
+                        'expires': time.time() + _cache_lifetime(headers)})
+
+    def revalidate(self, url, headers):
+        """304 : l'entree reste valable, sa fraicheur est prolongee. Retourne le corps."""
+        entry = self._get(url)
+        if entry is None:
+            return None
+        self.revalidated += 1
+        entry = dict(entry, expires=time.time() + _cache_lifetime(headers))
+        self._put(url, entry)
+        return entry['body']
+
+    def stats(self):
+        with self._lock:
+            size = len(self._entries)
+        return {'size': size, 'hits': self.hits, 'revalidated': self.revalidated, 'misses': self.misses}
+
+
+response_cache = ResponseCache()
+
+
+@registry.collector
+def _export_cache_stats():
+    s = response_cache.stats()
+    export_cache('bs_api', s['hits'], s['misses'], s['revalidated'])
+
+
+def _count_response(status):
+    bs_api_requests.inc(status=status)
+    if status == 429:
+        rate_limited.inc(backend='bs_api')
+
+
+class TokenBucket:
+    """
+    Limiteur de debit : `rate` jetons/s, au plus `capacity` en reserve.
+    Thread-safe, utilisable depuis plusieurs event loops (un asyncio.run par scrape)
+    et depuis du code synchrone : chaque appelant reserve son jeton sous verrou
+    (solde eventuellement negatif) puis attend son tour hors verrou.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self):
+        """Prend un jeton ; retourne l'attente (s) avant de pouvoir l'utiliser."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait:
+            bs_api_throttle_wait.inc(wait)
+        return wait
+
+    async def acquire(self):
+        wait = self._reserve()
+        if wait:
+            await asyncio.sleep(wait)
+
+    def acquire_sync(self):
+        wait = self._reserve()
+        if wait:
+            time.sleep(wait)
+
+
+# Budget unique du process : tous les appels a l'API passent par ce limiteur
+rate_limiter = TokenBucket(RATE_PER_SECOND, RATE_BURST)
+
+
+def battlelog_url(tag):
+    return f"{API_URL}/players/%23{tag.strip().lstrip('#').upper()}/battlelog"
+
+
+async def _fetch_battlelog(session, bucket, sem, player, cache=response_cache):
+    """(player, items, erreur) pour un joueur ; l'erreur est None si tout va bien."""
+    url = battlelog_url(player)
+    body = cache.fresh(url)
+    if body is not None:
+        return player, body.get('items', []), None   # reponse encore fraiche : pas de quota depense
+    async with sem:
+        for attempt in range(MAX_RETRIES + 1):
+            await bucket.acquire()
+            try:
+                async with session.get(url, headers=cache.validator(url)) as resp:
+                    _count_response(resp.status)
+                    if resp.status == 304:
+                        body = cache.revalidate(url, resp.headers)
+                        if body is not None:
+                            return player, body.get('items', []), None
+                        return player, [], RuntimeError('304 sans reponse en cache')
+                    if resp.status == 429 or resp.status >= 500:
+                        if attempt < MAX_RETRIES:
+                            wait = parse_retry_after(resp.headers.get('Retry-After'))
+                            if wait is None:
+                                wait = 2 ** attempt   # absent ou illisible : backoff exponentiel
+                            logging.warning(f"API BS {resp.status} pour {player}, nouvel essai dans {wait:.0f}s")
+                            await asyncio.sleep(wait)
+                            continue
+                    resp.raise_for_status()
+                    data = await resp.json()
+                    cache.store(url, data, resp.headers)
+                    return player, data.get('items', []), None
+            except Exception as e:
+                if not isinstance(e, aiohttp.ClientResponseError):
+                    _count_response('error')   # timeout / connexion : pas de reponse comptee
+                return player, [], e
+    return player, [], RuntimeError('nombre de tentatives depasse')
+
+
+async def fetch_battlelogs_async(players, token, concurrency=MAX_CONCURRENCY, bucket=rate_limiter):
+    """Battlelogs de `players` en parallele -> liste de (player, items, erreur), dans l'ordre."""
+    if not players:
+        return []
+    sem = asyncio.Semaphore(concurrency)
+    connector = aiohttp.TCPConnector(limit=concurrency, ttl_dns_cache=300)
+    timeout = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+    headers = {'Authorization': f'Bearer {token}'}
+    async with aiohttp.ClientSession(headers=headers, connector=connector, timeout=timeout) as session:
+        return await asyncio.gather(*(_fetch_battlelog(session, bucket, sem, p) for p in players))
+
+
+def fetch_battlelogs(players, token, **kwargs):
+    """Version synchrone de fetch_battlelogs_async (boucle dediee, a lancer hors event loop)."""
+    start = time.monotonic()
+    results = asyncio.run(fetch_battlelogs_async(players, token, **kwargs))
+    logging.info(f"Battlelogs: {len(results)} joueurs en {time.monotonic() - start:.1f}s")
+    return results
+
+
+# ===========================================================================
+#  ACCES SYNCHRONE (commandes ponctuelles : !inspect)
+# ===========================================================================
+ApiResponse = namedtuple('ApiResponse', 'status data text cached')
+
+
+def get_json(url, token, cache=response_cache, timeout=15):
+    """GET synchrone via le cache partage -> ApiResponse (data = JSON si status 200)."""
+    body = cache.fresh(url)
+    if body is not None:
+        return ApiResponse(200, body, '', True)
+    headers = {'Authorization': f'Bearer {token}'}
+    rate_limiter.acquire_sync()
+    r = requests.get(url, headers=dict(headers, **cache.validator(url)), timeout=timeout)
+    _count_response(r.status_code)
+    if r.status_code == 304:
+        body = cache.revalidate(url, r.headers)
+        if body is not None:
+            return ApiResponse(200, body, '', True)
+        rate_limiter.acquire_sync()
+        r = requests.get(url, headers=headers, timeout=timeout)   # entree evincee entre-temps
+        _count_response(r.status_code)
+    if r.status_code != 200:
+        return ApiResponse(r.status_code, None, r.text, False)
+    data = r.json()
+    cache.store(url, data, r.headers)
+    return ApiResponse(200, data, '', False)
+
+
+def get_battlelog(tag, token):
+    return get_json(battlelog_url(tag), token)
@@ -0,0 +1,241 @@
+"""
+Index de dedoublonnage persistant des parties ecrites dans Matches.
+
+Une cle par ligne (PlayerTag, BattleTime), packee sur 64 bits :
+    id du tag << 32 | BattleTime en secondes epoch
+gardee dans un array('q') trie (8 octets par partie, recherche par bisection).
+  - charge depuis DEDUPE_INDEX_PATH au 1er acces ; si le fichier n'existe pas,
+    construit UNE fois depuis le depot (MatchRepository.keys), puis sauvegarde,
+  - mis a jour a chaque ecriture (MatchRepository.append), reduit a chaque purge
+    de retention, vide par !reset,
+  - ingest.dedupe_stage l'interroge : une partie deja ecrite n'est jamais
+    reecrite, meme si les watermarks sont perdus ou en retard, et les watermarks
+    manquants s'amorcent depuis l'index (plus de lecture complete de la feuille),
+  - claim / release : juste avant l'ecriture, chaque scrape reserve ses cles
+    sous verrou ; deux jobs concurrents qui ont lu la meme partie (coequipiers
+    suivis) ne l'ecrivent donc qu'une fois.
+Format du fichier : une ligne d'en-tete JSON (format, ordre des octets, tags)
+puis les cles brutes. Ecriture atomique (fichier temporaire + rename).
+"""
+import os
+import sys
+import json
+import time
+import heapq
+import logging
+import threading
+from array import array
+from bisect import bisect_left
+from battletime import parse_battle_time
+from metrics import registry, dedupe_index_keys
+
+DEDUPE_INDEX_PATH = os.getenv('DEDUPE_INDEX_PATH', 'dedupe_index.bin')   # '' = en memoire seulement
+DEDUPE_INDEX_FORMAT = 1
+_EPOCH_MASK = (1 << 32) - 1
+
+
+def _normalize_tag(t):
+    return '#' + str(t).strip().lstrip('#').upper()
+
+
+def _battle_time(epoch):
+    """Epoch (s) -> BattleTime au format de l'API ('20240101T120000.000Z')."""
+    return time.strftime('%Y%m%dT%H%M%S.000Z', time.gmtime(epoch))
+
+
+class DedupeIndex:
+    """Ensemble trie de cles (tag, BattleTime) packees (thread-safe)."""
+
+    def __init__(self, path=DEDUPE_INDEX_PATH):
+        self.path = path
+        self.loaded = False
+        self._lock = threading.Lock()
+        self._claimed = set()   # (tag, epoch) en cours d'ecriture : claim -> add + release
+        self._reset()
+
+    def _reset(self):
+        self._tags = []       # id -> tag normalise
+        self._tag_ids = {}    # tag normalise -> id
+        self._keys = array('q')
+
+    def __len__(self):
+        with self._lock:
+            self._load_file()
+            return len(self._keys)
+
+    # --- chargement ----------------------------------------------------------
+    def _load_file(self):
+        """Charge le fichier s'il existe (appele sous verrou). Retourne True si l'index est pret."""
+        if self.loaded:
+            return True
+        if not self.path or not os.path.exists(self.path):
+            return False
+        try:
+            with open(self.path, 'rb') as f:
+                header = json.loads(f.readline())
+                if header.get('format') != DEDUPE_INDEX_FORMAT:
+                    logging.info(f"Index de dedoublonnage {self.path} ignore (format {header.get('format')}).")
+                    return False
+                keys = array('q')
+                keys.frombytes(f.read())
+        except (OSError, ValueError) as e:
+            logging.error(f"Index de dedoublonnage illisible ({self.path}), reconstruction: {e}")
+            return False
+        if header.get('byteorder') != sys.byteorder:
+            keys.byteswap()
+        self._tags = list(header['tags'])
+        self._tag_ids = {t: i for i, t in enumerate(self._tags)}
+        self._keys = keys
+        self.loaded = True
+        logging.info(f"Index de dedoublonnage: {len(keys)} cles chargees.")
+        return True
+
+    def ensure_loaded(self, fetch_keys):
+        """
+        Index pret a l'emploi : depuis le fichier, sinon construit une seule fois
+        depuis `fetch_keys()` -> [(tag, BattleTime), ...] (ex. repository.keys).
+        """
+        with self._lock:
+            if self._load_file():
+                return self
+        keys = fetch_keys()
+        with self._lock:
+            if not self.loaded:
+                self._reset()
+                self._keys = array('q', sorted({k for k in map(self._pack_new, keys) if k is not None}))
+                self.loaded = True
+                logging.info(f"Index de dedoublonnage construit depuis le depot: {len(self._keys)} cles.")
+        self.save()
+        return self
+
+    # --- cles ----------------------------------------------------------------
+    def _pack(self, tag_id, bt):
+        epoch = parse_battle_time(bt)
+        if epoch is None or tag_id is None:
+            return None
+        return tag_id << 32 | (int(epoch) & _EPOCH_MASK)
+
+    def _pack_new(self, key):
+        """(tag, BattleTime) -> cle, en enregistrant le tag si besoin (sous verrou)."""
+        tag, bt = key
+        tag = _normalize_tag(tag)
+        tag_id = self._tag_ids.get(tag)
+        if tag_id is None:
+            tag_id = self._tag_ids[tag] = len(self._tags)
+            self._tags.append(tag)
+        return self._pack(tag_id, bt)
+
+    def _has(self, key):
+        i = bisect_left(self._keys, key)
+        return i < len(self._keys) and self._keys[i] == key
+
+    def contains(self, tag, bt):
+        """True si la partie (tag, BattleTime) est deja ecrite. Index absent : False."""
+        with self._lock:
+            if not self._load_file():
+                return False
+            key = self._pack(self._tag_ids.get(_normalize_tag(tag)), bt)
+            return key is not None and self._has(key)
+
+    def claim(self, keys):
+        """
+        Reserve atomiquement les (tag, BattleTime) ni ecrits ni deja reserves par un autre
+        scrape. Retourne une liste de booleens alignee sur `keys` (True = a ecrire).
+        A liberer par release() une fois l'ecriture finie (ajoutee a l'index) ou echouee.
+        """
+        out = []
+        with self._lock:
+            ready = self._load_file()
+            for tag, bt in keys:
+                tag = _normalize_tag(tag)
+                epoch = parse_battle_time(bt)
+                if epoch is None:
+                    out.append(True)   # illisible : rien a dedoublonner
+                    continue
+                claim = (tag, int(epoch))
+                key = self._pack(self._tag_ids.get(tag), bt) if ready else None
+                if (key is not None and self._has(key)) or claim in self._claimed:
+                    out.append(False)
+                    continue
+                self._claimed.add(claim)
+                out.append(True)
+        return out
+
+    def release(self, keys):
+        """Libere des cles reservees par claim()."""
+        with self._lock:
+            for tag, bt in keys:
+                epoch = parse_battle_time(bt)
+                if epoch is not None:
+                    self._claimed.discard((_normalize_tag(tag), int(epoch)))
+
+    def add(self, keys):
+        """
+        Ajoute des (tag, BattleTime) ecrits (fusion avec le tableau trie, O(n)).
+        Index pas encore construit : rien a faire, il le sera depuis le depot.
+        """
+        with self._lock:
+            if not self._load_file():
+                return 0
+            new = sorted({k for k in map(self._pack_new, keys) if k is not None and not self._has(k)})
+            if new:
+                self._keys = array('q', heapq.merge(self._keys, new))
+            return len(new)
+
+    def prune_before(self, cutoff):
+        """Oublie les parties d'epoch < cutoff (apres une purge de retention) ; tags sans partie retires."""
+        with self._lock:
+            if not self._load_file() or cutoff is None:
+                return
+            kept = [k for k in self._keys if (k & _EPOCH_MASK) >= cutoff]
+            if len(kept) == len(self._keys):
+                return
+            old_tags = self._tags
+            self._reset()
+            remap = {}
+            for k in kept:   # ordre des ids conserve : le tableau reste trie
+                tag_id = k >> 32
+                if tag_id not in remap:
+                    remap[tag_id] = len(self._tags)
+                    self._tag_ids[old_tags[tag_id]] = remap[tag_id]
+                    self._tags.append(old_tags[tag_id])
+                self._keys.append(remap[tag_id] << 32 | (k & _EPOCH_MASK))
+
+    def latest_battle_times(self):
+        """{tag: BattleTime le plus recent} (amorce les watermarks sans relire la feuille)."""
+        with self._lock:
+            if not self._load_file():
+                return {}
+            best = {}
+            for k in self._keys:   # trie par tag puis par date : la derniere cle d'un tag gagne
+                best[k >> 32] = k & _EPOCH_MASK
+            return {self._tags[t]: _battle_time(e) for t, e in best.items()}
+
+    def clear(self):
+        """Index vide mais pret (apres !reset : le depot est vide lui aussi)."""
+        with self._lock:
+            self._reset()
+            self.loaded = True
+
+    def save(self):
+        with self._lock:
+            if not self.path or not self.loaded:
+                return
+            header = {'format': DEDUPE_INDEX_FORMAT, 'byteorder': sys.byteorder, 'tags': self._tags}
+            tmp = self.path + '.tmp'
+            try:
+                with open(tmp, 'wb') as f:
+                    f.write(json.dumps(header).encode('utf-8') + b'\n')
+                    self._keys.tofile(f)
+                os.replace(tmp, self.path)
+            except OSError as e:
+                logging.error(f"Index de dedoublonnage: ecriture impossible ({self.path}): {e}")
+
+
+# Instance partagee (bot + threads de start.py dans le meme process)
+dedupe_index = DedupeIndex()
+
+
+@registry.collector
+def _export_dedupe_index():
+    dedupe_index_keys.set(len(dedupe_index._keys))
@@ -0,0 +1,57 @@
+"""
+Clients Google Sheets ouverts au premier usage.
+
+gspread.authorize / open_by_key / worksheet font des appels reseau : au lieu de
+les faire a l'import (et de retarder la connexion Discord si Google est lent),
+on manipule des LazyWorksheet, qui n'ouvrent la feuille qu'au premier appel
+de methode - depuis un thread de donnees, jamais depuis l'event loop.
+"""
+import logging
+import threading
+import time
+
+SCOPES = ['https://www.googleapis.com/auth/spreadsheets', 'https://www.googleapis.com/auth/drive']
+
+_spreadsheets = {}
+_lock = threading.Lock()
+
+
+def open_spreadsheet(sheet_id, credentials_file):
+    """Spreadsheet gspread partage (authentification faite une seule fois par feuille)."""
+    with _lock:
+        sheet = _spreadsheets.get(sheet_id)
+        if sheet is None:
+            import gspread
+            from google.oauth2 import service_account
+            t0 = time.perf_counter()
+            creds = service_account.Credentials.from_service_account_file(credentials_file, scopes=SCOPES)
+            sheet = gspread.authorize(creds).open_by_key(sheet_id)
+            _spreadsheets[sheet_id] = sheet
+            logging.info(f"Google Sheets ouvert en {time.perf_counter() - t0:.2f}s.")
+        return sheet
+
+
+class LazyWorksheet:
+    """Onglet `title` resolu au 1er acces d'attribut, puis delegue tel quel."""
+
+    def __init__(self, sheet_id, credentials_file, title):
+        self._sheet_id = sheet_id
+        self._credentials_file = credentials_file
+        self._title = title
+        self._worksheet = None
+        self._ws_lock = threading.Lock()
+
+    def resolve(self):
+        if self._worksheet is None:
+            with self._ws_lock:
+                if self._worksheet is None:
+                    sheet = open_spreadsheet(self._sheet_id, self._credentials_file)
+                    self._worksheet = sheet.worksheet(self._title)
+        return self._worksheet
+
+    def __getattr__(self, name):
+        return getattr(self.resolve(), name)
+
+    def __repr__(self):
+        state = 'ouvert' if self._worksheet is not None else 'non ouvert'
+        return f"<LazyWorksheet {self._title} ({state})>"
@@ -0,0 +1,263 @@
+"""
+Pipeline d'ingestion partage par bot1.py (!update / maj auto), data.py et start.py :
+
+    fetch -> parse -> filtre ladder -> coequipiers suivis -> extraction du brawler
+          -> dedoublonnage -> ecriture par lots
+
+Chaque etape est un generateur : les parties traversent la chaine une par une,
+la memoire reste plate, et l'ecriture se fait par lots via un `sink` fourni par
+l'appelant (MatchRepository.append en general).
+
+Les joueurs suivis jouent souvent ensemble : chaque partie donne une ligne pour
+CHAQUE joueur suivi present dans les equipes, pas seulement pour le battlelog lu.
+Ces parties sont notees comme couvertes dans les watermarks (sautees au prochain
+battlelog du coequipier) et signalees au scheduler, qui espace ses requetes.
+"""
+import logging
+from collections import Counter
+from bs_api import fetch_battlelogs
+from watermarks import watermarks
+from dedupe_index import dedupe_index
+from metrics import scrape_seconds, scrape_players, scrape_rows_added, scrape_rows_derived, scrape_ladder_skipped
+
+# /!\ Dans l'API Brawl Stars, "ranked" = LADDER. Le mode "Ranked" = soloRanked/teamRanked.
+LADDER_BATTLE_TYPES = {'ranked'}
+BATCH_SIZE = 500
+
+
+def normalize_tag(t):
+    """Uniformise un tag joueur en '#XXXX' majuscule (tolere espaces / # manquant)."""
+    return '#' + str(t).strip().lstrip('#').upper()
+
+
+def is_ladder_match(m):
+    """True si la ligne (dict Matches) est du LADDER (a exclure)."""
+    btype = str(m.get('BattleType', '')).strip().lower()
+    if btype:
+        return btype in LADDER_BATTLE_TYPES
+    raw = str(m.get('TrophyChange', '')).strip()
+    if not raw:
+        return False
+    try:
+        return int(float(raw)) != 0
+    except ValueError:
+        return False
+
+
+def extract_brawler(p):
+    """
+    Nom du brawler d'un joueur, en gerant les structures variables de l'API.
+    Retourne None pour les modes type Duels (champ 'brawlers' au pluriel) ou
+    toute structure inattendue -> la partie sera ignoree (hors 3v3).
+    """
+    br = p.get('brawler')
+    if isinstance(br, dict) and br.get('name'):
+        return br['name'].upper()
+    return None
+
+
+class IngestStats:
+    """Compteurs d'un passage : lignes ajoutees, ladder ignore, types, marks a avancer."""
+
+    def __init__(self):
+        self.added = 0
+        self.skipped = 0
+        self.types = Counter()
+        self.newest = {}   # tag -> BattleTime le plus recent traite
+        self.derived = {}  # tag -> {BattleTime: tag du battlelog lu} (lignes de coequipiers)
+
+    def result(self):
+        return self.added, self.skipped, dict(self.types)
+
+
+# --- Etapes ------------------------------------------------------------------
+def fetch_stage(players, token):
+    """(tag, battlelog) par joueur ; les erreurs HTTP sont journalisees et sautees."""
+    for player, battles, err in fetch_battlelogs(players, token):
+        if err is not None:
+            logging.error(f"ingest: erreur HTTP pour {player}: {err}")
+            scrape_players.inc(outcome='error')
+            continue
+        scrape_players.inc(outcome='ok')
+        yield normalize_tag(player), battles
+
+
+def parse_stage(fetched, stats, marks=watermarks, observer=None):
+    """
+    (tag, battle) nouvelles seulement : arret a la 1ere partie deja traitee du battlelog,
+    parties deja ecrites via un coequipier sautees.
+    `observer(tag, battles, nb_nouvelles, nb_couvertes)` est appele une fois le
+    battlelog parcouru (rythme de jeu pour le scheduler).
+    """
+    for tag, battles in fetched:
+        new = covered = 0
+        already = marks.covered(tag)
+        for battle in marks.new_battles(tag, battles):
+            bt = battle.get('battleTime')
+            if not bt:
+                continue
+            new += 1
+            stats.newest.setdefault(tag, bt)
+            if bt in already:
+                covered += 1
+                continue
+            yield tag, battle
+        if observer is not None:
+            observer(tag, battles, new, covered)
+
+
+def ladder_filter(items, stats):
+    """Ecarte le ladder : type "ranked" (3v3) OU toute partie a trophees (showdown ladder inclus)."""
+    for tag, battle in items:
+        bd = battle.get('battle', {})
+        if str(bd.get('type', '')).lower() in LADDER_BATTLE_TYPES or bd.get('trophyChange', 0) != 0:
+            stats.skipped += 1
+            continue
+        yield tag, battle
+
+
+def _battle_players(bd):
+    """Tous les joueurs d'une partie (equipes ou liste simple selon le mode)."""
+    if 'teams' in bd:
+        return [p for team in bd['teams'] for p in team]
+    return list(bd.get('players', []))
+
+
+def teammates_stage(items, tracked, stats, marks=watermarks):
+    """
+    Ajoute, pour chaque partie, les autres joueurs suivis qui y figurent : une partie
+    jouee par 3 joueurs suivis donne ses 3 lignes avec un seul battlelog. Seuls les
+    joueurs deja scrapes (mark connu) sont derives : le 1er passage d'un joueur
+    lit tout son battlelog.
+    """
+    for tag, battle in items:
+        yield tag, battle
+        bt = battle.get('battleTime')
+        for p in _battle_players(battle.get('battle', {})):
+            other = normalize_tag(p.get('tag', ''))
+            if other == tag or other not in tracked or bt in stats.derived.get(other, ()):
+                continue
+            if marks.get(other) is None or marks.is_known(other, bt):
+                continue
+            stats.derived.setdefault(other, {})[bt] = tag
+            yield other, battle
+
+
+def _find_player(bd, tag):
+    """(joueur, coequipiers, adversaires) ; adversaires vides hors modes a equipes."""
+    if 'teams' in bd:
+        for k, team in enumerate(bd['teams']):
+            for p in team:
+                if normalize_tag(p.get('tag', '')) == tag:
+                    enemies = [q for j, other in enumerate(bd['teams']) if j != k for q in other]
+                    return p, [q for q in team if q is not p], enemies
+    elif 'players' in bd:
+        for p in bd['players']:
+            if normalize_tag(p.get('tag', '')) == tag:
+                return p, [], []
+    return None, [], []
+
+
+def _brawler_list(players):
+    """'BRAWLER1,BRAWLER2' (structures inattendues ignorees)."""
+    return ','.join(b for b in (extract_brawler(p) for p in players) if b)
+
+
+def row_stage(items):
+    """Ligne Matches par partie : brawler du joueur + compositions des deux equipes (modes hors 3v3 ignores)."""
+    for tag, battle in items:
+        try:
+            event = battle.get('event', {})
+            emap = event.get('map')
+            if not emap:
+                continue
+            bd = battle.get('battle', {})
+            p, allies, enemies = _find_player(bd, tag)
+            brawler = extract_brawler(p) if p else None
+            if not brawler:
+                continue  # mode hors 3v3 (Duels...) ou structure inattendue -> ignore
+            yield [tag, battle['battleTime'], event.get('mode', ''), emap, brawler,
+                   bd.get('result', ''), str(bd.get('trophyChange', 0)), bd.get('type', ''),
+                   _brawler_list(allies), _brawler_list(enemies)]
+        except Exception as e:
+            logging.error(f"ingest: bataille ignoree pour {tag}: {e}")
+
+
+def dedupe_stage(rows, seen=None, index=None):
+    """Ecarte les (PlayerTag, BattleTime) deja vus pendant ce passage ou deja dans `index`."""
+    seen = set() if seen is None else seen
+    for row in rows:
+        key = (row[0], row[1])
+        if key in seen or (index is not None and index.contains(*key)):
+            continue
+        seen.add(key)
+        yield row
+
+
+def batches(rows, size=BATCH_SIZE):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# --- Pipeline complet ----------------------------------------------------------
+def merge_results(results):
+    """Somme de plusieurs (added, skipped, types) (jobs de scrape rejoints)."""
+    added, skipped, types = 0, 0, Counter()
+    for a, s, t in results:
+        added += a
+        skipped += s
+        types.update(t)
+    return added, skipped, dict(types)
+
+
+def run_ingest(players, token, sink, marks=watermarks, batch_size=BATCH_SIZE, observer=None,
+               tracked=None, on_covered=None, index=dedupe_index):
+    """
+    Scrape `players` et ecrit les nouvelles parties non-ladder via sink(lot de lignes).
+    `tracked` : tous les tags suivis (par defaut `players`), dont les lignes sont
+    tirees des battlelogs des coequipiers ; on_covered(tag, tag_du_battlelog) est
+    appele pour chaque joueur couvert ainsi. `index` : parties deja ecrites
+    (dedupe_index.py), jamais reecrites meme si les marks sont en retard.
+    Les marks ne sont avances qu'une fois tout ecrit. Retourne (added, skipped, types).
+    """
+    stats = IngestStats()
+    tracked = {normalize_tag(t) for t in (players if tracked is None else tracked)}
+    with scrape_seconds.time():
+        parsed = parse_stage(fetch_stage(players, token), stats, marks, observer)
+        items = teammates_stage(ladder_filter(parsed, stats), tracked, stats, marks)
+        rows = dedupe_stage(row_stage(items), index=index)
+        for batch in batches(rows, batch_size):
+            if index is not None:
+                # reservation atomique : un job concurrent (coequipier suivi) a pu lire la meme partie
+                claimed = index.claim([(r[0], r[1]) for r in batch])
+                batch = [r for r, ok in zip(batch, claimed) if ok]
+                if not batch:
+                    continue
+                try:
+                    sink(batch)   # le depot ajoute les cles a l'index avant leur liberation
+                finally:
+                    index.release([(r[0], r[1]) for r in batch])
+            else:
+                sink(batch)
+            types = Counter(r[7] for r in batch)
+            stats.added += len(batch)
+            stats.types.update(types)
+            for btype, n in types.items():
+                scrape_rows_added.inc(n, battle_type=btype)
+        scrape_ladder_skipped.inc(stats.skipped)
+
+        for tag, bt in stats.newest.items():
+            marks.advance(tag, bt)
+        for tag, derived in stats.derived.items():
+            marks.cover(tag, derived)   # apres advance : celles deja sous le mark sont ignorees
+            scrape_rows_derived.inc(len(derived))
+            if on_covered is not None:
+                on_covered(tag, next(iter(derived.values())))
+        marks.save()
+    return stats.result()
@@ -0,0 +1,160 @@
+"""
+File de jobs partagee par le bot et start.py (meme process) : remplace le
+drapeau _scrape_in_progress de bot1.py et le sheet_lock de start.py.
+
+  - chaque job couvre un ensemble de cles (tags joueurs, ou une cle speciale
+    comme 'retention') ; une cle deja en file ou en cours n'est jamais relancee :
+    le demandeur rejoint le job existant,
+  - priorite : MANUAL (commande Discord) passe avant AUTO (maj planifiee) ; un
+    job auto rejoint par une demande manuelle est promu,
+  - un pool borne de workers (JOB_WORKERS threads) execute les jobs,
+  - submit() renvoie un concurrent.futures.Future : asyncio.wrap_future() le
+    rend awaitable depuis le bot.
+"""
+import os
+import heapq
+import logging
+import itertools
+import threading
+from concurrent.futures import Future
+
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '2'))
+MANUAL, AUTO = 0, 1
+
+
+class _Job:
+    __slots__ = ('priority', 'seq', 'keys', 'run', 'future', 'running')
+
+    def __init__(self, priority, seq, keys, run):
+        self.priority = priority
+        self.seq = seq
+        self.keys = keys
+        self.run = run
+        self.future = Future()
+        self.running = False
+
+
+def _gather(futures, combine):
+    """Future unique resolu quand tous `futures` le sont (resultats passes a `combine`)."""
+    if len(futures) == 1 and combine is None:
+        return futures[0]
+    out = Future()
+    remaining = [len(futures)]
+    lock = threading.Lock()
+
+    def done(_):
+        with lock:
+            remaining[0] -= 1
+            if remaining[0]:
+                return
+        if out.done():   # annule par le demandeur entre-temps
+            return
+        if any(f.cancelled() for f in futures):
+            out.cancel()
+            return
+        errors = [f.exception() for f in futures if f.exception() is not None]
+        if errors:
+            out.set_exception(errors[0])
+        else:
+            results = [f.result() for f in futures]
+            out.set_result(combine(results) if combine else results)
+
+    for f in futures:
+        f.add_done_callback(done)
+    return out
+
+
+class JobQueue:
+    """Jobs dedoublonnes par cle, par priorite, executes par un pool de workers borne."""
+
+    def __init__(self, workers=JOB_WORKERS):
+        self.workers = workers
+        self._heap = []                  # (priorite, seq, job) ; entrees perimees ignorees
+        self._by_key = {}                # cle -> job en file ou en cours
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._threads = []
+
+    def submit(self, keys, run, priority=AUTO, combine=None):
+        """
+        Programme run(liste de cles) pour les cles pas encore couvertes ; les autres
+        rejoignent le job qui les traite deja. Retourne un Future (resultat de
+        combine(resultats des jobs concernes), ou le resultat du job s'il est unique).
+        """
+        with self._cond:
+            self._start_workers()
+            joined, fresh = [], []
+            for key in dict.fromkeys(keys):
+                job = self._by_key.get(key)
+                if job is not None and job.future.cancelled():
+                    self._forget(job)   # annule avant de tourner : la cle est relancee
+                    job = None
+                if job is None:
+                    fresh.append(key)
+                    continue
+                if job not in joined:
+                    joined.append(job)
+                if not job.running and priority < job.priority:
+                    job.priority = priority   # promu : nouvelle entree, l'ancienne sera ignoree
+                    heapq.heappush(self._heap, (priority, job.seq, job))
+            if fresh:
+                job = _Job(priority, next(self._seq), fresh, run)
+                for key in fresh:
+                    self._by_key[key] = job
+                heapq.heappush(self._heap, (priority, job.seq, job))
+                joined.append(job)
+                self._cond.notify()
+            if not joined:
+                done = Future()
+                done.set_result(combine([]) if combine else [])
+                return done
+            return _gather([job.future for job in joined], combine)
+
+    def depth(self):
+        """(jobs en file, jobs en cours)."""
+        with self._cond:
+            jobs = set(self._by_key.values())
+            running = sum(1 for j in jobs if j.running)
+            return len(jobs) - running, running
+
+    def _start_workers(self):
+        while len(self._threads) < self.workers:
+            t = threading.Thread(target=self._work, name=f'jobs-{len(self._threads)}', daemon=True)
+            self._threads.append(t)
+            t.start()
+
+    def _forget(self, job):
+        """Libere les cles de `job` (sous self._cond)."""
+        for key in job.keys:
+            if self._by_key.get(key) is job:
+                del self._by_key[key]
+
+    def _next_job(self):
+        with self._cond:
+            while True:
+                while self._heap:
+                    priority, _, job = heapq.heappop(self._heap)
+                    if job.running or priority != job.priority:
+                        continue   # entree perimee (job promu ou deja pris)
+                    if not job.future.set_running_or_notify_cancel():
+                        self._forget(job)   # annule avant de tourner : ses cles ne pointent plus sur lui
+                        continue
+                    job.running = True
+                    return job
+                self._cond.wait()
+
+    def _work(self):
+        while True:
+            job = self._next_job()
+            try:
+                job.future.set_result(job.run(job.keys))
+            except Exception as e:
+                logging.error(f"Job {job.keys[:3]}{'...' if len(job.keys) > 3 else ''} en echec: {e}")
+                job.future.set_exception(e)
+            finally:
+                with self._cond:
+                    self._forget(job)
+
+
+# Instance partagee (bot + threads de start.py dans le meme process)
+job_queue = JobQueue()
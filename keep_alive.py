@@ -1,5 +1,6 @@
-from flask import Flask
+from flask import Flask, Response
 from threading import Thread 
+from metrics import registry, CONTENT_TYPE
 
 app = Flask('')
 
@@ -7,6 +8,10 @@ app = Flask('')
 def home():
     return "Red Panda is eating bamboo"
 
+@app.route('/metrics')
+def metrics():
+    return Response(registry.render(), content_type=CONTENT_TYPE)
+
 def run():
     app.run(host='0.0.0.0', port = 8080)
     
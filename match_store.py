@@ -0,0 +1,311 @@
+"""
+Stockage en memoire de la feuille Matches, sous forme colonnaire.
+
+La feuille est lue UNE fois (get_all_values), puis chaque colonne est gardee
+dans un `array` compact :
+  - chaines internees (brawler / map / mode / type...) -> entiers
+  - tags joueurs normalises -> entiers
+  - BattleTime pre-parse en epoch (secondes UTC)
+Les commandes interrogent ensuite la memoire au lieu de re-telecharger la feuille,
+et scrape_once y ajoute les lignes qu'il ecrit.
+"""
+import logging
+import threading
+from array import array
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from battletime import parse_battle_time, cutoff_epoch, rows_after
+
+BASE_HEADER = ['PlayerTag', 'BattleTime', 'EventMode', 'EventMap',
+               'BrawlerName', 'Result', 'TrophyChange', 'BattleType']
+# Compositions completes : coequipiers (hors joueur) et adversaires, "BRAWLER1,BRAWLER2"
+TEAM_COLUMNS = ['Allies', 'Enemies']
+MATCHES_HEADER = BASE_HEADER + TEAM_COLUMNS
+
+# Modes exclus par defaut des stats (meme regle que les commandes)
+EXCLUDED_MODES = ('solo showdown', 'duo showdown')
+
+def _normalize_tag(t):
+    return '#' + str(t).strip().lstrip('#').upper()
+
+
+class _Vocab:
+    """Table d'internement chaine <-> entier (une par colonne)."""
+
+    def __init__(self):
+        self.values = []
+        self.ids = {}
+
+    def add(self, s):
+        i = self.ids.get(s)
+        if i is None:
+            i = len(self.values)
+            self.ids[s] = i
+            self.values.append(s)
+        return i
+
+    def __len__(self):
+        return len(self.values)
+
+
+class MatchStore:
+    """
+    Copie colonnaire de la feuille Matches.
+    `is_ladder` : fonction(dict) -> bool, evaluee une seule fois par couple
+    (BattleType, TrophyChange) distinct.
+    """
+
+    def __init__(self, is_ladder):
+        self._is_ladder = is_ladder
+        self._lock = threading.RLock()
+        self.loaded = False
+        self._reset()
+
+    def _reset(self):
+        self.columns = list(MATCHES_HEADER)
+        self._tags = _Vocab()
+        self._times = _Vocab()     # BattleTime brut (partage par les coequipiers)
+        self._strings = _Vocab()   # mode / map / brawler / result / trophees / type
+        self.tag = array('i')
+        self.battle_time = array('i')
+        self.epoch = array('d')
+        self.mode = array('i')
+        self.map = array('i')
+        self.brawler = array('i')
+        self.result = array('i')
+        self.trophy = array('i')
+        self.btype = array('i')
+        self.allies = array('i')
+        self.enemies = array('i')
+        self.ladder = array('b')
+        self._ladder_cache = {}
+        self._by_map = defaultdict(lambda: array('i'))   # map en minuscules -> indices
+        self._by_tag = defaultdict(lambda: array('i'))   # id de tag -> indices
+
+    def __len__(self):
+        return len(self.tag)
+
+    # --- chargement / ajout ------------------------------------------------
+    def load(self, values):
+        """(Re)charge depuis get_all_values() : 1ere ligne = en-tete."""
+        with self._lock:
+            self._reset()
+            if values:
+                header = [str(h).strip() for h in values[0]]
+                if header[:1] == ['PlayerTag']:
+                    self.columns = header
+                    values = values[1:]
+                self.extend(values)
+            self.loaded = True
+            logging.info(f"MatchStore: {len(self)} lignes chargees.")
+
+    def ensure_loaded(self, fetch_values):
+        """Charge la feuille au premier appel seulement (`fetch_values` -> get_all_values)."""
+        if self.loaded:
+            return self
+        with self._lock:
+            if not self.loaded:
+                self.load(fetch_values())
+        return self
+
+    def clear(self):
+        with self._lock:
+            self._reset()
+            self.loaded = True
+
+    def prune_before(self, cutoff):
+        """Oublie les lignes dont l'epoch est < cutoff (apres une purge de la feuille)."""
+        with self._lock:
+            keep = rows_after(self.epoch, cutoff - 1e-6)
+            if len(keep) != len(self):
+                self._keep_rows(keep)
+
+    def drop_head(self, n):
+        """
+        Oublie les n premieres lignes (haut de feuille purge par un autre process).
+        Sur place : colonnes tronquees, index decales ; les vocabulaires sont gardes.
+        """
+        with self._lock:
+            n = min(n, len(self))
+            if n <= 0:
+                return
+            for name in self._ARRAYS:
+                del getattr(self, name)[:n]
+            for index in (self._by_map, self._by_tag):
+                for key, rows in list(index.items()):
+                    cut = bisect_left(rows, n)   # indices croissants (ajout en fin)
+                    if cut == len(rows):
+                        del index[key]
+                    else:
+                        index[key] = array('i', [i - n for i in rows[cut:]])
+
+    def _keep_rows(self, keep):
+        columns = self.columns
+        kept = [self.row(i) for i in keep]
+        self._reset()
+        self.extend([[m[c] for c in MATCHES_HEADER] for m in kept], MATCHES_HEADER)
+        self.columns = columns
+
+    def extend(self, rows, columns=None):
+        """Ajoute des lignes (listes de valeurs dans l'ordre de `columns`, par defaut celui de la feuille)."""
+        pos = {c: i for i, c in enumerate(columns or self.columns)}
+        cols = [pos.get(c) for c in MATCHES_HEADER]
+        with self._lock:
+            for row in rows:
+                vals = [str(row[c]).strip() if c is not None and c < len(row) else '' for c in cols]
+                if not vals[0]:
+                    continue
+                self._append(*vals)
+
+    def _append(self, tag, bt, mode, emap, brawler, result, trophy, btype, allies, enemies):
+        s = self._strings
+        i = len(self.tag)
+        tag_id = self._tags.add(_normalize_tag(tag))
+        trophy_id, btype_id = s.add(trophy), s.add(btype)
+        self.tag.append(tag_id)
+        self.battle_time.append(self._times.add(bt))
+        self.epoch.append(parse_battle_time(bt) or 0.0)
+        self.mode.append(s.add(mode))
+        self.map.append(s.add(emap))
+        self.brawler.append(s.add(brawler.upper()))
+        self.result.append(s.add(result.lower()))
+        self.trophy.append(trophy_id)
+        self.btype.append(btype_id)
+        self.allies.append(s.add(allies.upper()))
+        self.enemies.append(s.add(enemies.upper()))
+        key = (btype_id, trophy_id)
+        ladder = self._ladder_cache.get(key)
+        if ladder is None:
+            ladder = self._is_ladder({'BattleType': btype, 'TrophyChange': trophy})
+            self._ladder_cache[key] = ladder
+        self.ladder.append(1 if ladder else 0)
+        self._by_map[emap.lower()].append(i)
+        self._by_tag[tag_id].append(i)
+
+    # --- snapshot (voir snapshot.py) ----------------------------------------
+    _ARRAYS = ('tag', 'battle_time', 'epoch', 'mode', 'map', 'brawler', 'result', 'trophy', 'btype',
+               'allies', 'enemies', 'ladder')
+
+    def dump_state(self):
+        """Colonnes brutes + vocabulaires, copies sous verrou."""
+        with self._lock:
+            state = {name: array(getattr(self, name).typecode, getattr(self, name)) for name in self._ARRAYS}
+            state.update(columns=list(self.columns), tags=list(self._tags.values),
+                         times=list(self._times.values), strings=list(self._strings.values))
+            return state
+
+    def load_state(self, state):
+        """Recharge un etat dump_state() : aucun re-parsing, seuls les index sont recalcules."""
+        with self._lock:
+            self._reset()
+            self.columns = list(state['columns'])
+            for vocab, values in ((self._tags, state['tags']), (self._times, state['times']),
+                                  (self._strings, state['strings'])):
+                for v in values:
+                    vocab.add(v)
+            for name in self._ARRAYS:
+                getattr(self, name).frombytes(bytes(state[name]))
+            maps = [v.lower() for v in self._strings.values]
+            for i, (m, t) in enumerate(zip(self.map, self.tag)):
+                self._by_map[maps[m]].append(i)
+                self._by_tag[t].append(i)
+            self.loaded = True
+            logging.info(f"MatchStore: {len(self)} lignes rechargees depuis le snapshot.")
+
+    # --- lecture -------------------------------------------------------------
+    def row(self, i):
+        """Ligne i sous forme de dict (memes cles que get_all_records)."""
+        s = self._strings.values
+        return {
+            'PlayerTag': self._tags.values[self.tag[i]],
+            'BattleTime': self._times.values[self.battle_time[i]],
+            'EventMode': s[self.mode[i]],
+            'EventMap': s[self.map[i]],
+            'BrawlerName': s[self.brawler[i]],
+            'Result': s[self.result[i]],
+            'TrophyChange': s[self.trophy[i]],
+            'BattleType': s[self.btype[i]],
+            'Allies': s[self.allies[i]],
+            'Enemies': s[self.enemies[i]],
+        }
+
+    def key(self, i):
+        """(tag normalise, BattleTime) de la ligne i."""
+        return self._tags.values[self.tag[i]], self._times.values[self.battle_time[i]]
+
+    def index_of(self, tag, battle_time):
+        """Position de la 1ere ligne (tag, BattleTime), ou None."""
+        with self._lock:
+            tag_id = self._tags.ids.get(_normalize_tag(tag))
+            bt_id = self._times.ids.get(str(battle_time).strip())
+            if tag_id is None or bt_id is None:
+                return None
+            return next((i for i in self._by_tag[tag_id] if self.battle_time[i] == bt_id), None)
+
+    def keys(self):
+        """(tag normalise, BattleTime) de toutes les lignes."""
+        with self._lock:
+            tags, times = self._tags.values, self._times.values
+            return [(tags[t], times[b]) for t, b in zip(self.tag, self.battle_time)]
+
+    def values(self):
+        """Toutes les lignes en listes MATCHES_HEADER (pour reconstruire les compteurs)."""
+        with self._lock:
+            return [[m[c] for c in MATCHES_HEADER] for m in map(self.row, range(len(self)))]
+
+    def query(self, tags=None, map_name=None, days=None, include_ladder=False,
+              exclude_modes=EXCLUDED_MODES):
+        """
+        Lignes (dicts) filtrees : `tags` = set de tags normalises, `map_name`
+        insensible a la casse, `days` = fenetre glissante. Ladder exclu par defaut.
+        """
+        with self._lock:
+            candidates = None
+            if map_name is not None:
+                candidates = self._by_map.get(map_name.lower(), ())
+            tag_ids = None
+            if tags is not None:
+                tag_ids = {self._tags.ids[t] for t in tags if t in self._tags.ids}
+                if not tag_ids:
+                    return []
+                by_tag = sum(len(self._by_tag[t]) for t in tag_ids)
+                if candidates is None or by_tag < len(candidates):
+                    candidates = sorted(i for t in tag_ids for i in self._by_tag[t])
+            if candidates is None:
+                candidates = range(len(self))
+
+            excluded = {i for i, v in enumerate(self._strings.values) if v.lower() in exclude_modes}
+            cutoff = cutoff_epoch(days)
+            if cutoff is not None:
+                # fenetre temporelle : une comparaison vectorisee sur la colonne epoch
+                candidates = rows_after(self.epoch, cutoff, None if isinstance(candidates, range) else candidates)
+            map_lower = map_name.lower() if map_name is not None else None
+
+            out = []
+            for i in candidates:
+                if tag_ids is not None and self.tag[i] not in tag_ids:
+                    continue
+                if not include_ladder and self.ladder[i]:
+                    continue
+                if self.mode[i] in excluded:
+                    continue
+                if map_lower is not None and self._strings.values[self.map[i]].lower() != map_lower:
+                    continue
+                out.append(self.row(i))
+            return out
+
+    def latest_battle_times(self):
+        """{tag: BattleTime le plus recent} (sert a amorcer les high-water marks)."""
+        with self._lock:
+            best = {}
+            for tag_id, rows in self._by_tag.items():
+                if rows:
+                    best[tag_id] = max(rows, key=self.epoch.__getitem__)
+            return {self._tags.values[t]: self._times.values[self.battle_time[i]] for t, i in best.items()}
+
+    def stats(self):
+        """(nb lignes, colonnes, Counter des BattleType, nb ladder) pour !debug."""
+        with self._lock:
+            s = self._strings.values
+            types = Counter((s[b].strip().lower() or '(vide)') for b in self.btype)
+            return len(self), list(self.columns), types, sum(self.ladder)
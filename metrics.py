@@ -0,0 +1,227 @@
+"""
+Metriques du bot au format texte Prometheus, servies par keep_alive sur /metrics.
+
+Registre minimal (pas de dependance a prometheus_client) : compteurs, jauges et
+histogrammes etiquetes, thread-safe (les scrapes tournent dans des threads).
+Les modules alimentent les metriques partagees definies en bas de fichier ; les
+valeurs tenues ailleurs (stats des caches, quota Sheets, file de jobs) sont
+recopiees juste avant chaque rendu par des collecteurs (registry.collector).
+"""
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+def _labels(pairs):
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}' if pairs else ''
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, doc, labels=()):
+        self.name = name
+        self.doc = doc
+        self.labelnames = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if len(labels) != len(self.labelnames) or any(n not in labels for n in self.labelnames):
+            raise ValueError(f"{self.name}: etiquettes attendues {self.labelnames}, recues {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def _samples(self, key, value):
+        yield f'{self.name}{_labels(zip(self.labelnames, key))} {_number(value)}'
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        lines = [f'# HELP {self.name} {self.doc}', f'# TYPE {self.name} {self.kind}']
+        for key, value in items:
+            lines.extend(self._samples(key, value))
+        return lines
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set_total(self, value, **labels):
+        """Recopie un total tenu ailleurs (ex. ResponseCache.hits) ; reserve aux collecteurs."""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, doc, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, doc, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            counts = state[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """with histogram.time(...): duree du bloc observee (meme en cas d'exception)."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self, key, state):
+        base = list(zip(self.labelnames, key))
+        counts, total, count = state
+        for bound, n in zip(self.buckets, counts):
+            yield f'{self.name}_bucket{_labels(base + [("le", _number(bound))])} {n}'
+        yield f'{self.name}_bucket{_labels(base + [("le", "+Inf")])} {count}'
+        yield f'{self.name}_sum{_labels(base)} {_number(total)}'
+        yield f'{self.name}_count{_labels(base)} {count}'
+
+
+class Registry:
+    """Ensemble des metriques exposees + collecteurs appeles avant chaque rendu."""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def _add(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, doc, labels=()):
+        return self._add(Counter(name, doc, labels))
+
+    def gauge(self, name, doc, labels=()):
+        return self._add(Gauge(name, doc, labels))
+
+    def histogram(self, name, doc, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, doc, labels, buckets))
+
+    def collector(self, func):
+        """Decorateur : func() met a jour des metriques juste avant chaque rendu."""
+        with self._lock:
+            self._collectors.append(func)
+        return func
+
+    def render(self):
+        with self._lock:
+            collectors, metrics = list(self._collectors), list(self._metrics)
+        for func in collectors:
+            try:
+                func()
+            except Exception as e:
+                logging.warning(f"Metriques: collecteur {getattr(func, '__name__', func)} en echec: {e}")
+        return '\n'.join(line for m in metrics for line in m.render()) + '\n'
+
+
+registry = Registry()
+
+
+# ===========================================================================
+#  METRIQUES PARTAGEES
+# ===========================================================================
+# --- Commandes / bot -----------------------------------------------------------
+command_seconds = registry.histogram(
+    'panda_command_duration_seconds', 'Duree des commandes Discord.', ['command', 'outcome'],
+    buckets=(.05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60))
+event_loop_lag = registry.histogram(
+    'panda_event_loop_lag_seconds', "Retard de l'event loop Discord sur un sleep programme.",
+    buckets=(.001, .005, .01, .025, .05, .1, .25, .5, 1, 5))
+
+# --- Scraping (ingest.run_ingest) ---------------------------------------------
+scrape_seconds = registry.histogram(
+    'panda_scrape_duration_seconds', "Duree d'un passage d'ingestion.",
+    buckets=(.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600))
+scrape_players = registry.counter(
+    'panda_scrape_players_total', 'Battlelogs demandes, par issue (ok / error).', ['outcome'])
+scrape_rows_added = registry.counter(
+    'panda_scrape_rows_added_total', 'Parties ecrites dans Matches, par BattleType.', ['battle_type'])
+scrape_rows_derived = registry.counter(
+    'panda_scrape_rows_derived_total', "Lignes de joueurs suivis tirees du battlelog d'un coequipier.")
+scrape_ladder_skipped = registry.counter(
+    'panda_scrape_ladder_skipped_total', 'Parties ladder ecartees par le pipeline.')
+dedupe_index_keys = registry.gauge(
+    'panda_dedupe_index_keys', "Parties (PlayerTag, BattleTime) dans l'index de dedoublonnage.")
+
+# --- Google Sheets (sheets_writer.sheets_call) ---------------------------------
+sheets_calls = registry.counter(
+    'panda_sheets_calls_total', 'Appels Google Sheets (tentatives comprises).', ['kind'])
+sheets_call_seconds = registry.histogram(
+    'panda_sheets_call_duration_seconds', 'Duree des appels Google Sheets.', ['kind'])
+sheets_quota_wait = registry.counter(
+    'panda_sheets_quota_wait_seconds_total', 'Temps passe a attendre le quota Sheets local.', ['kind'])
+sheets_quota_used = registry.gauge(
+    'panda_sheets_quota_used', 'Appels Sheets sur la derniere minute.', ['kind'])
+sheets_quota_limit = registry.gauge(
+    'panda_sheets_quota_limit', 'Quota Sheets par minute.', ['kind'])
+
+# --- API Brawl Stars (bs_api) ----------------------------------------------------
+bs_api_requests = registry.counter(
+    'panda_bs_api_requests_total', "Requetes HTTP a l'API Brawl Stars, par code de reponse.", ['status'])
+bs_api_throttle_wait = registry.counter(
+    'panda_bs_api_throttle_wait_seconds_total', 'Temps passe a attendre le token bucket local.')
+
+# --- Communs -----------------------------------------------------------------------
+rate_limited = registry.counter(
+    'panda_rate_limited_total', 'Reponses HTTP 429, par service (sheets / bs_api).', ['backend'])
+cache_requests = registry.counter(
+    'panda_cache_requests_total', 'Consultations des caches, par resultat (hit / revalidated / miss).',
+    ['cache', 'result'])
+cache_hit_ratio = registry.gauge(
+    'panda_cache_hit_ratio', 'Part des consultations servies par le cache (revalidations comprises).', ['cache'])
+
+
+def export_cache(name, hits, misses, revalidated=0):
+    """Recopie les compteurs d'un cache (collecteurs) et en deduit le taux de hits."""
+    cache_requests.set_total(hits, cache=name, result='hit')
+    cache_requests.set_total(misses, cache=name, result='miss')
+    if revalidated:
+        cache_requests.set_total(revalidated, cache=name, result='revalidated')
+    total = hits + misses + revalidated
+    cache_hit_ratio.set((hits + revalidated) / total if total else 0.0, cache=name)
@@ -0,0 +1,245 @@
+"""
+Profilage des commandes Discord : decoupage de chaque appel en phases.
+
+  - @profiled('picks') (sous @bot.command) ouvre une Invocation pour l'appel,
+  - span('fetch') / @traced('model') attribuent le temps passe a une phase :
+    fetch (Sheets / API), parse, filter, aggregate, model, render (ctx.send).
+    Les spans imbriques comptent en temps propre (le parent ne recompte pas ses
+    enfants) ; hors commande (scrapes, boucles de start.py) ils ne coutent rien.
+    Le contexte suit les appels envoyes dans le pool de donnees (run_blocking
+    copie les contextvars).
+  - perf_log garde les PERF_WINDOW derniers appels : p50 / p95 par commande,
+    appels les plus lents ; au-dela de SLOW_COMMAND_MS l'appel est journalise.
+  - perf_log.arm('picks') : les spans synchrones du prochain !picks (le travail
+    bloquant, dans le pool de donnees) tournent sous cProfile ; le resume est
+    garde, le .prof ecrit dans PERF_PROFILE_DIR.
+"""
+import os
+import io
+import time
+import pstats
+import cProfile
+import logging
+import functools
+import threading
+import contextvars
+from collections import deque, defaultdict
+from contextlib import contextmanager
+
+PERF_WINDOW = int(os.getenv('PERF_WINDOW', '200'))              # appels gardes
+SLOW_COMMAND_MS = float(os.getenv('SLOW_COMMAND_MS', '2000'))   # seuil du journal des commandes lentes
+PERF_PROFILE_DIR = os.getenv('PERF_PROFILE_DIR', '')            # '' = profil garde en memoire seulement
+PROFILE_TOP = 12   # fonctions gardees dans le resume cProfile
+
+_current = contextvars.ContextVar('perf_invocation', default=None)
+_stack = contextvars.ContextVar('perf_spans', default=())
+_profiling = threading.local()
+
+
+class Invocation:
+    """Un appel de commande : duree totale + temps propre par phase."""
+
+    def __init__(self, command, text=''):
+        self.command = command
+        self.text = text[:120]
+        self.started_at = time.time()
+        self.total = None
+        self.phases = defaultdict(float)
+        self.profiler = None
+        self.profile_saved = False
+        self._profile_lock = threading.Lock()
+        self._lock = threading.Lock()
+
+    def add(self, phase, seconds):
+        with self._lock:
+            if self.total is None:   # un fit qui finit en fond apres la reponse n'est plus compte
+                self.phases[phase] += seconds
+
+    def breakdown(self):
+        """'fetch 1200 ms · model 640 ms' (phases les plus couteuses d'abord)."""
+        with self._lock:
+            items = sorted(self.phases.items(), key=lambda kv: kv[1], reverse=True)
+        return ' · '.join(f"{phase} {sec * 1000:.0f} ms" for phase, sec in items if sec >= 0.0005) or '—'
+
+
+@contextmanager
+def span(phase, profile=True):
+    """
+    Attribue le temps du bloc a `phase` dans la commande en cours (no-op hors commande).
+    profile=False pour un bloc qui contient un await (cProfile ne suit que le thread courant).
+    """
+    inv = _current.get()
+    if inv is None:
+        yield
+        return
+    frame = [0.0]   # temps des spans enfants
+    token = _stack.set(_stack.get() + (frame,))
+    profiling = profile and _start_profile(inv)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        if profiling:
+            inv.profiler.disable()
+            _profiling.active = False
+            inv._profile_lock.release()
+            if inv.total is not None:   # commande deja repondue : capture terminee ici
+                perf_log.save_profile(inv)
+        _stack.reset(token)
+        parent = _stack.get()
+        if parent:
+            parent[-1][0] += elapsed
+        inv.add(phase, elapsed - frame[0])
+
+
+def _start_profile(inv):
+    """Active le profiler de l'appel dans ce thread (un seul thread a la fois, span le plus externe)."""
+    if inv.profiler is None or getattr(_profiling, 'active', False):
+        return False
+    if not inv._profile_lock.acquire(blocking=False):
+        return False
+    _profiling.active = True
+    inv.profiler.enable()
+    return True
+
+
+def traced(phase):
+    """Decorateur : tout l'appel de la fonction compte pour `phase`."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _current.get() is None:
+                return func(*args, **kwargs)
+            with span(phase):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def run_in_context(func, *args):
+    """func(*args) avec les contextvars de l'appelant (pour run_in_executor)."""
+    return functools.partial(contextvars.copy_context().run, func, *args)
+
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+class PerfLog:
+    """Appels recents (fenetre glissante), commandes lentes, captures cProfile a la demande."""
+
+    def __init__(self, window=PERF_WINDOW, slow_ms=SLOW_COMMAND_MS, profile_dir=PERF_PROFILE_DIR):
+        self.slow_ms = slow_ms
+        self.profile_dir = profile_dir
+        self._recent = deque(maxlen=window)
+        self._armed = set()
+        self._profiles = {}   # commande -> (date, resume texte)
+        self._lock = threading.Lock()
+
+    def arm(self, command):
+        """Le prochain appel de `command` sera profile avec cProfile."""
+        with self._lock:
+            self._armed.add(command)
+
+    def start(self, command, text=''):
+        inv = Invocation(command, text)
+        with self._lock:
+            if command in self._armed:
+                self._armed.discard(command)
+                inv.profiler = cProfile.Profile()
+        return inv
+
+    def finish(self, inv, elapsed):
+        with inv._lock:
+            inv.total = elapsed
+        with self._lock:
+            self._recent.append(inv)
+        if inv.profiler is not None and inv._profile_lock.acquire(blocking=False):
+            # sinon un span profile tourne encore en fond : il sauvegardera a sa fin
+            inv._profile_lock.release()
+            self.save_profile(inv)
+        if elapsed * 1000 >= self.slow_ms:
+            logging.warning(f"Commande lente !{inv.command}: {elapsed * 1000:.0f} ms ({inv.breakdown()}) | {inv.text}")
+
+    def save_profile(self, inv):
+        with inv._lock:
+            if inv.profile_saved:
+                return
+            inv.profile_saved = True
+        try:
+            stats = pstats.Stats(inv.profiler, stream=io.StringIO())
+        except TypeError:   # aucun span profile (commande sans appel bloquant)
+            return
+        stats.sort_stats('cumulative')
+        lines = []
+        for func in stats.fcn_list[:PROFILE_TOP]:
+            _, ncalls, _, cumtime, _ = stats.stats[func]
+            filename, lineno, name = func
+            lines.append(f"{cumtime * 1000:8.1f} ms {ncalls:>7} {os.path.basename(filename)}:{lineno}({name})")
+        if self.profile_dir:
+            os.makedirs(self.profile_dir, exist_ok=True)
+            path = os.path.join(self.profile_dir, f"{inv.command}-{int(inv.started_at)}.prof")
+            stats.dump_stats(path)
+            logging.info(f"Profil de !{inv.command} ecrit dans {path}")
+        with self._lock:
+            self._profiles[inv.command] = (inv.started_at, '\n'.join(lines))
+
+    def profile(self, command):
+        """(date, resume pstats) de la derniere capture de `command`, ou None."""
+        with self._lock:
+            return self._profiles.get(command)
+
+    def summary(self):
+        """{commande: (nb appels, p50 s, p95 s)} sur la fenetre."""
+        with self._lock:
+            recent = list(self._recent)
+        durations = defaultdict(list)
+        for inv in recent:
+            durations[inv.command].append(inv.total)
+        out = {}
+        for command, values in sorted(durations.items()):
+            values.sort()
+            out[command] = (len(values), _percentile(values, 0.5), _percentile(values, 0.95))
+        return out
+
+    def slowest(self, n=5, command=None):
+        with self._lock:
+            recent = [inv for inv in self._recent if command is None or inv.command == command]
+        return sorted(recent, key=lambda inv: inv.total, reverse=True)[:n]
+
+
+perf_log = PerfLog()
+
+
+def profiled(command):
+    """
+    Decorateur des commandes (a placer SOUS @bot.command) : ouvre une Invocation,
+    compte ctx.send comme phase 'render' et l'enregistre dans perf_log a la fin.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(ctx, *args, **kwargs):
+            inv = perf_log.start(command, getattr(getattr(ctx, 'message', None), 'content', '') or '')
+            token = _current.set(inv)
+            stack_token = _stack.set(())
+            send = ctx.send
+
+            async def timed_send(*a, **kw):
+                with span('render', profile=False):
+                    return await send(*a, **kw)
+
+            ctx.send = timed_send
+            start = time.perf_counter()
+            try:
+                return await func(ctx, *args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                del ctx.send
+                _stack.reset(stack_token)
+                _current.reset(token)
+                perf_log.finish(inv, elapsed)
+        return wrapper
+    return decorator
@@ -0,0 +1,499 @@
+"""
+Acces aux parties enregistrees, derriere une interface commune (MatchRepository) :
+  - SheetsMatchRepository : la feuille Google Matches (+ copie memoire MatchStore)
+  - SqliteMatchRepository : base SQLite locale indexee, la feuille devient un
+                            export optionnel, ecrit en tache de fond
+Choix par config : MATCH_BACKEND=sheets (defaut) | sqlite.
+Le backend Sheets redemarre depuis un snapshot local (snapshot.py) et ne relit
+que le delta de la feuille.
+Les deux backends tiennent a jour l'index de dedoublonnage partage
+(dedupe_index.py) a chaque ajout, purge et remise a zero.
+"""
+import os
+import logging
+import sqlite3
+import threading
+from collections import Counter
+from match_store import MatchStore, BASE_HEADER, TEAM_COLUMNS, MATCHES_HEADER, EXCLUDED_MODES
+from battletime import parse_battle_time, cutoff_epoch
+from rollups import Rollups
+from retention import prune_sheet
+from sheets_writer import SheetsWriter, sheets_call
+from snapshot import Snapshot
+from dedupe_index import dedupe_index
+
+MATCH_BACKEND = os.getenv('MATCH_BACKEND', 'sheets').strip().lower()
+SQLITE_PATH = os.getenv('SQLITE_PATH', 'matches.db')
+SHEETS_EXPORT = os.getenv('SHEETS_EXPORT', '1') == '1'   # backend sqlite : recopie vers la feuille
+
+
+class MatchRepository:
+    """
+    Operations communes aux backends. Les lignes sont au format MATCHES_HEADER.
+    Chaque backend tient `self.rollups` (compteurs journaliers) a jour a l'ajout.
+    """
+    rollups = None
+    on_reload = None   # appele quand les donnees changent en fond (rattrapage, import) : caches a vider
+
+    def _reloaded(self):
+        if self.on_reload is not None:
+            try:
+                self.on_reload()
+            except Exception as e:
+                logging.error(f"Invalidation des caches apres rechargement en echec: {e}")
+
+    def _rollups(self):
+        """Compteurs pre-agreges, (re)construits si besoin."""
+        return self.rollups
+
+    def brawler_stats(self, map_name, days, tags=None):
+        """(games, wins, nb lignes) par brawler sur la map, depuis les compteurs pre-agreges."""
+        return self._rollups().brawler_stats(map_name, days, tags)
+
+    def brawler_usage(self, map_name, days, tags=None):
+        """Counter des lignes par brawler sur la map, depuis les compteurs pre-agreges."""
+        return self._rollups().brawler_usage(map_name, days, tags)
+
+    def prepare(self):
+        """Avant une ecriture (ex. verifier l'en-tete de la feuille)."""
+
+    def append(self, rows):
+        """Ajoute un lot de lignes."""
+        raise NotImplementedError
+
+    def query(self, tags=None, map_name=None, mode=None, days=None, include_ladder=False):
+        """Lignes (dicts) filtrees par tags / map / mode / fenetre en jours. Ladder exclu par defaut."""
+        raise NotImplementedError
+
+    def prune(self, days):
+        """Supprime les parties plus vieilles que `days` jours. Retourne le nb de lignes supprimees."""
+        raise NotImplementedError
+
+    def count_by_type(self):
+        """Counter des BattleType (minuscules, '(vide)' si absent)."""
+        raise NotImplementedError
+
+    def stats(self):
+        """(nb lignes, colonnes, Counter des BattleType, nb ladder) pour !debug."""
+        raise NotImplementedError
+
+    def latest_battle_times(self):
+        """{tag: BattleTime le plus recent}."""
+        raise NotImplementedError
+
+    def keys(self):
+        """(tag, BattleTime) de toutes les parties (construction de l'index de dedoublonnage)."""
+        raise NotImplementedError
+
+    def clear(self):
+        """Vide toutes les parties."""
+        raise NotImplementedError
+
+    def pending_writes(self):
+        """Lignes en attente d'ecriture vers la feuille (file du SheetsWriter)."""
+        return 0
+
+    def stats_ready(self):
+        """True si les compteurs repondent sans attendre un chargement / une reconstruction."""
+        return True
+
+
+# ===========================================================================
+#  BACKEND GOOGLE SHEETS
+# ===========================================================================
+class SheetsMatchRepository(MatchRepository):
+    """Feuille Matches ; les lectures passent par la copie memoire (chargee une fois)."""
+
+    def __init__(self, worksheet, is_ladder, snapshot=None, index=dedupe_index):
+        self.worksheet = worksheet
+        self.index = index
+        self.store = MatchStore(is_ladder=is_ladder)
+        self.rollups = Rollups(is_ladder=is_ladder)
+        # ecriture synchrone (append -> flush) : aucune ligne ne doit partir dans un thread
+        # dont l'echec ne remonterait pas a l'appelant (marks / index avances a tort)
+        self.writer = SheetsWriter(worksheet, background=False)
+        self.snapshot = snapshot
+        self._synced = threading.Event()   # leve tant que le snapshot n'est pas rattrape
+        self._synced.set()
+        self._rollups_ready = threading.Event()   # compteurs reconstruits apres le snapshot
+        self._rollups_ready.set()
+
+    def _fetch_values(self):
+        values = sheets_call('read', self.worksheet.get_all_values)
+        self.rollups.rebuild(values)   # meme lecture pour la memoire et les compteurs
+        return values
+
+    def _store(self):
+        if not self.store.loaded:
+            self.store.ensure_loaded(self._fetch_values)
+            self._save_snapshot()
+        return self.store
+
+    def _save_snapshot(self):
+        if self.snapshot is not None:
+            self.snapshot.save(self.store)
+
+    # --- demarrage depuis le snapshot -------------------------------------
+    def warm_start(self, snapshot):
+        """Sert les lectures depuis le snapshot local tout de suite ; rattrape la feuille en fond."""
+        self.snapshot = snapshot
+        if not snapshot.load_into(self.store):
+            return False
+        self._synced.clear()
+        self._rollups_ready.clear()   # reconstruits en fond : le boot n'attend pas (O(lignes))
+        threading.Thread(target=self._reconcile, name='snapshot-reconcile', daemon=True).start()
+        return True
+
+    def _reconcile(self):
+        try:
+            if self._apply_delta() is None:
+                logging.info("Snapshot desynchronise de la feuille : rechargement complet.")
+                self.store.load(self._fetch_values())   # compteurs reconstruits sur la meme lecture
+            else:
+                self.rollups.rebuild(self.store.values())
+            self._save_snapshot()
+        except Exception as e:
+            logging.error(f"Snapshot: rattrapage impossible, rechargement au prochain acces: {e}")
+            self.store.loaded = False
+        finally:
+            # compteurs prets une fois le delta applique (jamais sur le seul snapshot)
+            self._rollups_ready.set()
+            self._synced.set()
+            self._reloaded()   # resultats calcules sur le snapshot perimes
+
+    def _apply_delta(self):
+        """
+        Aligne le snapshot sur la feuille en deux lectures : la 1ere ligne de donnees
+        (lignes purgees en haut entre-temps) puis la fin de feuille a partir de la
+        derniere partie connue (parties ajoutees). Retourne le nb de lignes ajoutees,
+        ou None si la feuille ne prolonge pas le snapshot (reset, edition a la main...).
+        """
+        n = len(self.store)
+        head = sheets_call('read', self.worksheet.get, 'A2:B2')
+        if not n or not head or len(head[0]) < 2:
+            return None
+        offset = self.store.index_of(head[0][0], head[0][1])
+        if offset is None:
+            return None
+        last = n - offset + 1   # ligne de la feuille ou doit se trouver la derniere partie connue
+        last_col = chr(ord('A') + max(len(self.store.columns), len(MATCHES_HEADER)) - 1)   # jusqu'a Enemies (J)
+        tail = sheets_call('read', self.worksheet.get, f'A{last}:{last_col}')
+        pos = {c: i for i, c in enumerate(self.store.columns)}
+        tag_col, bt_col = pos.get('PlayerTag', 0), pos.get('BattleTime', 1)
+        if not tail or len(tail[0]) <= max(tag_col, bt_col):
+            return None
+        tag, bt = self.store.key(n - 1)
+        if ('#' + tail[0][tag_col].strip().lstrip('#').upper(), tail[0][bt_col].strip()) != (tag, bt):
+            return None
+        new = tail[1:]
+        self.store.drop_head(offset)
+        self.store.extend(new)
+        logging.info(f"Snapshot rattrape : {offset} lignes purgees, {len(new)} lignes ajoutees.")
+        return len(new)
+
+    def _rollups(self):
+        self._store()
+        self._rollups_ready.wait()
+        return self.rollups
+
+    def prepare(self):
+        """Garantit que la ligne 1 de Matches est bien l'en-tete (repare si manquant)."""
+        first = sheets_call('read', self.worksheet.row_values, 1)
+        if first[:1] != ['PlayerTag']:
+            # feuille vide OU ligne 1 = donnees -> on insere l'en-tete tout en haut
+            sheets_call('write', self.worksheet.insert_row, MATCHES_HEADER, index=1)
+            logging.info("En-tete Matches (re)cree.")
+        elif first[:len(BASE_HEADER)] == BASE_HEADER and first[len(BASE_HEADER):len(MATCHES_HEADER)] != TEAM_COLUMNS:
+            # ancienne feuille a 8 colonnes : on ajoute Allies / Enemies (anciennes lignes laissees vides)
+            sheets_call('write', self.worksheet.update, range_name='I1:J1', values=[TEAM_COLUMNS])
+            if self.store.loaded:
+                self.store.columns = list(MATCHES_HEADER)
+            logging.info("En-tete Matches complete (Allies, Enemies).")
+
+    def append(self, rows):
+        # ordre chronologique dans la feuille : la retention s'appuie dessus
+        rows = sorted(rows, key=lambda r: parse_battle_time(r[1]) or 0.0)
+        self._synced.wait()
+        # lots de 500 au debit du quota ; flush synchrone : les marks n'avancent qu'apres ecriture
+        self.writer.write(rows)
+        try:
+            self.writer.flush()
+        except Exception:
+            self.writer.discard()   # marks non avances : ces parties seront reprises au prochain scrape
+            raise
+        self.store.extend(rows, MATCHES_HEADER)
+        self.rollups.add(rows)
+        self.index.add((r[0], r[1]) for r in rows)
+        self.index.save()
+        self._save_snapshot()
+
+    def query(self, tags=None, map_name=None, mode=None, days=None, include_ladder=False):
+        rows = self._store().query(tags=tags, map_name=map_name, days=days, include_ladder=include_ladder)
+        if mode is not None:
+            rows = [m for m in rows if m['EventMode'].lower() == mode.lower()]
+        return rows
+
+    def prune(self, days):
+        """Purge par le moteur de retention (recherche de la limite + 1 suppression)."""
+        self._synced.wait()
+        deleted = prune_sheet(self.worksheet, days)
+        if deleted:
+            cutoff = cutoff_epoch(days)
+            if self.store.loaded:
+                # exactement les lignes supprimees de la feuille (prefixe verifie par prune_sheet) :
+                # memoire et feuille gardent les memes positions (voir _apply_delta)
+                self.store.drop_head(deleted)
+            self.rollups.prune_before(cutoff)
+            self.index.prune_before(cutoff)
+            self.index.save()
+            self._save_snapshot()
+        return deleted
+
+    def count_by_type(self):
+        return self._store().stats()[2]
+
+    def stats(self):
+        return self._store().stats()
+
+    def latest_battle_times(self):
+        self._synced.wait()   # amorce les marks : il faut les parties ajoutees depuis le snapshot
+        return self._store().latest_battle_times()
+
+    def keys(self):
+        self._synced.wait()
+        return self._store().keys()
+
+    def clear(self):
+        self._synced.wait()
+        self.writer.discard()
+        sheets_call('write', self.worksheet.clear)
+        sheets_call('write', self.worksheet.append_row, MATCHES_HEADER)
+        self.store.clear()
+        self.rollups.rebuild([])
+        self.index.clear()
+        self.index.save()
+        self._save_snapshot()
+
+    def pending_writes(self):
+        return self.writer.queue_depth()
+
+    def stats_ready(self):
+        return self.store.loaded and self._rollups_ready.is_set()
+
+
+# ===========================================================================
+#  BACKEND SQLITE (+ export optionnel vers la feuille)
+# ===========================================================================
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS matches (
+    PlayerTag    TEXT NOT NULL,
+    BattleTime   TEXT NOT NULL,
+    EventMode    TEXT,
+    EventMap     TEXT,
+    BrawlerName  TEXT,
+    Result       TEXT,
+    TrophyChange TEXT,
+    BattleType   TEXT,
+    Allies       TEXT,      -- coequipiers (hors joueur), "BRAWLER1,BRAWLER2"
+    Enemies      TEXT,      -- adversaires
+    MapKey       TEXT,      -- EventMap en minuscules (recherche insensible a la casse)
+    Epoch        REAL,      -- BattleTime pre-parse (secondes UTC)
+    Ladder       INTEGER,   -- 1 = partie ladder (exclue des stats)
+    UNIQUE (PlayerTag, BattleTime)
+);
+CREATE INDEX IF NOT EXISTS idx_matches_map_time_tag ON matches (MapKey, Epoch, PlayerTag);
+CREATE INDEX IF NOT EXISTS idx_matches_tag_time ON matches (PlayerTag, Epoch);
+CREATE INDEX IF NOT EXISTS idx_matches_time ON matches (Epoch);
+"""
+
+_INSERT_COLUMNS = MATCHES_HEADER + ['MapKey', 'Epoch', 'Ladder']
+_INSERT = (f"INSERT OR IGNORE INTO matches ({', '.join(_INSERT_COLUMNS)}) "
+           f"VALUES ({', '.join('?' * len(_INSERT_COLUMNS))})")
+
+
+class SqliteMatchRepository(MatchRepository):
+    """Base SQLite locale, indexee sur (EventMap, BattleTime, PlayerTag)."""
+
+    def __init__(self, path, is_ladder, exporter=None, index=dedupe_index, bootstrap_from=None):
+        """
+        Compteurs reconstruits en fond (lecture complete de la table), puis, si la base
+        est vide et `bootstrap_from` donne, import de la feuille Matches : le boot
+        n'attend ni l'un ni l'autre. Les lectures sont servies tout de suite (les
+        compteurs attendent leur reconstruction), les ecritures attendent la fin.
+        """
+        self.path = path
+        self.index = index
+        self._is_ladder = is_ladder
+        self.exporter = exporter
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.executescript(_SCHEMA)
+            existing = {r[1] for r in self._conn.execute('PRAGMA table_info(matches)')}
+            for col in TEAM_COLUMNS:
+                if col not in existing:   # base creee avant les colonnes d'equipes
+                    self._conn.execute(f'ALTER TABLE matches ADD COLUMN {col} TEXT')
+        self.rollups = Rollups(is_ladder=is_ladder)
+        self._rollups_ready = threading.Event()   # compteurs reconstruits depuis la table
+        self._synced = threading.Event()          # + import initial de la feuille termine
+        threading.Thread(target=self._warm_up, args=(bootstrap_from,), name='sqlite-warmup', daemon=True).start()
+
+    def _warm_up(self, worksheet):
+        try:
+            try:
+                self.rebuild_rollups()
+            finally:
+                self._rollups_ready.set()
+            if worksheet is not None:
+                self._import_sheet(worksheet)
+        except Exception as e:
+            logging.error(f"SQLite: demarrage en fond en echec: {e}")
+        finally:
+            self._synced.set()
+            self._reloaded()
+
+    def _rollups(self):
+        self._rollups_ready.wait()
+        return self.rollups
+
+    def rebuild_rollups(self):
+        """Recalcule les compteurs depuis la table (source de verite)."""
+        with self._lock:
+            rows = self._conn.execute(f"SELECT {', '.join(MATCHES_HEADER)} FROM matches").fetchall()
+        self.rollups.rebuild([list(r) for r in rows])
+
+    def _record(self, row):
+        vals = [str(v).strip() for v in row[:len(MATCHES_HEADER)]]
+        vals += [''] * (len(MATCHES_HEADER) - len(vals))
+        tag, bt, mode, emap, brawler, result, trophy, btype, allies, enemies = vals
+        tag = '#' + tag.lstrip('#').upper()
+        ladder = self._is_ladder({'BattleType': btype, 'TrophyChange': trophy})
+        return (tag, bt, mode, emap, brawler.upper(), result.lower(), trophy, btype,
+                allies.upper(), enemies.upper(), emap.lower(), parse_battle_time(bt) or 0.0, 1 if ladder else 0)
+
+    def _insert(self, rows):
+        """Insere les lignes nouvelles (doublons ignores) et les ajoute aux compteurs."""
+        inserted = []
+        with self._lock, self._conn:
+            for r in rows:
+                if not r or not str(r[0]).strip():
+                    continue
+                cur = self._conn.execute(_INSERT, self._record(r))
+                if cur.rowcount:
+                    inserted.append(r)
+        self.rollups.add(inserted)
+        if inserted and self.index.add((r[0], r[1]) for r in inserted):
+            self.index.save()
+
+    def append(self, rows):
+        self._synced.wait()
+        self._insert(rows)
+        if self.exporter:
+            self.exporter.write(rows)   # recopie en tache de fond (flush par taille ou par temps)
+
+    def _import_sheet(self, worksheet):
+        """Base vide (1er passage en SQLite) : importe l'historique de la feuille une fois."""
+        with self._lock:
+            if self._conn.execute('SELECT 1 FROM matches LIMIT 1').fetchone():
+                return
+        logging.info("SQLite: base vide, import de la feuille Matches (en fond).")
+        values = sheets_call('read', worksheet.get_all_values)
+        if values and values[0][:1] == ['PlayerTag']:
+            values = values[1:]
+        self._insert(values)
+        logging.info(f"SQLite: {len(values)} lignes importees depuis la feuille Matches.")
+
+    def query(self, tags=None, map_name=None, mode=None, days=None, include_ladder=False):
+        where, args = [], []
+        if map_name is not None:
+            where.append('MapKey = ?')
+            args.append(map_name.lower())
+        cutoff = cutoff_epoch(days)
+        if cutoff is not None:
+            where.append('Epoch > ?')
+            args.append(cutoff)
+        if tags is not None:
+            tags = list(tags)
+            if not tags:
+                return []
+            where.append(f"PlayerTag IN ({', '.join('?' * len(tags))})")
+            args.extend(tags)
+        if mode is not None:
+            where.append('lower(EventMode) = ?')
+            args.append(mode.lower())
+        else:
+            where.append(f"lower(EventMode) NOT IN ({', '.join('?' * len(EXCLUDED_MODES))})")
+            args.extend(EXCLUDED_MODES)
+        if not include_ladder:
+            where.append('Ladder = 0')
+        sql = (f"SELECT {', '.join(MATCHES_HEADER)} FROM matches "
+               f"WHERE {' AND '.join(where)} ORDER BY rowid")
+        with self._lock:
+            return [dict(r) for r in self._conn.execute(sql, args)]
+
+    def prune(self, days):
+        self._synced.wait()
+        with self._lock, self._conn:
+            cutoff = cutoff_epoch(days)
+            deleted = self._conn.execute('DELETE FROM matches WHERE Epoch < ?', (cutoff,)).rowcount
+        if deleted:
+            self.rebuild_rollups()
+            self.index.prune_before(cutoff)
+            self.index.save()
+        return deleted
+
+    def count_by_type(self):
+        with self._lock:
+            cur = self._conn.execute('SELECT lower(trim(BattleType)), COUNT(*) FROM matches GROUP BY 1')
+            return Counter({(k or '(vide)'): n for k, n in cur})
+
+    def stats(self):
+        types = self.count_by_type()
+        with self._lock:
+            nb_ladder = self._conn.execute('SELECT COUNT(*) FROM matches WHERE Ladder = 1').fetchone()[0]
+        return sum(types.values()), list(MATCHES_HEADER), types, nb_ladder
+
+    def latest_battle_times(self):
+        self._synced.wait()
+        with self._lock:
+            cur = self._conn.execute(
+                'SELECT PlayerTag, BattleTime, MAX(Epoch) FROM matches GROUP BY PlayerTag')
+            return {tag: bt for tag, bt, _ in cur}
+
+    def keys(self):
+        self._synced.wait()   # l'index de dedoublonnage ne doit pas etre construit sur un import partiel
+        with self._lock:
+            return self._conn.execute('SELECT PlayerTag, BattleTime FROM matches').fetchall()
+
+    def clear(self):
+        self._synced.wait()
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM matches')
+        self.rollups.rebuild([])
+        self.index.clear()
+        self.index.save()
+        if self.exporter:
+            self.exporter.discard()
+            sheets_call('write', self.exporter.worksheet.clear)
+            sheets_call('write', self.exporter.worksheet.append_row, MATCHES_HEADER)
+
+    def pending_writes(self):
+        return self.exporter.queue_depth() if self.exporter else 0
+
+    def stats_ready(self):
+        return self._rollups_ready.is_set()
+
+
+def make_repository(matches_worksheet, is_ladder):
+    """Backend choisi par MATCH_BACKEND."""
+    if MATCH_BACKEND == 'sqlite':
+        exporter = SheetsWriter(matches_worksheet) if SHEETS_EXPORT else None
+        logging.info(f"Stockage des parties : SQLite ({SQLITE_PATH}), export Sheets={'oui' if exporter else 'non'}")
+        return SqliteMatchRepository(SQLITE_PATH, is_ladder, exporter, bootstrap_from=matches_worksheet)
+    logging.info("Stockage des parties : Google Sheets")
+    repo = SheetsMatchRepository(matches_worksheet, is_ladder)
+    if repo.warm_start(Snapshot()):
+        logging.info(f"Parties servies depuis le snapshot (generation {repo.snapshot.generation}), rattrapage en cours.")
+    return repo
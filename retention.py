@@ -0,0 +1,71 @@
+"""
+Retention de la feuille Matches : supprime les parties plus vieilles que la
+fenetre configuree (RETENTION_DAYS), sans telecharger toute la feuille.
+
+Les lignes sont ajoutees dans l'ordre chronologique, donc les vieilles forment
+un bloc en haut de la feuille :
+  1. recherche de la limite par sondages groupes sur la colonne BattleTime
+     (PROBES cellules par appel batch_get -> ~4 appels pour 100k lignes),
+  2. relecture du seul bloc candidat pour verifier qu'il est bien ancien,
+  3. suppression en UNE requete.
+Le cout depend du nombre de lignes supprimees, pas de la taille de la feuille.
+"""
+import os
+import logging
+from battletime import parse_battle_time, cutoff_epoch
+from sheets_writer import sheets_call
+
+RETENTION_DAYS = int(os.getenv('RETENTION_DAYS', '40'))
+PROBES = 16          # cellules lues par sondage
+BATTLE_TIME_COL = 'B'
+
+
+def _cell_time(value_range):
+    """Epoch d'une cellule renvoyee par batch_get (None si vide / illisible)."""
+    if value_range and value_range[0]:
+        return parse_battle_time(value_range[0][0])
+    return None
+
+
+def find_cutoff_row(worksheet, cutoff):
+    """
+    Numero (1-based) de la 1ere ligne de donnees recente (BattleTime >= cutoff,
+    vide ou illisible) ; les lignes 2 .. resultat-1 sont anciennes.
+    """
+    lo, hi = 2, worksheet.row_count + 1   # lignes < lo anciennes, ligne hi recente (ou hors feuille)
+    while lo < hi:
+        step = max(1, (hi - lo) // (PROBES + 1))
+        probes = list(range(lo, hi, step))[:PROBES]
+        times = sheets_call('read', worksheet.batch_get, [f'{BATTLE_TIME_COL}{r}' for r in probes])
+        new_lo, new_hi = lo, hi
+        for r, vr in zip(probes, times):
+            t = _cell_time(vr)
+            if t is not None and t < cutoff:
+                new_lo = r + 1
+            else:
+                new_hi = r
+                break
+        lo, hi = new_lo, new_hi
+    return lo
+
+
+def prune_sheet(worksheet, days=RETENTION_DAYS):
+    """Supprime les lignes plus vieilles que `days` jours. Retourne le nb de lignes supprimees."""
+    cutoff = cutoff_epoch(days)
+    first_recent = find_cutoff_row(worksheet, cutoff)
+    if first_recent <= 2:
+        return 0
+
+    # verification du bloc candidat : on ne supprime que le prefixe reellement ancien
+    block = sheets_call('read', worksheet.get, f'{BATTLE_TIME_COL}2:{BATTLE_TIME_COL}{first_recent - 1}')
+    old = 0
+    for row in block:
+        t = parse_battle_time(row[0]) if row else None
+        if t is None or t >= cutoff:
+            break
+        old += 1
+    if not old:
+        return 0
+    sheets_call('write', worksheet.delete_rows, 2, old + 1)
+    logging.info(f"Retention: {old} lignes de plus de {days} jours supprimees (lignes 2-{old + 1}).")
+    return old
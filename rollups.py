@@ -0,0 +1,118 @@
+"""
+Compteurs pre-agreges des parties, tenus a jour a l'ingestion.
+
+Buckets journaliers (jour UTC) -> map -> (brawler, tag, mode, BattleType, ladder)
+-> [lignes, parties decidees, victoires]. Un top 15 / winrate sur 15, 30 ou 60
+jours ne fait que sommer quelques dizaines de buckets au lieu de relire toutes
+les lignes. Les fenetres sont alignees sur les jours UTC.
+Reconstructible a tout moment depuis les lignes brutes de Matches (rebuild).
+"""
+import threading
+from collections import Counter, defaultdict
+from battletime import parse_battle_time, cutoff_epoch
+from match_store import BASE_HEADER, MATCHES_HEADER, EXCLUDED_MODES
+
+DAY = 86400
+
+
+def _normalize_tag(t):
+    return '#' + str(t).strip().lstrip('#').upper()
+
+
+class Rollups:
+    """Compteurs par (jour, map, brawler, tag, mode, BattleType)."""
+
+    def __init__(self, is_ladder):
+        self._is_ladder = is_ladder
+        self._lock = threading.Lock()
+        self._ladder_cache = {}
+        self._buckets = defaultdict(lambda: defaultdict(dict))   # jour -> map -> cle -> [n, g, w]
+
+    def rebuild(self, values):
+        """Recalcule tout depuis get_all_values() (en-tete optionnel en 1ere ligne)."""
+        with self._lock:
+            self._buckets.clear()
+        columns = MATCHES_HEADER
+        if values and [str(h).strip() for h in values[0]][:1] == ['PlayerTag']:
+            columns = [str(h).strip() for h in values[0]]
+            values = values[1:]
+        self.add(values, columns)
+
+    def add(self, rows, columns=MATCHES_HEADER):
+        """Ajoute des lignes brutes (listes de valeurs dans l'ordre de `columns`)."""
+        pos = {c: i for i, c in enumerate(columns)}
+        cols = [pos.get(c) for c in BASE_HEADER]
+        with self._lock:
+            for row in rows:
+                tag, bt, mode, emap, brawler, result, trophy, btype = (
+                    str(row[c]).strip() if c is not None and c < len(row) else '' for c in cols)
+                t = parse_battle_time(bt)
+                if not tag or t is None:
+                    continue
+                ladder = self._ladder_cache.get((btype, trophy))
+                if ladder is None:
+                    ladder = bool(self._is_ladder({'BattleType': btype, 'TrophyChange': trophy}))
+                    self._ladder_cache[(btype, trophy)] = ladder
+                key = (brawler.upper(), _normalize_tag(tag), mode.lower(), btype.lower(), ladder)
+                counts = self._buckets[int(t // DAY)][emap.lower()].setdefault(key, [0, 0, 0])
+                result = result.lower()
+                counts[0] += 1
+                if result in ('victory', 'defeat'):
+                    counts[1] += 1
+                    if result == 'victory':
+                        counts[2] += 1
+
+    def prune_before(self, cutoff):
+        """Supprime les buckets des jours entierement anterieurs a `cutoff` (epoch)."""
+        first_day = int(cutoff // DAY)
+        with self._lock:
+            for day in [d for d in self._buckets if d < first_day]:
+                del self._buckets[day]
+
+    def _iter(self, map_name, days, tags=None):
+        """Cles et compteurs de la map sur la fenetre, hors ladder et modes exclus."""
+        first_day = int(cutoff_epoch(days) // DAY) if days is not None else None
+        map_key = map_name.lower()
+        with self._lock:
+            for day, maps in self._buckets.items():
+                if first_day is not None and day < first_day:
+                    continue
+                for key, counts in maps.get(map_key, {}).items():
+                    brawler, tag, mode, _, ladder = key
+                    if ladder or mode in EXCLUDED_MODES:
+                        continue
+                    if tags is not None and tag not in tags:
+                        continue
+                    yield brawler, counts
+
+    def brawler_stats(self, map_name, days, tags=None):
+        """(games, wins, nb lignes) : Counters par brawler sur les parties decidees."""
+        games, wins, rows = Counter(), Counter(), 0
+        for brawler, (n, g, w) in self._iter(map_name, days, tags):
+            rows += n
+            if brawler and g:
+                games[brawler] += g
+                if w:
+                    wins[brawler] += w
+        return games, wins, rows
+
+    def brawler_usage(self, map_name, days, tags=None):
+        """Counter des lignes par brawler (toutes issues confondues)."""
+        usage = Counter()
+        for brawler, (n, _, _) in self._iter(map_name, days, tags):
+            if brawler:
+                usage[brawler] += n
+        return usage
+
+    def count_by_type(self, days=None):
+        """Counter des BattleType (ladder compris) sur la fenetre."""
+        first_day = int(cutoff_epoch(days) // DAY) if days is not None else None
+        types = Counter()
+        with self._lock:
+            for day, maps in self._buckets.items():
+                if first_day is not None and day < first_day:
+                    continue
+                for entries in maps.values():
+                    for (_, _, _, btype, _), counts in entries.items():
+                        types[btype or '(vide)'] += counts[0]
+        return types
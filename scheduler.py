@@ -0,0 +1,157 @@
+"""
+Planification adaptative du scraping : chaque joueur a son propre intervalle.
+
+Apres chaque battlelog recupere, on estime le rythme de jeu du joueur (parties
+par heure, moyenne glissante sur les BattleTime recents) :
+  - joueur actif  -> repasse des qu'il a joue ~FILL_TARGET parties (au plus
+    MIN_INTERVAL), bien avant que son battlelog de 25 parties ne deborde,
+  - joueur inactif -> intervalle double a chaque passage a vide, jusqu'a MAX_INTERVAL.
+Un budget global (BUDGET_PER_MIN requetes / minute) borne le cout API : si trop
+de joueurs sont dus, les plus en retard / les plus actifs passent d'abord.
+
+Les joueurs suivis qui jouent ensemble sont couverts par le battlelog de leur
+coequipier (voir ingest.teammates_stage) : un joueur couvert recemment est
+saute une fois si ce coequipier passe dans le meme tour, et un battlelog dont
+toutes les nouvelles parties etaient deja couvertes espace le suivant.
+"""
+import os
+import time
+import threading
+from collections import deque
+from battletime import parse_battle_time
+
+TICK_SECONDS = int(os.getenv('SCHED_TICK_SECONDS', '60'))         # frequence des passages auto
+MIN_INTERVAL = float(os.getenv('SCHED_MIN_MINUTES', '3')) * 60
+MAX_INTERVAL = float(os.getenv('SCHED_MAX_MINUTES', '240')) * 60
+DEFAULT_INTERVAL = 15 * 60   # joueur jamais vu : ancien rythme fixe
+BUDGET_PER_MIN = int(os.getenv('SCHED_BUDGET_PER_MIN', '30'))     # requetes battlelog / minute
+FILL_TARGET = 10        # parties nouvelles visees par passage (battlelog = 25)
+RATE_ALPHA = 0.5        # poids de la derniere mesure dans la moyenne glissante
+BATTLELOG_SIZE = 25
+COVER_WINDOW = float(os.getenv('SCHED_COVER_MINUTES', '60')) * 60   # duree de validite d'un lien coequipier
+
+
+def _normalize_tag(t):
+    return '#' + str(t).strip().lstrip('#').upper()
+
+
+class _PlayerState:
+    __slots__ = ('interval', 'next_due', 'rate', 'last_poll', 'partner', 'covered_at', 'deferred')
+
+    def __init__(self, now):
+        self.interval = DEFAULT_INTERVAL
+        self.next_due = now          # jamais vu -> du tout de suite
+        self.rate = 0.0              # parties / seconde
+        self.last_poll = None
+        self.partner = None          # dernier coequipier suivi dont le battlelog l'a couvert
+        self.covered_at = None
+        self.deferred = False        # deja saute au tour precedent
+
+
+class PollScheduler:
+    """Intervalle de polling par joueur + budget global de requetes (thread-safe)."""
+
+    def __init__(self, budget_per_min=BUDGET_PER_MIN):
+        self.budget_per_min = budget_per_min
+        self._players = {}
+        self._sent = deque()   # instants des requetes accordees sur la derniere minute
+        self._lock = threading.Lock()
+
+    def _state(self, tag, now):
+        key = _normalize_tag(tag)
+        st = self._players.get(key)
+        if st is None:
+            st = self._players[key] = _PlayerState(now)
+        return st
+
+    def due(self, players, now=None):
+        """
+        Joueurs a interroger maintenant, par priorite, dans la limite du budget.
+        Ils sont reprogrammes tout de suite (un 2e appel ne les rend pas). Un joueur
+        couvert recemment par un coequipier choisi dans ce tour est saute (une fois).
+        """
+        now = now or time.time()
+        with self._lock:
+            while self._sent and now - self._sent[0] >= 60:
+                self._sent.popleft()
+            budget = self.budget_per_min - len(self._sent)
+            ready = []
+            for tag in players:
+                st = self._state(tag, now)
+                if st.next_due <= now:
+                    # priorite : retard relatif, pondere par l'activite du joueur
+                    overdue = (now - st.next_due) / st.interval
+                    ready.append((overdue * (1 + st.rate * 3600), tag, st))
+            ready.sort(key=lambda x: x[0], reverse=True)
+            chosen, chosen_keys = [], set()
+            for _, tag, st in ready:
+                if len(chosen) >= budget:
+                    break
+                st.next_due = now + st.interval
+                if (not st.deferred and st.partner in chosen_keys
+                        and now - st.covered_at < COVER_WINDOW):
+                    st.deferred = True   # ses parties avec le coequipier arrivent par son battlelog
+                    continue
+                st.deferred = False
+                self._sent.append(now)
+                chosen.append(tag)
+                chosen_keys.add(_normalize_tag(tag))
+            return chosen
+
+    def observe(self, tag, battles, new_count, covered=0, now=None):
+        """
+        Met a jour le rythme du joueur apres un battlelog (`new_count` parties nouvelles,
+        dont `covered` deja ecrites via le battlelog d'un coequipier).
+        """
+        now = now or time.time()
+        with self._lock:
+            st = self._state(tag, now)
+            times = [t for t in (parse_battle_time(b.get('battleTime', '')) for b in battles) if t]
+            if st.last_poll is not None:
+                observed = new_count / max(now - st.last_poll, 1.0)
+            elif len(times) >= 2:
+                observed = (len(times) - 1) / max(times[0] - times[-1], 1.0)   # 1er passage : etendue du battlelog
+            else:
+                observed = 0.0
+            st.rate = RATE_ALPHA * observed + (1 - RATE_ALPHA) * st.rate
+            st.last_poll = now
+
+            if new_count >= min(len(battles), BATTLELOG_SIZE) and new_count:
+                st.interval = MIN_INTERVAL   # battlelog entierement nouveau : parties peut-etre manquees
+            elif new_count == 0:
+                st.interval = min(st.interval * 2, MAX_INTERVAL)
+            elif new_count == covered:
+                # joue, mais seulement avec des coequipiers suivis : on espace, sans laisser
+                # le battlelog deborder au rythme actuel
+                overflow = max(0.8 * BATTLELOG_SIZE / max(st.rate, 1e-9), MIN_INTERVAL)
+                st.interval = min(st.interval * 2, overflow, MAX_INTERVAL)
+            else:
+                st.interval = min(max(FILL_TARGET / max(st.rate, 1e-9), MIN_INTERVAL), MAX_INTERVAL)
+            st.next_due = now + st.interval
+
+    def observe_covered(self, tag, partner, now=None):
+        """`tag` a recu des parties via le battlelog de `partner` (ingest.run_ingest)."""
+        now = now or time.time()
+        with self._lock:
+            st = self._state(tag, now)
+            st.partner = _normalize_tag(partner)
+            st.covered_at = now
+
+    def reset(self):
+        """Tout le monde redevient du (apres !reset)."""
+        with self._lock:
+            self._players.clear()
+
+    def summary(self, now=None):
+        """(nb joueurs suivis, nb dus, intervalle min, intervalle max) en minutes."""
+        now = now or time.time()
+        with self._lock:
+            if not self._players:
+                return 0, 0, None, None
+            intervals = [st.interval / 60 for st in self._players.values()]
+            nb_due = sum(1 for st in self._players.values() if st.next_due <= now)
+            return len(self._players), nb_due, min(intervals), max(intervals)
+
+
+# Instance partagee (bot + threads de start.py dans le meme process)
+scheduler = PollScheduler()
@@ -0,0 +1,227 @@
+"""
+Acces Google Sheets sous quota : tout appel passe par sheets_call, qui
+  - compte les lectures / ecritures sur une fenetre glissante d'une minute et
+    attend juste ce qu'il faut quand le quota est atteint (au lieu d'un sleep fixe),
+  - rejoue les 429 / 5xx avec un backoff exponentiel a jitter, en respectant
+    l'en-tete Retry-After quand l'API en renvoie un. Les ecritures ne sont
+    rejouees que sur 429 : un append_rows en 5xx a pu etre applique quand meme,
+    le rejouer dupliquerait les lignes.
+
+SheetsWriter bufferise les lignes a ajouter et les ecrit par append_rows quand
+le lot est plein ou que FLUSH_INTERVAL est ecoule ; un backfill (apres !reset)
+part donc au debit maximal autorise par le quota, sans pause artificielle.
+"""
+import os
+import time
+import random
+import logging
+import threading
+from collections import deque
+from email.utils import parsedate_to_datetime
+from profiling import span
+from metrics import (registry, rate_limited, sheets_calls, sheets_call_seconds, sheets_quota_wait,
+                     sheets_quota_used, sheets_quota_limit)
+
+READ_QUOTA = int(os.getenv('SHEETS_READ_PER_MIN', '60'))     # quota Google par utilisateur
+WRITE_QUOTA = int(os.getenv('SHEETS_WRITE_PER_MIN', '60'))
+FLUSH_INTERVAL = float(os.getenv('SHEETS_FLUSH_SECONDS', '5'))
+BATCH_ROWS = 500
+MAX_RETRIES = 6
+BACKOFF_BASE = 1.0
+BACKOFF_CAP = 64.0
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+WRITE_RETRY_STATUSES = {429}   # requete refusee, donc non appliquee : seul cas rejouable sans risque
+
+
+class QuotaWindow:
+    """Nombre d'appels sur la derniere minute ; acquire() bloque si la limite est atteinte."""
+
+    def __init__(self, per_minute, window=60.0):
+        self.per_minute = per_minute
+        self.window = window
+        self._calls = deque()
+        self._lock = threading.Lock()
+
+    def _trim(self, now):
+        while self._calls and now - self._calls[0] >= self.window:
+            self._calls.popleft()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._trim(now)
+                if len(self._calls) < self.per_minute:
+                    self._calls.append(now)
+                    return
+                wait = self.window - (now - self._calls[0])
+            time.sleep(max(wait, 0.01))
+
+    def used(self):
+        with self._lock:
+            self._trim(time.monotonic())
+            return len(self._calls)
+
+
+quotas = {'read': QuotaWindow(READ_QUOTA), 'write': QuotaWindow(WRITE_QUOTA)}
+
+
+@registry.collector
+def _export_quotas():
+    for kind, quota in quotas.items():
+        sheets_quota_used.set(quota.used(), kind=kind)
+        sheets_quota_limit.set(quota.per_minute, kind=kind)
+
+
+def _status(exc):
+    """Code HTTP d'une erreur gspread / requests (None si inconnu)."""
+    resp = getattr(exc, 'response', None)
+    code = getattr(resp, 'status_code', None)
+    if code is None:
+        code = getattr(exc, 'code', None)
+    return code if isinstance(code, int) else None
+
+
+def parse_retry_after(value):
+    """En-tete Retry-After (secondes ou date HTTP) -> secondes d'attente, None si absent / illisible."""
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(str(value)).timestamp() - time.time())
+    except (TypeError, ValueError, IndexError, OverflowError):
+        return None
+
+
+def _retry_after(exc):
+    resp = getattr(exc, 'response', None)
+    headers = getattr(resp, 'headers', None) or {}
+    return parse_retry_after(headers.get('Retry-After'))
+
+
+def backoff_delay(attempt, retry_after=None):
+    """Full jitter : uniforme dans [0, min(cap, base * 2^attempt)], jamais sous Retry-After."""
+    delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+    return max(delay, retry_after or 0.0)
+
+
+def sheets_call(kind, func, *args, **kwargs):
+    """Appelle func sous quota `kind` ('read' | 'write'), avec reprise sur 429 / 5xx (429 seul en ecriture)."""
+    retry_statuses = WRITE_RETRY_STATUSES if kind == 'write' else RETRY_STATUSES
+    for attempt in range(MAX_RETRIES + 1):
+        waited = time.perf_counter()
+        quotas[kind].acquire()
+        start = time.perf_counter()
+        sheets_quota_wait.inc(start - waited, kind=kind)
+        sheets_calls.inc(kind=kind)
+        try:
+            with span('fetch' if kind == 'read' else 'write'):
+                return func(*args, **kwargs)
+        except Exception as e:
+            status = _status(e)
+            if status == 429:
+                rate_limited.inc(backend='sheets')
+            if status not in retry_statuses or attempt == MAX_RETRIES:
+                raise
+            delay = backoff_delay(attempt, _retry_after(e))
+            logging.warning(f"Sheets {kind} HTTP {status}, nouvel essai dans {delay:.1f}s ({attempt + 1}/{MAX_RETRIES})")
+        finally:
+            sheets_call_seconds.observe(time.perf_counter() - start, kind=kind)
+        time.sleep(delay)
+
+
+class SheetsWriter:
+    """
+    Tampon d'append_rows : flush par taille (BATCH_ROWS) ou par temps (flush_interval).
+    background=False : pas de thread d'ecriture, l'appelant flush() lui-meme et recoit
+    toutes les erreurs (un lot pris par le thread et perdu ne passerait pas inapercu).
+    """
+
+    def __init__(self, worksheet, batch_rows=BATCH_ROWS, flush_interval=FLUSH_INTERVAL, background=True):
+        self.worksheet = worksheet
+        self.background = background
+        self.batch_rows = batch_rows
+        self.flush_interval = flush_interval
+        self._buffer = []
+        self._in_flight = 0
+        self._written = 0
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()   # un seul flush a la fois -> ordre des lignes garanti
+        self._thread = None
+
+    def write(self, rows):
+        """Ajoute des lignes au tampon ; l'ecriture se fait en tache de fond (ou au flush())."""
+        if not rows:
+            return
+        with self._cond:
+            self._buffer.extend(rows)
+            if self.background and self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='sheets-writer', daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def flush(self):
+        """
+        Ecrit tout le tampon maintenant (synchrone). Un lot refuse (429) est remis dans
+        le tampon ; sur toute autre erreur son sort est inconnu et il est abandonne.
+        """
+        with self._flush_lock:
+            while True:
+                with self._cond:
+                    batch = self._buffer[:self.batch_rows]
+                    del self._buffer[:len(batch)]
+                    self._in_flight = len(batch)
+                if not batch:
+                    return
+                try:
+                    sheets_call('write', self.worksheet.append_rows, batch)
+                except Exception as e:
+                    if _status(e) in WRITE_RETRY_STATUSES:
+                        with self._cond:
+                            self._buffer[:0] = batch
+                    else:
+                        logging.error(f"Sheets writer: lot de {len(batch)} lignes abandonne "
+                                      f"(ecriture peut-etre appliquee, pas de nouvel essai): {e}")
+                    raise
+                finally:
+                    with self._cond:
+                        self._in_flight = 0
+                with self._cond:
+                    self._written += len(batch)
+
+    def discard(self):
+        """Oublie les lignes en attente (feuille videe par !reset)."""
+        with self._cond:
+            self._buffer.clear()
+
+    def queue_depth(self):
+        """Lignes en attente d'ecriture (tampon + lot en cours)."""
+        with self._cond:
+            return len(self._buffer) + self._in_flight
+
+    def stats(self):
+        return {'queued': self.queue_depth(), 'written': self._written,
+                'reads_last_min': quotas['read'].used(), 'writes_last_min': quotas['write'].used()}
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._buffer:
+                    self._cond.wait()
+                # on laisse le lot se remplir, au plus flush_interval apres la 1ere ligne
+                deadline = time.monotonic() + self.flush_interval
+                while self._buffer and len(self._buffer) < self.batch_rows:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                if not self._buffer:
+                    continue
+            try:
+                self.flush()
+            except Exception as e:
+                logging.error(f"Sheets writer: {self.queue_depth()} lignes en attente, echec d'ecriture: {e}")
+                time.sleep(self.flush_interval)
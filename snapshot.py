@@ -0,0 +1,79 @@
+"""
+Snapshot local de la copie memoire de Matches (MatchStore), pour un redemarrage rapide.
+
+Format : un .npz NumPy non compresse (colonnes brutes + vocabulaires + meta JSON).
+Au boot, le bot recharge le snapshot (simple copie de buffers, sans re-parsing)
+et sert les commandes tout de suite ; la feuille n'est relue que pour le delta
+(voir SheetsMatchRepository.warm_start). NumPy optionnel, importe au 1er snapshot : sans lui, pas de snapshot.
+Le marqueur de generation est incremente a chaque sauvegarde.
+"""
+import os
+import json
+import time
+import logging
+import threading
+from battletime import numpy_module, NUMPY_AVAILABLE   # NumPy importe au 1er snapshot lu / ecrit
+
+SNAPSHOT_PATH = os.getenv('SNAPSHOT_PATH', 'matches_snapshot.npz')   # '' = desactive
+SNAPSHOT_FORMAT = 2   # 2 : colonnes Allies / Enemies
+_VOCABS = ('columns', 'tags', 'times', 'strings')
+
+
+class Snapshot:
+    """Lecture / ecriture atomique du snapshot ; `generation` = nb de sauvegardes."""
+
+    def __init__(self, path=SNAPSHOT_PATH):
+        self.path = path
+        self.generation = 0
+        self.meta = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return bool(self.path) and NUMPY_AVAILABLE
+
+    def load_into(self, store):
+        """Charge le snapshot dans `store`. Retourne la meta, ou None si absent / invalide."""
+        if not self.enabled or not os.path.exists(self.path):
+            return None
+        np = numpy_module()
+        if np is None:
+            return None
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                meta = json.loads(str(data['meta']))
+                if meta.get('format') != SNAPSHOT_FORMAT:
+                    logging.info(f"Snapshot {self.path} ignore (format {meta.get('format')}).")
+                    return None
+                state = {name: data[name].tolist() for name in _VOCABS}
+                state.update({name: data[name].tobytes() for name in store._ARRAYS})
+            store.load_state(state)
+        except Exception as e:
+            logging.error(f"Snapshot {self.path} illisible, rechargement depuis la feuille: {e}")
+            return None
+        self.generation = meta.get('generation', 0)
+        self.meta = meta
+        return meta
+
+    def save(self, store):
+        """Ecrit l'etat du store (fichier temporaire + rename : jamais de snapshot a moitie ecrit)."""
+        np = numpy_module() if self.enabled else None
+        if np is None:
+            return
+        state = store.dump_state()
+        with self._lock:
+            self.generation += 1
+            meta = {'format': SNAPSHOT_FORMAT, 'generation': self.generation,
+                    'saved_at': time.time(), 'rows': len(state['tag'])}
+            arrays = {name: np.array(state[name], dtype=str) for name in _VOCABS}
+            arrays.update({name: np.frombuffer(state[name], dtype=state[name].typecode)
+                           if len(state[name]) else np.array([], dtype=state[name].typecode)
+                           for name in store._ARRAYS})
+            tmp = self.path + '.tmp'
+            try:
+                with open(tmp, 'wb') as f:
+                    np.savez(f, meta=np.array(json.dumps(meta)), **arrays)
+                os.replace(tmp, self.path)
+                self.meta = meta
+            except Exception as e:
+                logging.error(f"Snapshot: ecriture impossible ({self.path}): {e}")
@@ -0,0 +1,55 @@
+"""
+Ecriture synchrone du backend Sheets : un echec d'append_rows doit remonter a
+l'appelant sans que la memoire, les compteurs ni l'index n'avancent.
+"""
+import pytest
+
+from dedupe_index import DedupeIndex
+from match_store import MATCHES_HEADER
+from repository import SheetsMatchRepository
+
+
+class _HttpError(Exception):
+    def __init__(self, code):
+        super().__init__(f'HTTP {code}')
+        self.code = code
+
+
+class _FlakyWorksheet:
+    """Onglet en memoire dont le 1er append_rows echoue en 503."""
+
+    def __init__(self):
+        self.rows = [list(MATCHES_HEADER)]
+        self.failures = 1
+
+    def append_rows(self, values, **kwargs):
+        if self.failures:
+            self.failures -= 1
+            raise _HttpError(503)
+        self.rows.extend(list(map(str, v)) for v in values)
+
+
+def _rows(n):
+    return [[f'#P{i}', f'20260101T{i // 3600 % 24:02d}{i // 60 % 60:02d}{i % 60:02d}.000Z',
+             'gemGrab', 'Hard Rock Mine', 'SHELLY', 'victory', '0', 'friendly', 'COLT,BULL', 'A,B,C']
+            for i in range(n)]
+
+
+def test_append_failure_is_raised_and_nothing_advances():
+    ws = _FlakyWorksheet()
+    index = DedupeIndex('')
+    index.ensure_loaded(lambda: [])
+    repo = SheetsMatchRepository(ws, is_ladder=lambda m: False, index=index)
+
+    with pytest.raises(_HttpError):
+        repo.append(_rows(600))   # > 1 lot : ni le 1er ni le 2e ne doit partir en fond
+
+    assert repo.writer._thread is None   # aucun lot ne peut etre pris (et perdu) en fond
+    assert len(ws.rows) == 1
+    assert len(repo.store) == 0
+    assert len(index) == 0
+    assert repo.pending_writes() == 0
+
+    repo.append(_rows(600))   # reprise au scrape suivant : tout est ecrit
+    assert len(ws.rows) == 601
+    assert len(index) == 600
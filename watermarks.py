@@ -0,0 +1,154 @@
+"""
+High-water marks du scraping : pour chaque PlayerTag, le BattleTime le plus
+recent deja traite. Les battlelogs de l'API sont tries du plus recent au plus
+ancien, donc on s'arrete a la premiere partie deja connue -> plus besoin de
+relire toute la feuille Matches pour dedoublonner.
+
+Les parties d'un joueur deja ecrites grace au battlelog d'un coequipier suivi
+sont notees a part ("couvertes") : au prochain battlelog du joueur elles sont
+sautees sans faire avancer son mark plus vite que ce qu'il a vraiment lu (ses
+parties jouees sans le coequipier ne sont jamais perdues). Elles sont oubliees
+des que le mark les depasse.
+Persiste dans un petit fichier JSON (ecriture atomique).
+"""
+import os
+import json
+import logging
+import threading
+from battletime import parse_battle_time
+
+WATERMARK_FILE = os.getenv('WATERMARK_FILE', 'watermarks.json')
+MAX_COVERED = 50   # parties couvertes gardees par joueur (un battlelog en montre 25)
+
+
+def _normalize_tag(t):
+    return '#' + str(t).strip().lstrip('#').upper()
+
+
+class Watermarks:
+    """{tag normalise: BattleTime} partage par les scrapers (thread-safe)."""
+
+    def __init__(self, path=WATERMARK_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._marks = None
+        self._covered = {}   # tag -> {BattleTime: epoch} ecrits via un coequipier, apres le mark
+
+    def _load(self):
+        if self._marks is not None:
+            return
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                data = dict(json.load(f))
+        except FileNotFoundError:
+            data = {}
+        except (OSError, ValueError) as e:
+            logging.error(f"Watermarks illisibles ({self.path}), on repart de zero: {e}")
+            data = {}
+        if isinstance(data.get('marks'), dict):
+            self._marks = dict(data['marks'])
+            self._covered = {tag: {bt: parse_battle_time(bt) or 0.0 for bt in bts}
+                             for tag, bts in data.get('covered', {}).items()}
+        else:   # ancien format : {tag: BattleTime}
+            self._marks = data
+
+    def get(self, tag):
+        with self._lock:
+            self._load()
+            return self._marks.get(_normalize_tag(tag))
+
+    def missing(self, tags):
+        """Tags sans high-water mark (jamais vus, ou fichier perdu)."""
+        with self._lock:
+            self._load()
+            return [t for t in tags if _normalize_tag(t) not in self._marks]
+
+    def seed(self, marks):
+        """Amorce les marks absents depuis {tag: BattleTime} (ex. MatchStore.latest_battle_times)."""
+        with self._lock:
+            self._load()
+            for tag, bt in marks.items():
+                self._marks.setdefault(_normalize_tag(tag), bt)
+
+    def new_battles(self, tag, battles):
+        """Parties de `battles` (plus recente en tete) posterieures au mark ; s'arrete a la 1ere connue."""
+        mark = self.get(tag)
+        mark_epoch = parse_battle_time(mark) if mark else None
+        for battle in battles:
+            if mark_epoch is not None:
+                t = parse_battle_time(battle.get('battleTime', ''))
+                if t is not None and t <= mark_epoch:
+                    break
+            yield battle
+
+    def advance(self, tag, bt):
+        """Avance le mark de `tag` jusqu'a `bt` (jamais en arriere)."""
+        t = parse_battle_time(bt)
+        if t is None:
+            return
+        key = _normalize_tag(tag)
+        with self._lock:
+            self._load()
+            cur = self._marks.get(key)
+            if cur is None or (parse_battle_time(cur) or 0.0) < t:
+                self._marks[key] = bt
+                covered = self._covered.get(key)
+                if covered:
+                    for old in [b for b, e in covered.items() if e <= t]:
+                        del covered[old]
+
+    def is_known(self, tag, bt):
+        """True si la partie `bt` de `tag` est deja ecrite (avant son mark, ou couverte)."""
+        t = parse_battle_time(bt)
+        key = _normalize_tag(tag)
+        with self._lock:
+            self._load()
+            mark = self._marks.get(key)
+            if mark and t is not None and t <= (parse_battle_time(mark) or 0.0):
+                return True
+            return bt in self._covered.get(key, ())
+
+    def covered(self, tag):
+        """BattleTime de `tag` deja ecrits via le battlelog d'un coequipier."""
+        with self._lock:
+            self._load()
+            return frozenset(self._covered.get(_normalize_tag(tag), ()))
+
+    def cover(self, tag, battle_times):
+        """Note des parties de `tag` ecrites via un coequipier (celles deja sous le mark sont ignorees)."""
+        key = _normalize_tag(tag)
+        with self._lock:
+            self._load()
+            mark = self._marks.get(key)
+            floor = (parse_battle_time(mark) or 0.0) if mark else None
+            covered = self._covered.setdefault(key, {})
+            for bt in battle_times:
+                t = parse_battle_time(bt) or 0.0
+                if floor is None or t > floor:
+                    covered[bt] = t
+            if len(covered) > MAX_COVERED:
+                for old in sorted(covered, key=covered.get)[:len(covered) - MAX_COVERED]:
+                    del covered[old]
+
+    def clear(self):
+        """Oublie tous les marks (apres un !reset de la feuille)."""
+        with self._lock:
+            self._marks = {}
+            self._covered = {}
+
+    def save(self):
+        with self._lock:
+            if self._marks is None:
+                return
+            tmp = self.path + '.tmp'
+            try:
+                covered = {tag: sorted(bts, key=bts.get) for tag, bts in self._covered.items() if bts}
+                with open(tmp, 'w', encoding='utf-8') as f:
+                    json.dump({'marks': self._marks, 'covered': covered}, f, indent=0, sort_keys=True)
+                os.replace(tmp, self.path)
+            except OSError as e:
+                logging.error(f"Impossible d'ecrire {self.path}: {e}")
+
+
+# Instance partagee (bot + threads de start.py dans le meme process)
+watermarks = Watermarks()